@@ -1,6 +1,9 @@
 from django.views.generic import TemplateView, ListView, DetailView
 from django.utils import timezone
 from rental.models import Invoice,RentalAgreement,Payment,RentalItem
+from rental.exports import ExportMixin
+from rental.pagination import KeysetPaginationMixin
+from rental.reports import revenue_report_context
 from django.db.models import Sum, Count
 from django.db.models.functions import TruncMonth, TruncQuarter, TruncYear, ExtractWeek, ExtractYear
 from datetime import datetime, timedelta
@@ -115,21 +118,16 @@ class FinancialDashboardView(TemplateView):
 
     def get_revenue_chart_data(self):
         today = timezone.now().date()
-        months = []
-        revenue = []
-        
-        for i in range(6, -1, -1):  # Last 6 months + current month
-            month_date = today - timedelta(days=30*i)
-            month_name = month_date.strftime('%b %Y')
-            months.append(month_name)
-            
-            monthly_total = Invoice.objects.filter(
-                issue_date__year=month_date.year,
-                issue_date__month=month_date.month
-            ).aggregate(total=Sum('total_amount'))['total'] or 0
-            
-            revenue.append(float(monthly_total))
-        
+        # Last 6 months + current month of invoiced totals, in one grouped query
+        first = (today - relativedelta(months=6)).replace(day=1)
+        totals = dict(
+            Invoice.objects.filter(issue_date__gte=first).annotate(
+                month=TruncMonth('issue_date')
+            ).values('month').annotate(total=Sum('total_amount')).order_by().values_list('month', 'total')
+        )
+        starts = [first + relativedelta(months=i) for i in range(7)]
+        months = [start.strftime('%b %Y') for start in starts]
+        revenue = [float(totals.get(start) or 0) for start in starts]
         return months, revenue
 
 
@@ -141,23 +139,8 @@ class RevenueReportView(LoginRequiredMixin, TemplateView):
         period = self.request.GET.get('period', 'monthly')
         start_date, end_date = self._get_date_range()
 
-        # Get payment data grouped by period
-        payments = Payment.objects.filter(
-            payment_date__gte=start_date,
-            payment_date__lte=end_date
-        )
-        
-        report_data = self._group_payments(payments, period)
-        totals = self._calculate_totals(report_data)
-
-        context.update({
-            'period': period,
-            'start_date': start_date,
-            'end_date': end_date,
-            'report_data': report_data,
-            'totals': totals,
-            'chart_data': self._prepare_chart_data(report_data)
-        })
+        # Payment totals grouped by period in a single query
+        context.update(revenue_report_context(start_date, end_date, period))
         return context
 
     def _get_date_range(self):
@@ -177,77 +160,24 @@ class RevenueReportView(LoginRequiredMixin, TemplateView):
             
         return start_date, end_date
 
-    def _group_payments(self, payments, period):
-        if period == 'daily':
-            return payments.annotate(
-                period=TruncDay('payment_date')
-            ).values('period').annotate(
-                total=Sum('amount')
-            ).order_by('period')
-        
-        elif period == 'weekly':
-            return payments.annotate(
-                week=ExtractWeek('payment_date'),
-                year=ExtractYear('payment_date')
-            ).values('year', 'week').annotate(
-                total=Sum('amount')
-            ).order_by('year', 'week')
-        
-        elif period == 'monthly':
-            return payments.annotate(
-                period=TruncMonth('payment_date')
-            ).values('period').annotate(
-                total=Sum('amount')
-            ).order_by('period')
-        
-        elif period == 'quarterly':
-            return payments.annotate(
-                period=TruncQuarter('payment_date')
-            ).values('period').annotate(
-                total=Sum('amount')
-            ).order_by('period')
-        
-        else:  # yearly
-            return payments.annotate(
-                period=TruncYear('payment_date')
-            ).values('period').annotate(
-                total=Sum('amount')
-            ).order_by('period')
-
-    def _calculate_totals(self, report_data):
-        total = sum(item['total'] for item in report_data)
-        return {
-            'total': total,
-            'avg_daily': total / len(report_data) if report_data else 0
-        }
-
-    def _prepare_chart_data(self, report_data):
-        return {
-            'labels': [self._format_period(item, self.request.GET.get('period')) for item in report_data],
-            'data': [float(item['total']) for item in report_data]
-        }
-
-    def _format_period(self, item, period_type):
-        date_obj = item.get('period') or datetime(item['year'], 1, 1)
-        
-        if period_type == 'daily':
-            return date_obj.strftime('%b %d')
-        elif period_type == 'weekly':
-            return f"Week {item['week']}, {item['year']}"
-        elif period_type == 'monthly':
-            return date_obj.strftime('%b %Y')
-        elif period_type == 'quarterly':
-            quarter = (date_obj.month - 1) // 3 + 1
-            return f"Q{quarter} {date_obj.year}"
-        else:
-            return date_obj.strftime('%Y')
-
 
-class InvoiceListView(ListView):
+class InvoiceListView(LoginRequiredMixin, ExportMixin, KeysetPaginationMixin, ListView):
     model = Invoice
     template_name = 'accounts/invoice_list.html'
     context_object_name = 'invoices'
     paginate_by = 20
+    keyset_ordering = ('-issue_date', '-pk')
+    approximate_count_limit = 1000
+    export_columns = (
+        ('Invoice', 'invoice_number'),
+        ('Customer', 'rental_agreement__customer__name'),
+        ('Agreement', 'rental_agreement_id'),
+        ('Issue date', 'issue_date'),
+        ('Due date', 'due_date'),
+        ('Total', 'total_amount'),
+        ('Paid', 'paid_amount'),
+        ('Status', 'payment_status'),
+    )
 
     def get_queryset(self):
         queryset = super().get_queryset()
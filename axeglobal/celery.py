@@ -1,6 +1,10 @@
+import os
+
 from celery import Celery
 from celery.schedules import crontab
 
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'axeglobal.settings')
+
 app = Celery('axeglobal')
 app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
@@ -10,8 +14,12 @@ app.conf.beat_schedule = {
         'task': 'rental.tasks.send_rental_reminders',
         'schedule': crontab(hour=8, minute=0),  # Daily at 8 AM
     },
+    'retry-failed-notifications': {
+        'task': 'rental.tasks.drain_notification_outbox',
+        'schedule': crontab(minute='*/15', hour='8-20'),  # Retry failed reminders through the day
+    },
     'update-overdue-rentals': {
-        'task': 'rental.management.commands.update_overdue',
+        'task': 'rental.tasks.mark_overdue',
         'schedule': crontab(hour=0, minute=0),  # Daily at midnight
     },
 }
\ No newline at end of file
@@ -52,13 +52,15 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'rental.middleware.RequestMetricsMiddleware',
 ]
 
 ROOT_URLCONF = 'axeglobal.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates, timing renders for the request metrics (rental/middleware.py)
+        'BACKEND': 'rental.middleware.MeasuredDjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -114,6 +116,48 @@ LOGIN_REDIRECT_URL = 'dashboard'
 LOGOUT_REDIRECT_URL = 'dashboard'
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
 CELERY_TIMEZONE = 'UTC'
+
+# Seconds a dashboard statistics snapshot stays cached (writes invalidate it sooner)
+DASHBOARD_STATS_TTL = 60
+
+# Rendered barcode images, see rental/barcodes.py
+BARCODE_CACHE_DIR = BASE_DIR / 'barcode_cache'
+
+# Rendered agreement/invoice PDFs, see rental/pdf_cache.py
+PDF_CACHE_DIR = BASE_DIR / 'pdf_cache'
+# Re-render PDFs through Celery after each change instead of on the next download
+# (CELERY_TASK_ALWAYS_EAGER = True runs the task inline, e.g. in tests)
+PDF_BACKGROUND_RENDER = False
+# Processes rendering a batch invoice export (None: one per CPU)
+INVOICE_EXPORT_WORKERS = None
+# Outbox rows per reminder e-mail task; each batch is sent over one mail connection
+REMINDER_BATCH_SIZE = 100
+# Agreements updated per statement by the overdue sweep, see rental/overdue.py
+OVERDUE_SWEEP_BATCH_SIZE = 500
+# Seconds before a worker rebuilds its in-memory autocomplete index, see rental/fuzzy.py
+# (saves in the same process update it immediately)
+FUZZY_INDEX_MAX_AGE = 300
+
+# Per-request query/latency metrics, see rental/middleware.py
+REQUEST_METRICS_ENABLED = True
+# Recent requests per URL name kept for the p50/p95 figures
+REQUEST_METRICS_WINDOW = 500
+# Most queries each view may run, by URL name; exceeding it logs a warning
+# (or raises QueryBudgetExceeded with QUERY_BUDGET_STRICT, as the tests do)
+VIEW_QUERY_BUDGETS = {
+    'dashboard': 10,
+    'product_list': 5,
+    'customer_list': 5,
+    'customer_detail': 8,
+    'rental_list': 5,
+    'rental_detail': 10,
+    'expense_list': 7,
+    'invoice_list': 5,
+    'customer_activity_report': 4,
+}
+QUERY_BUDGET_STRICT = False
+# Seconds a {% cachefragment %} entry is kept; keys change on edits, so this only bounds memory
+FRAGMENT_CACHE_TTL = 60 * 60
 # Custom permissions
 PERMISSIONS = {
     'STAFF': [
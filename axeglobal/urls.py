@@ -14,6 +14,7 @@ urlpatterns = [
     path('products/<int:pk>/', rental_views.ProductDetailView.as_view(), name='product_detail'),
     path('products/<int:pk>/update/', rental_views.ProductUpdateView.as_view(), name='product_update'),
     path('products/import/', rental_views.ProductImportView.as_view(), name='product_import'),
+    path('products/import/<str:job_id>/', rental_views.ProductImportStatusView.as_view(), name='product_import_status'),
     path('products/<int:pk>/stock/', rental_views.ProductStockView.as_view(), name='product_stock'),
     # Customer URLs
     path('customers/', rental_views.CustomerListView.as_view(), name='customer_list'),
@@ -24,6 +25,8 @@ urlpatterns = [
     
     path('api/customers/<int:pk>/', rental_views.customer_detail_api, name='customer_api'),
     path('api/products/<int:pk>/', rental_views.product_detail_api, name='product_api'),
+    path('api/lookup/<str:kind>/', rental_views.lookup_api, name='lookup_api'),
+    path('api/metrics/requests/', rental_views.request_metrics, name='request_metrics'),
     # Rental URLs
     path('rentals/', rental_views.RentalListView.as_view(), name='rental_list'),
     path('rentals/create/', rental_views.CreateRentalAgreementView.as_view(), name='rental_create'),
@@ -31,6 +34,7 @@ urlpatterns = [
     path('rentals/<int:pk>/return/', rental_views.ReturnRentalView.as_view(), name='rental_return'),
     path('rentals/<int:pk>/invoice/', rental_views.generate_invoice_pdf, name='rental_invoice_pdf'),
     path('rentals/<int:pk>/agreement/', rental_views.generate_agreement_pdf, name='rental_agreement_pdf'),
+    path('customers/<int:pk>/statement/', rental_views.customer_statement_pdf, name='customer_statement_pdf'),
     path('rentals/<int:rental_id>/return/', rental_views.process_rental_return, name='rental_return'),
     path('reports/monthly-revenue/', rental_views.MonthlyRevenueDetailView.as_view(), name='monthly_revenue_detail'),
     path('rental/<int:pk>/delete/', rental_views.RentalDeleteView.as_view(), name='rental_delete'),
@@ -40,6 +44,7 @@ urlpatterns = [
     path('rentals/<int:pk>/update/', rental_views.UpdateRentalAgreementView.as_view(), name='rental_update'),
     path('rentals/<int:pk>/calculate-amount/', rental_views.CalculateReturnAmountView.as_view(), name='calculate_return_amount'),
     path('invoice/<int:invoice_id>/pdf/', rental_views.invoice_pdf_view, name='invoice_pdf'),
+    path('invoices/export/', rental_views.invoice_export_zip, name='invoice_export'),
     path('invoices/<int:pk>/', accounts_views.InvoiceDetailView.as_view(), name='invoice_detail'),
     path('reports/revenue/', rental_views.RevenueReportView.as_view(), name='revenue_report'),
 
@@ -59,6 +64,7 @@ urlpatterns = [
     # Expense Report URL
     path('expenses/report/', rental_views.ExpenseReportView.as_view(), name='expense_report'),
     path('payments/create/', rental_views.PaymentCreateView.as_view(), name='payment_create'),
+    path('payments/<int:pk>/receipt/', rental_views.payment_receipt_pdf, name='payment_receipt_pdf'),
     # Accounting URLs
     path('financials/', accounts_views.FinancialDashboardView.as_view(), name='financial_dashboard'),
     path('financials/reports/', accounts_views.RevenueReportView.as_view(), name='revenue_report'),
@@ -77,4 +83,5 @@ urlpatterns = [
     # Barcode URLs
     path('barcode/generate/', rental_views.generate_barcodes, name='generate_barcodes'),
     path('barcode/scan/', rental_views.BarcodeScanView.as_view(), name='barcode_scan'),
+    path('barcode/<str:sku>.<str:fmt>', rental_views.product_barcode, name='product_barcode'),
 ]
\ No newline at end of file
@@ -0,0 +1,97 @@
+"""Product barcode images, rendered on first request and cached on disk.
+
+Files live under ``settings.BARCODE_CACHE_DIR`` keyed by symbology and a
+hash of the SKU, so the same image is never rendered twice. SVG output is
+plain text assembly and much cheaper than rasterising a PNG through PIL.
+"""
+import hashlib
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from pathlib import Path
+
+import barcode
+from barcode.errors import BarcodeError
+from barcode.writer import ImageWriter, SVGWriter
+from django.conf import settings
+
+DEFAULT_SYMBOLOGY = 'code128'
+SYMBOLOGIES = ('code128', 'code39', 'ean13', 'ean8', 'upca', 'isbn13')
+FORMATS = {
+    'svg': ('image/svg+xml', SVGWriter),
+    'png': ('image/png', ImageWriter),
+}
+
+
+class InvalidBarcode(ValueError):
+    """The SKU can't be encoded in the requested symbology or format"""
+
+
+def cache_root():
+    return Path(settings.BARCODE_CACHE_DIR)
+
+
+def cache_path(sku, symbology=DEFAULT_SYMBOLOGY, fmt='svg', root=None):
+    digest = hashlib.sha1(sku.encode('utf-8')).hexdigest()
+    return Path(root or cache_root()) / symbology / digest[:2] / f'{digest}.{fmt}'
+
+
+def render(sku, symbology=DEFAULT_SYMBOLOGY, fmt='svg'):
+    """Barcode image bytes for ``sku``"""
+    if symbology not in SYMBOLOGIES or fmt not in FORMATS:
+        raise InvalidBarcode(f"Unsupported barcode {symbology}/{fmt}")
+    writer = FORMATS[fmt][1]
+    try:
+        code = barcode.get_barcode_class(symbology)(sku, writer=writer())
+    except (BarcodeError, ValueError) as e:
+        raise InvalidBarcode(str(e))
+    buffer = BytesIO()
+    code.write(buffer)
+    return buffer.getvalue()
+
+
+def get_or_render(sku, symbology=DEFAULT_SYMBOLOGY, fmt='svg', root=None, force=False):
+    """Path of the cached image, rendering it first if needed"""
+    path = cache_path(sku, symbology, fmt, root)
+    if force or not path.exists():
+        data = render(sku, symbology, fmt)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write then rename so concurrent requests never serve a partial file
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    return path
+
+
+def _warm(args):
+    sku, symbology, fmt, root, force = args
+    try:
+        get_or_render(sku, symbology, fmt, root, force)
+    except InvalidBarcode as e:
+        return sku, str(e)
+    return sku, None
+
+
+def warm(skus, symbology=DEFAULT_SYMBOLOGY, formats=('svg',), workers=None, force=False):
+    """Render every missing image in a process pool; returns ``(rendered, failures)``.
+
+    ``failures`` is a list of ``(sku, error)`` pairs.
+    """
+    root = str(cache_root())
+    jobs = [
+        (sku, symbology, fmt, root, force)
+        for sku in skus for fmt in formats
+        if force or not cache_path(sku, symbology, fmt, root).exists()
+    ]
+    if not jobs:
+        return 0, []
+    if workers == 1 or len(jobs) < 64:
+        # Not worth starting a pool for a handful of images
+        results = map(_warm, jobs)
+        failures = [(sku, error) for sku, error in results if error]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            failures = [(sku, error) for sku, error in pool.map(_warm, jobs, chunksize=64) if error]
+    return len(jobs) - len(failures), failures
@@ -0,0 +1,316 @@
+"""PDF documents for agreements, invoices, payment receipts and customer statements.
+
+Every reportlab document is a declarative ``Layout``: a title plus a list
+of sections, each turning the document context into flowables. Paragraph
+and table styles are built once per process and shared, and all money
+figures come from the totals the models already maintain, so the
+documents can't disagree with each other or with the screens.
+
+Builders return PDF bytes; serving and caching them is handled by
+rental/pdf_cache.py.
+"""
+import os
+from functools import lru_cache
+from io import BytesIO
+
+from django.conf import settings
+from django.db.models import Sum
+from django.template.loader import get_template
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+from xhtml2pdf import pisa
+
+from .models import VAT_RATE, Payment
+
+COMPANY_NAME = 'AxeGlobal'
+
+AGREEMENT_TERMS = [
+    "1. The equipment must be returned in the same condition as when rented.",
+    "2. Any damage to equipment will result in additional charges.",
+    "3. Late returns will incur additional daily rental fees.",
+    "4. The renter is responsible for equipment loss or theft.",
+    "5. Payment is due upon equipment return.",
+]
+
+
+@lru_cache(maxsize=None)
+def styles():
+    """The sample stylesheet plus the document styles, built once per process"""
+    sheet = getSampleStyleSheet()
+    sheet.add(ParagraphStyle(name='DocTitle', parent=sheet['Title'], fontSize=18, alignment=TA_CENTER, spaceAfter=12))
+    sheet.add(ParagraphStyle(name='Section', parent=sheet['Heading3'], spaceBefore=6, spaceAfter=6))
+    sheet.add(ParagraphStyle(name='Notes', parent=sheet['Normal'], leading=14))
+    return sheet
+
+
+# Table styles are read-only once built, so every document shares them
+GRID_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+])
+DETAILS_STYLE = TableStyle([
+    ('FONT', (0, 0), (-1, -1), 'Helvetica', 10),
+    ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
+])
+SUMMARY_STYLE = TableStyle([
+    ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
+    ('FONT', (0, 0), (-1, -1), 'Helvetica', 11),
+    ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+    ('LINEABOVE', (0, -1), (-1, -1), 1, colors.black),
+])
+SIGNATURE_STYLE = TableStyle([
+    ('FONT', (0, 0), (-1, -1), 'Helvetica', 10),
+    ('LINEABOVE', (0, 1), (0, 1), 1, colors.black),
+    ('LINEABOVE', (2, 1), (2, 1), 1, colors.black),
+])
+
+
+def money(value):
+    return f"${value or 0:.2f}"
+
+
+def day(value):
+    return value.strftime('%Y-%m-%d') if value else 'N/A'
+
+
+def agreement_totals(rental):
+    """Summary rows for an agreement, straight from its maintained totals"""
+    rows = [
+        ("Subtotal:", money(rental.subtotal)),
+        (f"Discount ({rental.discount}%):", f"-{money(rental.subtotal * rental.discount / 100)}"),
+    ]
+    if rental.apply_vat:
+        rows.append((f"VAT ({VAT_RATE * 100:.0f}%):", money(rental.vat)))
+    rows += [
+        ("Total:", money(rental.total)),
+        ("Paid:", money(rental.paid_amount)),
+        ("Balance Due:", money(rental.balance_due)),
+    ]
+    return rows
+
+
+# Sections: each is called with the document context and returns flowables
+
+class Details:
+    def __init__(self, *rows):
+        self.rows = rows
+
+    def __call__(self, context):
+        data = [[label, str(value(context))] for label, value in self.rows]
+        table = Table(data, colWidths=[140, 320], hAlign='LEFT')
+        table.setStyle(DETAILS_STYLE)
+        return [table, Spacer(1, 18)]
+
+
+class Grid:
+    """A header row plus one row per record from ``records(context)``"""
+
+    def __init__(self, heading, columns, records, empty="None"):
+        self.heading = heading
+        self.columns = columns
+        self.records = records
+        self.empty = empty
+
+    def __call__(self, context):
+        flowables = [Paragraph(self.heading, styles()['Section'])]
+        records = list(self.records(context))
+        if not records:
+            return flowables + [Paragraph(self.empty, styles()['Normal']), Spacer(1, 12)]
+        data = [[label for label, _ in self.columns]]
+        data += [[str(value(record)) for _, value in self.columns] for record in records]
+        table = Table(data, repeatRows=1, hAlign='LEFT')
+        table.setStyle(GRID_STYLE)
+        return flowables + [table, Spacer(1, 12)]
+
+
+class Summary:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __call__(self, context):
+        table = Table(self.rows(context), colWidths=[200, 120], hAlign='RIGHT')
+        table.setStyle(SUMMARY_STYLE)
+        return [table, Spacer(1, 18)]
+
+
+class Text:
+    def __init__(self, heading, lines, style='Normal'):
+        self.heading = heading
+        self.lines = lines
+        self.style = style
+
+    def __call__(self, context):
+        lines = self.lines(context) if callable(self.lines) else self.lines
+        if not lines:
+            return []
+        body = [Paragraph(line, styles()[self.style]) for line in lines]
+        return [Paragraph(self.heading, styles()['Section']), *body, Spacer(1, 18)]
+
+
+class Signatures:
+    def __call__(self, context):
+        table = Table(
+            [['', '', ''], ['Customer Signature', '', f'{COMPANY_NAME} Representative']],
+            colWidths=[200, 60, 200]
+        )
+        table.setStyle(SIGNATURE_STYLE)
+        return [Spacer(1, 24), table]
+
+
+class Layout:
+    def __init__(self, title, *sections):
+        self.title = title
+        self.sections = sections
+
+    def build(self, context):
+        buffer = BytesIO()
+        doc = SimpleDocTemplate(buffer, pagesize=letter, title=self.title(context))
+        elements = [Paragraph(self.title(context), styles()['DocTitle']), Spacer(1, 12)]
+        for section in self.sections:
+            elements.extend(section(context))
+        doc.build(elements)
+        return buffer.getvalue()
+
+
+ITEM_COLUMNS = [
+    ('Product', lambda item: item.product.name),
+    ('Qty', lambda item: item.quantity),
+    ('Daily Price', lambda item: money(item.rental_price)),
+    ('Days', lambda item: item.rental.rental_days),
+    ('Total', lambda item: money(item.total_price)),
+]
+PAYMENT_COLUMNS = [
+    ('Date', lambda payment: day(payment.payment_date)),
+    ('Receipt', lambda payment: payment.receipt_number or ''),
+    ('Method', lambda payment: payment.get_payment_method_display()),
+    ('Amount', lambda payment: money(payment.amount)),
+]
+
+# pdf_cache keys the cached agreement and invoice by pdf_cache.state(): every
+# field those layouts (and the letterhead template) print has to be in it
+LAYOUTS = {
+    'agreement': Layout(
+        lambda c: f"Rental Agreement #{c['rental'].id}",
+        Details(
+            ("Customer:", lambda c: c['rental'].customer.name),
+            ("Company:", lambda c: c['rental'].customer.company or 'N/A'),
+            ("Phone:", lambda c: c['rental'].customer.phone),
+            ("Start Date:", lambda c: day(c['rental'].start_date)),
+            ("Expected Return:", lambda c: day(c['rental'].expected_return_date)),
+            ("Status:", lambda c: c['rental'].get_status_display()),
+        ),
+        Grid("Rented Equipment", ITEM_COLUMNS, lambda c: c['rental'].items.all()),
+        Summary(lambda c: agreement_totals(c['rental'])),
+        Text("Notes", lambda c: [c['rental'].notes] if c['rental'].notes else [], style='Notes'),
+        Text("Terms and Conditions", AGREEMENT_TERMS),
+        Signatures(),
+    ),
+    'invoice': Layout(
+        lambda c: f"Invoice {c['invoice'].invoice_number}",
+        Details(
+            ("Rental Agreement:", lambda c: f"#{c['rental'].id}"),
+            ("Customer:", lambda c: c['rental'].customer.name),
+            ("Issue Date:", lambda c: day(c['invoice'].issue_date)),
+            ("Due Date:", lambda c: day(c['invoice'].due_date)),
+            ("Status:", lambda c: c['invoice'].get_payment_status_display()),
+        ),
+        Grid("Items", ITEM_COLUMNS, lambda c: c['rental'].items.all()),
+        Summary(lambda c: agreement_totals(c['rental'])),
+        Grid("Payments", PAYMENT_COLUMNS, lambda c: c['rental'].payments.all(), empty="No payments received."),
+    ),
+    'receipt': Layout(
+        lambda c: f"Payment Receipt {c['payment'].receipt_number or c['payment'].pk}",
+        Details(
+            ("Customer:", lambda c: c['rental'].customer.name),
+            ("Rental Agreement:", lambda c: f"#{c['rental'].id}"),
+            ("Payment Date:", lambda c: day(c['payment'].payment_date)),
+            ("Method:", lambda c: c['payment'].get_payment_method_display()),
+        ),
+        Summary(lambda c: [
+            ("Agreement Total:", money(c['rental'].total)),
+            ("Paid to Date:", money(c['rental'].paid_amount)),
+            ("Balance Due:", money(c['rental'].balance_due)),
+            ("Amount Received:", money(c['payment'].amount)),
+        ]),
+        Text("Notes", lambda c: [c['payment'].notes] if c['payment'].notes else [], style='Notes'),
+    ),
+    'statement': Layout(
+        lambda c: f"Account Statement: {c['customer'].name}",
+        Details(
+            ("Customer:", lambda c: c['customer'].name),
+            ("Company:", lambda c: c['customer'].company or 'N/A'),
+            ("Phone:", lambda c: c['customer'].phone),
+            ("Statement Date:", lambda c: day(c['date'])),
+        ),
+        Grid("Rental Agreements", [
+            ('Agreement', lambda rental: f"#{rental.id}"),
+            ('Start', lambda rental: day(rental.start_date)),
+            ('Status', lambda rental: rental.get_status_display()),
+            ('Total', lambda rental: money(rental.total)),
+            ('Paid', lambda rental: money(rental.paid_amount)),
+            ('Balance', lambda rental: money(rental.balance_due)),
+        ], lambda c: c['rentals']),
+        Grid("Payments", PAYMENT_COLUMNS, lambda c: c['payments'], empty="No payments received."),
+        Summary(lambda c: [
+            ("Total Charged:", money(c['totals']['total'])),
+            ("Total Paid:", money(c['totals']['paid'])),
+            ("Balance Due:", money(c['totals']['balance'])),
+        ]),
+    ),
+}
+
+
+def render(kind, context):
+    """PDF bytes for one of the LAYOUTS"""
+    return LAYOUTS[kind].build(context)
+
+
+def agreement_pdf(rental):
+    return render('agreement', {'rental': rental})
+
+
+def invoice_pdf(rental, invoice):
+    return render('invoice', {'rental': rental, 'invoice': invoice})
+
+
+def receipt_pdf(payment):
+    return render('receipt', {'payment': payment, 'rental': payment.rental_agreement})
+
+
+def statement_pdf(customer, date):
+    rentals = list(customer.rentals.order_by('start_date', 'pk'))
+    payments = list(Payment.objects.filter(rental_agreement__customer=customer).order_by('payment_date', 'pk'))
+    totals = customer.rentals.aggregate(total=Sum('total'), paid=Sum('paid_amount'), balance=Sum('balance_due'))
+    return render('statement', {
+        'customer': customer, 'date': date, 'rentals': rentals, 'payments': payments, 'totals': totals,
+    })
+
+
+def render_to_pdf(template_src, context_dict={}):
+    template = get_template(template_src)
+    html = template.render(context_dict)
+    result = BytesIO()
+    pdf = pisa.pisaDocument(BytesIO(html.encode("UTF-8")), result)
+    if not pdf.err:
+        return result.getvalue()
+    return None
+
+
+def letterpad_pdf(invoice):
+    """The letterhead invoice (xhtml2pdf), as PDF bytes or None if rendering failed"""
+    company_logo_path = os.path.join(settings.BASE_DIR, 'static', 'images', 'company_logo.png')
+    context = {
+        'invoice': invoice,
+        'company_logo_path': company_logo_path,
+    }
+    return render_to_pdf('invoice/invoice_letterpad.html', context)
@@ -0,0 +1,173 @@
+"""CSV and Excel downloads of list and report views.
+
+Adding ``ExportMixin`` to a view and listing its ``export_columns`` makes
+``?export=csv`` or ``?export=xlsx`` download every row of the view's
+queryset, with the filters in the rest of the query string applied just as
+on the page (pagination is ignored). Rows are read with
+``values_list().iterator()``, one chunk at a time:
+
+* CSV is streamed to the client as it is written;
+* XLSX is written by openpyxl in write-only mode, which keeps rows on disk
+  rather than in memory, to a temporary file that is then sent.
+
+Either way memory stays flat however many rows match. Choice fields are
+exported as their labels, and text that a spreadsheet would run as a
+formula is escaped.
+"""
+import csv
+import io
+import tempfile
+from decimal import Decimal
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import DateTimeField, DecimalField
+from django.db.models.constants import LOOKUP_SEP
+from django.http import FileResponse, Http404, StreamingHttpResponse
+from django.utils import timezone
+from openpyxl import Workbook
+
+from .pagination import CURSOR_PARAM
+
+EXPORT_PARAM = 'export'
+EXPORT_FORMATS = ('csv', 'xlsx')
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+# Rows read from the database per round trip, and CSV rows sent per chunk
+CHUNK_SIZE = 2000
+# Text starting with one of these is run as a formula when a CSV file is opened in Excel or
+# LibreOffice; in a workbook only '=' is, as openpyxl stores such strings as formulas
+CSV_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+XLSX_FORMULA_PREFIXES = ('=',)
+
+
+def resolve_field(model, lookup):
+    """The model field ``lookup`` ('customer__name') ends on, or None for an annotation"""
+    field = None
+    for name in lookup.split(LOOKUP_SEP):
+        if field is not None:
+            if not field.is_relation:
+                return None
+            model = field.related_model
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+    return field
+
+
+def converter(queryset, lookup):
+    """A function giving the value of ``lookup`` as it should appear in a spreadsheet cell"""
+    field = resolve_field(queryset.model, lookup)
+    if field is None and lookup in queryset.query.annotations:
+        field = queryset.query.annotations[lookup].output_field
+    if field is not None and field.choices:
+        labels = dict(field.flatchoices)
+        return lambda value: labels.get(value, value)
+    if isinstance(field, DecimalField):
+        # Sums come back from SQLite with float noise
+        places = Decimal(1).scaleb(-field.decimal_places)
+        return lambda value: value if value is None else value.quantize(places)
+    if isinstance(field, DateTimeField):
+        # Excel has no time zones: show local time
+        return lambda value: value if value is None else (
+            timezone.localtime(value) if timezone.is_aware(value) else value
+        ).replace(tzinfo=None, microsecond=0)
+    return None
+
+
+def export_rows(queryset, lookups):
+    """Rows of ``lookups`` from ``queryset``, read in chunks and ready to write"""
+    converters = [converter(queryset, lookup) for lookup in lookups]
+    for row in queryset.values_list(*lookups).iterator(chunk_size=CHUNK_SIZE):
+        yield [value if convert is None else convert(value) for convert, value in zip(converters, row)]
+
+
+def escape_formulas(row, prefixes):
+    return [
+        "'" + value if isinstance(value, str) and value.startswith(prefixes) else value
+        for value in row
+    ]
+
+
+def stream_csv(header, rows):
+    """CSV text in chunks of ``CHUNK_SIZE`` rows, with a BOM so Excel reads it as UTF-8"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(header)
+    for i, row in enumerate(rows, start=1):
+        writer.writerow(escape_formulas(row, CSV_FORMULA_PREFIXES))
+        if i % CHUNK_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def write_xlsx(header, rows, title):
+    """An open temporary file holding a one-sheet workbook of ``rows``"""
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title[:31])
+    sheet.append(header)
+    for row in rows:
+        sheet.append(escape_formulas(row, XLSX_FORMULA_PREFIXES))
+    file = tempfile.TemporaryFile()
+    workbook.save(file)
+    file.seek(0)
+    return file
+
+
+class ExportMixin:
+    """``?export=csv|xlsx`` for a list or report view.
+
+    Set ``export_columns`` to ``(header, lookup)`` pairs; lookups may follow
+    relations or name annotations of ``get_export_queryset()``, which is
+    the view's ``get_queryset()`` in the order the page lists it. Templates
+    can include ``rental/includes/export_buttons.html``.
+    """
+    export_columns = ()
+    # Download name without the extension; the model's plural name by default
+    export_filename = None
+
+    def get(self, request, *args, **kwargs):
+        export_format = request.GET.get(EXPORT_PARAM)
+        if export_format:
+            if export_format not in EXPORT_FORMATS:
+                raise Http404("Unknown export format")
+            return self.export(export_format)
+        return super().get(request, *args, **kwargs)
+
+    def get_export_queryset(self):
+        queryset = self.get_queryset()
+        if hasattr(self, 'get_keyset_ordering'):
+            queryset = queryset.order_by(*self.get_keyset_ordering())
+        return queryset
+
+    def get_export_filename(self, queryset):
+        name = self.export_filename or str(queryset.model._meta.verbose_name_plural).replace(' ', '_').lower()
+        return f'{name}_{timezone.localdate():%Y-%m-%d}'
+
+    def export(self, export_format):
+        queryset = self.get_export_queryset()
+        header = [header for header, _ in self.export_columns]
+        rows = export_rows(queryset, [lookup for _, lookup in self.export_columns])
+        filename = self.get_export_filename(queryset)
+        if export_format == 'xlsx':
+            title = (self.export_filename or str(queryset.model._meta.verbose_name_plural)).replace('_', ' ').title()
+            return FileResponse(
+                write_xlsx(header, rows, title), as_attachment=True,
+                filename=f'{filename}.xlsx', content_type=XLSX_CONTENT_TYPE
+            )
+        response = StreamingHttpResponse(stream_csv(header, rows), content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+        return response
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # Download links for the rows the page is showing, whichever page that is
+        params = self.request.GET.copy()
+        for name in (CURSOR_PARAM, 'page'):
+            params.pop(name, None)
+        for export_format in EXPORT_FORMATS:
+            params[EXPORT_PARAM] = export_format
+            context[f'export_{export_format}_url'] = f'?{params.urlencode()}'
+        return context
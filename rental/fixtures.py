@@ -0,0 +1,387 @@
+"""Streaming load and export of JSON data dumps.
+
+``manage.py loaddata`` reads a whole dump into memory and saves one
+object at a time. ``DumpLoader`` instead:
+
+* parses the dump incrementally (a ``dumpdata`` JSON array, or JSON Lines
+  as written by ``export_dump``), in UTF-8 or the UTF-16 PowerShell writes
+  for ``dumpdata > file.json``;
+* validates every object against its model, collecting the errors the way
+  ``ProductImporter`` does, and spools the valid ones to a temporary file
+  per model, so the dump may list models in any order;
+* loads the spools in ``LOAD_ORDER`` with batched ``bulk_create``, giving
+  every row a new primary key and rewriting foreign keys to match, so a
+  dump can be loaded into a database that already has data.
+
+Dumps from older versions of the schema load too: fields since renamed or
+removed by the migrations are mapped or dropped. Users, products and
+expense categories already present (same username, SKU or name) are reused
+rather than duplicated. As with any bulk write, ``save()`` and signals do
+not run, so ``manage.py load_dump`` rebuilds the derived tables afterwards.
+
+``export()`` is the inverse: JSON Lines in ``LOAD_ORDER``, read with
+``values().iterator()`` so no queryset is held in memory.
+"""
+import codecs
+import io
+import json
+import tempfile
+from itertools import islice
+
+from django.apps import apps
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.utils import timezone
+
+from .synthetic import backdating
+
+# Models in the order they are loaded and exported: everything a model refers to comes before it
+LOAD_ORDER = (
+    'auth.user',
+    'rental.expensecategory',
+    'rental.customer',
+    'rental.product',
+    'rental.rentalagreement',
+    'rental.rentalitem',
+    'rental.invoice',
+    'rental.invoicelineitem',
+    'rental.payment',
+    'rental.expense',
+)
+# Found in full dumps but not worth restoring
+SKIPPED_MODELS = ('sessions.session', 'contenttypes.contenttype', 'auth.permission', 'admin.logentry')
+# Unique fields an existing row is matched on instead of inserting a duplicate
+NATURAL_KEYS = {'auth.user': 'username', 'rental.expensecategory': 'name', 'rental.product': 'sku'}
+# Field names used by dumps from before the migrations that renamed (0006) or removed (0002, 0003, 0006) them;
+# invoice.updated_at was removed in 0002 and added back in 0019
+RENAMED_FIELDS = {'rental.rentalitem': {'agreement': 'rental'}}
+RETIRED_FIELDS = {
+    'rental.rentalagreement': ('created_by', 'rental_days'),
+    'rental.rentalitem': ('total_price', 'is_returned', 'return_date'),
+    'rental.invoice': ('pdf_file', 'created_at'),
+}
+
+BOMS = (
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+
+class DumpSyntaxError(ValueError):
+    pass
+
+
+def open_dump(path):
+    """``path`` as text, decoded by its byte order mark (UTF-8 without one)"""
+    raw = open(path, 'rb')
+    start = raw.read(3)
+    raw.seek(0)
+    encoding = next((encoding for bom, encoding in BOMS if start.startswith(bom)), 'utf-8')
+    return io.TextIOWrapper(raw, encoding=encoding)
+
+
+def iter_objects(stream, chunk_size=65536):
+    """Yield ``(line, object)`` for each object of a JSON array or JSON Lines ``stream``
+
+    Only the object being decoded (and the rest of the chunk) is held in
+    memory. Raises ``DumpSyntaxError`` at the first malformed object.
+    """
+    decoder = json.JSONDecoder()
+    buffer, pos, line = '', 0, 1
+    eof = False
+
+    def fill(size=chunk_size):
+        nonlocal buffer, pos, eof
+        chunk = stream.read(size)
+        eof = not chunk
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+    def skip():
+        """Move past whitespace, reading more as needed; the next character, or '' at the end"""
+        nonlocal pos, line
+        while True:
+            while pos < len(buffer) and buffer[pos].isspace():
+                line += buffer[pos] == '\n'
+                pos += 1
+            if pos < len(buffer) or eof:
+                return buffer[pos:pos + 1]
+            fill()
+
+    def fail(message):
+        raise DumpSyntaxError(f'Line {line}: {message}')
+
+    in_array = skip() == '['
+    if in_array:
+        pos += 1
+    first = True
+    while True:
+        char = skip()
+        if in_array:
+            if char == ']':
+                pos += 1
+                if skip():
+                    fail('Unexpected data after the closing ]')
+                return
+            if not first:
+                if char != ',':
+                    fail(f"Expected ',' or ']', found {char!r}" if char else 'Missing the closing ]')
+                pos += 1
+                char = skip()
+        if not char:
+            if in_array:
+                fail('Missing the closing ]')
+            return
+        while True:
+            try:
+                obj, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError as e:
+                if not eof:
+                    # Most likely the object runs on past the buffer: read as much again
+                    fill(max(chunk_size, len(buffer) - pos))
+                    continue
+                error_line = line + buffer.count('\n', pos, e.pos)
+                raise DumpSyntaxError(f'Line {error_line}: {e.msg} (in the object starting on line {line})')
+            # A bare number at the end of the buffer may go on in the next chunk
+            if end == len(buffer) and not eof:
+                fill()
+                continue
+            break
+        yield line, obj
+        line += buffer.count('\n', pos, end)
+        pos = end
+        first = False
+
+
+class LoadResult:
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.created = {}
+        self.matched = {}
+        self.skipped = 0
+        self.errors = []
+
+    def add_error(self, line, label, pk, message):
+        self.errors.append({'line': line, 'model': label, 'pk': pk, 'message': message})
+
+    def count(self, counts, label, n):
+        if n:
+            counts[label] = counts.get(label, 0) + n
+
+    @property
+    def processed(self):
+        return sum(self.created.values()) + sum(self.matched.values())
+
+
+class DumpLoader:
+    """Validate and load the objects of a dump, see the module docstring.
+
+    With ``dry_run`` the load runs in a transaction that is rolled back, so
+    references are checked and counts are real, but nothing is kept.
+    """
+    batch_size = 1000
+
+    def __init__(self, stream, dry_run=False, batch_size=None):
+        self.stream = stream
+        self.dry_run = dry_run
+        self.batch_size = batch_size or self.batch_size
+        self.models = {label: apps.get_model(label) for label in LOAD_ORDER}
+        # Models other models point at: only their keys need remapping
+        self.referenced = {
+            field.related_model._meta.label_lower
+            for model in self.models.values() for field in model._meta.concrete_fields if field.is_relation
+        }
+        # Read now: backdating() clears the auto_now flags while the rows are written
+        self.timestamps = {
+            label: [
+                field for field in model._meta.concrete_fields
+                if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+            ]
+            for label, model in self.models.items()
+        }
+
+    def run(self):
+        result = LoadResult(self.dry_run)
+        spools = {label: tempfile.TemporaryFile('w+', encoding='utf-8') for label in LOAD_ORDER}
+        try:
+            for line, obj in iter_objects(self.stream):
+                record = self.validate(line, obj, result)
+                if record:
+                    spools[record['model']].write(json.dumps(record) + '\n')
+
+            loaded = {label for label, spool in spools.items() if spool.tell()}
+            # Old -> new primary keys, for the models other models refer to
+            self.pk_maps = {label: {} for label in loaded & self.referenced}
+            with transaction.atomic(), backdating(*self.models.values()):
+                for label in LOAD_ORDER:
+                    if label in loaded:
+                        spools[label].seek(0)
+                        self.load(label, (json.loads(record) for record in spools[label]), loaded, result)
+                if self.dry_run:
+                    transaction.set_rollback(True)
+        finally:
+            for spool in spools.values():
+                spool.close()
+        return result
+
+    def validate(self, line, obj, result):
+        """The object as ``{'model', 'pk', 'line', 'fields'}`` with current field names, or None"""
+        if not isinstance(obj, dict) or not isinstance(obj.get('fields'), dict) or 'model' not in obj:
+            result.add_error(line, '', None, 'Not a dump object: expected "model", "pk" and "fields"')
+            return None
+        label, pk = str(obj['model']).lower(), obj.get('pk')
+        if label in SKIPPED_MODELS:
+            result.skipped += 1
+            return None
+        if label not in self.models:
+            result.add_error(line, label, pk, 'Unknown model')
+            return None
+        if pk is None:
+            result.add_error(line, label, pk, 'Missing pk')
+            return None
+
+        model = self.models[label]
+        renamed = RENAMED_FIELDS.get(label, {})
+        retired = RETIRED_FIELDS.get(label, ())
+        fields, unknown = {}, []
+        for name, value in obj['fields'].items():
+            name = renamed.get(name, name)
+            if name in retired:
+                continue
+            try:
+                field = model._meta.get_field(name)
+            except FieldDoesNotExist:
+                unknown.append(name)
+                continue
+            # Group and permission ids differ between databases
+            if not field.many_to_many:
+                fields[name] = value
+        if unknown:
+            result.add_error(line, label, pk, f"Unknown fields: {', '.join(unknown)}")
+            return None
+
+        instance = self.build(model, fields)
+        relations = [field.name for field in model._meta.concrete_fields if field.is_relation]
+        try:
+            # References are checked when loading, once the rows they point to have new keys
+            instance.clean_fields(exclude=relations)
+        except ValidationError as e:
+            result.add_error(line, label, pk, '; '.join(
+                f"{field}: {' '.join(errors)}" for field, errors in e.message_dict.items()
+            ))
+            return None
+        return {'model': label, 'pk': pk, 'line': line, 'fields': fields}
+
+    def build(self, model, fields):
+        """An unsaved ``model`` from dump values, foreign keys still holding the dump's ids"""
+        values = {}
+        for name, value in fields.items():
+            field = model._meta.get_field(name)
+            if field.is_relation:
+                values[field.attname] = value
+            elif value is None and not field.null and field.empty_strings_allowed:
+                # Older schemas allowed NULL in some text fields that are now blank instead
+                values[name] = ''
+            else:
+                try:
+                    values[name] = field.to_python(value)
+                except ValidationError:
+                    # Reported by clean_fields()
+                    values[name] = value
+        instance = model(**values)
+        for field in self.timestamps[model._meta.label_lower]:
+            # Missing timestamps are set as a save() would; present ones keep the dump's dates
+            if field.name not in fields:
+                now = timezone.now()
+                setattr(instance, field.attname, now if isinstance(field, models.DateTimeField) else now.date())
+        return instance
+
+    def load(self, label, records, loaded, result):
+        model = self.models[label]
+        relations = [field for field in model._meta.concrete_fields if field.is_relation]
+        while True:
+            batch = list(islice(records, self.batch_size))
+            if not batch:
+                break
+            existing = self.existing_references(batch, relations, loaded)
+
+            instances, sources = [], []
+            for record in batch:
+                instance = self.build(model, record['fields'])
+                if self.remap(instance, record, relations, loaded, existing, result):
+                    instances.append(instance)
+                    sources.append(record)
+
+            key = NATURAL_KEYS.get(label)
+            if key:
+                matches = model.objects.in_bulk([getattr(instance, key) for instance in instances], field_name=key)
+                new = []
+                for instance, record in zip(instances, sources):
+                    match = matches.get(getattr(instance, key))
+                    if match is None:
+                        new.append((instance, record))
+                    else:
+                        self.remember(label, record['pk'], match.pk)
+                        result.count(result.matched, label, 1)
+                instances, sources = [pair[0] for pair in new], [pair[1] for pair in new]
+
+            model.objects.bulk_create(instances)
+            for instance, record in zip(instances, sources):
+                self.remember(label, record['pk'], instance.pk)
+            result.count(result.created, label, len(instances))
+
+    def remember(self, label, old_pk, new_pk):
+        if label in self.pk_maps:
+            self.pk_maps[label][old_pk] = new_pk
+
+    def existing_references(self, batch, relations, loaded):
+        """Ids that exist in the database, per model the dump refers to without containing"""
+        existing = {}
+        for field in relations:
+            target = field.related_model._meta.label_lower
+            if target in loaded:
+                continue
+            ids = {record['fields'].get(field.name) for record in batch} - {None}
+            if ids:
+                found = field.related_model.objects.filter(pk__in=ids).values_list('pk', flat=True)
+                existing.setdefault(target, set()).update(found)
+        return existing
+
+    def remap(self, instance, record, relations, loaded, existing, result):
+        """Point ``instance``'s foreign keys at the new rows; False if a reference is missing"""
+        for field in relations:
+            old = getattr(instance, field.attname)
+            if old is None:
+                continue
+            target = field.related_model._meta.label_lower
+            if target in loaded:
+                new = self.pk_maps[target].get(old)
+            else:
+                # Not in the dump: the reference is to a row already in the database
+                new = old if old in existing.get(target, ()) else None
+            if new is None and not field.null:
+                result.add_error(record['line'], record['model'], record['pk'], (
+                    f"{field.name}: {field.related_model._meta.verbose_name} {old} "
+                    f"{'was not loaded' if target in loaded else 'does not exist'}"
+                ))
+                return False
+            setattr(instance, field.attname, new)
+        return True
+
+
+def export(stream, labels=LOAD_ORDER, chunk_size=2000):
+    """Write ``labels`` to ``stream`` as JSON Lines, returning ``{label: count}``"""
+    counts = {}
+    for label in labels:
+        model = apps.get_model(label)
+        names = [field.name for field in model._meta.concrete_fields if not field.primary_key]
+        pk_name = model._meta.pk.name
+        count = 0
+        for row in model.objects.order_by('pk').values(pk_name, *names).iterator(chunk_size=chunk_size):
+            pk = row.pop(pk_name)
+            stream.write(json.dumps({'model': label, 'pk': pk, 'fields': row}, cls=DjangoJSONEncoder) + '\n')
+            count += 1
+        counts[label] = count
+    return counts
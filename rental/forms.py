@@ -1,8 +1,7 @@
 from django import forms
 from django.forms import inlineformset_factory, BaseInlineFormSet
 from .models import *
-from io import TextIOWrapper
-import csv
+from .importers import start_import
 
 class ProductForm(forms.ModelForm):
     class Meta:
@@ -175,35 +174,16 @@ class PaymentForm(forms.ModelForm):
 
 class ProductImportForm(forms.Form):
     csv_file = forms.FileField(label='CSV File')
+    dry_run = forms.BooleanField(
+        required=False,
+        label='Dry run',
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+        help_text='Validate the file and report errors without saving anything.'
+    )
 
-    def process_import(self):
-        csv_file = TextIOWrapper(
-            self.cleaned_data['csv_file'].file,
-            encoding='utf-8'
-        )
-        reader = csv.DictReader(csv_file)
-        created_count = 0
-        errors = []
-        
-        for row in reader:
-            try:
-                Product.objects.create(
-                    name=row['name'],
-                    sku=row['sku'],
-                    description=row.get('description', ''),
-                    purchase_price=row.get('purchase_price', 0),
-                    rental_price=row['rental_price'],
-                    stock=row['stock'],
-                    is_rentable=row['is_rentable'].lower() == 'true',
-                    is_sellable=row.get('is_sellable', 'false').lower() == 'true',
-                    is_outsourced=row.get('is_outsourced', 'false').lower() == 'true',
-                    purchase_year=row.get('purchase_year')
-                )
-                created_count += 1
-            except Exception as e:
-                errors.append(f"Error importing {row.get('name')}: {str(e)}")
-        
-        return created_count, errors
+    def start_import(self):
+        """Queue the upload for import, returning the job id its status page polls"""
+        return start_import(self.cleaned_data['csv_file'], dry_run=self.cleaned_data['dry_run'])
 
 class ProductStockForm(forms.ModelForm):
     class Meta:
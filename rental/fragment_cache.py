@@ -0,0 +1,92 @@
+"""Versioned cache keys for template fragments.
+
+A fragment cached with ``{% cachefragment %}`` (rental/templatetags/
+cache_tags.py) is keyed on what it shows, so it never has to be deleted:
+
+* each model instance it varies on contributes its pk and ``updated_at``,
+  so editing that row gives its fragments a new key;
+* each model it depends on as a whole (the items or payments listed under
+  an agreement, say) contributes that model's generation, a counter bumped
+  whenever a row of it is saved or deleted (see rental/signals.py);
+* a list or queryset contributes the versions of its items, so a page can
+  vary on exactly the rows it lists;
+* anything else contributes its ``str()``.
+
+Entries under keys that are no longer used simply age out after
+``FRAGMENT_CACHE_TTL`` seconds. Bulk writes skip the signals, so code
+writing with ``bulk_create`` or ``update()`` bumps the generation itself
+(or sets ``updated_at``).
+"""
+import hashlib
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models, transaction
+
+GENERATION_KEY = 'rental:generation:{}'
+FRAGMENT_KEY = 'rental:fragment:{}:{}'
+
+
+def _label(model):
+    return apps.get_model(model)._meta.label_lower if isinstance(model, str) else model._meta.label_lower
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Never set, or evicted: start from the clock so an old value can't come back
+        cache.add(key, time.time_ns(), None)
+
+
+def bump(*models):
+    """Expire the fragments depending on ``models``, now and again once the transaction commits.
+
+    The second bump covers pages rendered from the old rows meanwhile,
+    which would otherwise be cached under the new generation.
+    """
+    keys = [GENERATION_KEY.format(_label(model)) for model in models]
+    for key in keys:
+        _bump(key)
+    transaction.on_commit(lambda: [_bump(key) for key in keys])
+
+
+def generations(model_labels):
+    """``{label: generation}`` for ``model_labels`` ('app.Model' strings or models), in one cache read"""
+    labels = [_label(model) for model in model_labels]
+    keys = {GENERATION_KEY.format(label): label for label in labels}
+    found = cache.get_many(keys)
+    for key in keys.keys() - found.keys():
+        cache.add(key, time.time_ns(), None)
+        found[key] = cache.get(key)
+    return {label: found[key] for key, label in keys.items()}
+
+
+def version(value):
+    """What ``value`` contributes to a fragment key"""
+    if isinstance(value, models.Model):
+        updated_at = getattr(value, 'updated_at', None)
+        stamp = updated_at.timestamp() if updated_at else ''
+        return f'{value._meta.label_lower}:{value.pk}:{stamp}'
+    if isinstance(value, (list, tuple, models.QuerySet)):
+        return ','.join(version(item) for item in value)
+    return str(value)
+
+
+def fragment_key(name, vary_on=(), depends_on=()):
+    parts = [version(value) for value in vary_on]
+    parts += [f'{label}@{generation}' for label, generation in sorted(generations(depends_on).items())]
+    digest = hashlib.md5('|'.join(parts).encode('utf-8'), usedforsecurity=False).hexdigest()
+    return FRAGMENT_KEY.format(name, digest)
+
+
+def get_or_render(name, render, vary_on=(), depends_on=(), timeout=None):
+    """The cached fragment ``name``, calling ``render()`` to produce and store it when missing"""
+    key = fragment_key(name, vary_on, depends_on)
+    content = cache.get(key)
+    if content is None:
+        content = render()
+        cache.set(key, content, settings.FRAGMENT_CACHE_TTL if timeout is None else timeout)
+    return content
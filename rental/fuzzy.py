@@ -0,0 +1,242 @@
+"""Typo-tolerant lookup of customers and products for autocomplete.
+
+Each process keeps an index per model in memory, so a lookup never touches
+the database. Scoring every record with RapidFuzz costs 100+ ms at 100k
+customers, so the index works on words instead: each query word is
+fuzzy-matched against the vocabulary of distinct words (whole word, or the
+start of a longer one while it is still being typed), and only records
+holding a matching word are scored. Numbers (phones, SKU digits) match by
+prefix or suffix, since "4471" should find "0501234471" and a typo in a
+phone number is a different customer.
+
+Signals (rental/signals.py) update an index already loaded in this
+process. Other worker processes pick the change up when their copy is
+rebuilt, at most ``FUZZY_INDEX_MAX_AGE`` seconds later.
+"""
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+from django.conf import settings
+from rapidfuzz import fuzz, process, utils
+
+from .models import Customer, Product
+
+# Model and the fields that are matched and returned, by lookup kind
+LOOKUP_FIELDS = {
+    'customer': (Customer, ('name', 'company', 'phone')),
+    'product': (Product, ('name', 'sku')),
+}
+
+# Minimum word similarity (0-100) for a record to be a candidate
+WORD_SCORE_CUTOFF = 75
+# Completing a word scores slightly below typing all of it
+PREFIX_WEIGHT = 0.95
+
+
+def normalize(text):
+    """Lowercase words with punctuation removed, as matched by the index"""
+    return utils.default_process(text or '').split()
+
+
+def index_words(value):
+    """Words a field value is found by: "050-123 4471" also matches as 0501234471"""
+    words = normalize(str(value) if value is not None else '')
+    if len(words) > 1 and all(word.isdigit() for word in words):
+        words.append(''.join(words))
+    return words
+
+
+class FuzzyIndex:
+    def __init__(self, fields):
+        self.fields = fields
+        self.entries = {}
+        self.record_words = {}
+        self.postings = defaultdict(set)
+        # Vocabulary of alphabetic words; a removed word leaves a None slot for reuse
+        self.words = []
+        self.word_slots = {}
+        self.free_slots = []
+        self.prefixes = {}
+        # Numeric words, sorted for prefix lookups, and reversed for suffixes
+        self.numbers = []
+        self.reversed_numbers = []
+        self.lock = threading.RLock()
+        self.built_at = time.monotonic()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, pk, values):
+        """Index (or re-index) record ``pk`` with ``values`` in ``fields`` order"""
+        with self.lock:
+            self.remove(pk)
+            for word in self._insert(pk, values):
+                self._add_word(word)
+
+    def load(self, rows):
+        """Index ``(pk, *values)`` rows into an empty index, sorting the numbers once at the end"""
+        with self.lock:
+            for pk, *values in rows:
+                for word in self._insert(pk, values):
+                    if not word.isdigit():
+                        self._add_word(word)
+            self.numbers = sorted(word for word in self.postings if word.isdigit())
+            self.reversed_numbers = sorted(number[::-1] for number in self.numbers)
+
+    def _insert(self, pk, values):
+        """Record ``pk``'s entry and postings, returning the words new to the index"""
+        self.entries[pk] = {'id': pk, **dict(zip(self.fields, values))}
+        words = {word for value in values for word in index_words(value)}
+        self.record_words[pk] = words
+        new_words = []
+        for word in words:
+            if not self.postings[word]:
+                new_words.append(word)
+            self.postings[word].add(pk)
+        return new_words
+
+    def remove(self, pk):
+        with self.lock:
+            self.entries.pop(pk, None)
+            for word in self.record_words.pop(pk, ()):
+                self.postings[word].discard(pk)
+                if not self.postings[word]:
+                    del self.postings[word]
+                    self._remove_word(word)
+
+    def _add_word(self, word):
+        if word.isdigit():
+            insort(self.numbers, word)
+            insort(self.reversed_numbers, word[::-1])
+            return
+        if self.free_slots:
+            slot = self.free_slots.pop()
+            self.words[slot] = word
+        else:
+            slot = len(self.words)
+            self.words.append(word)
+        self.word_slots[word] = slot
+        self.prefixes.clear()
+
+    def _remove_word(self, word):
+        if word.isdigit():
+            del self.numbers[bisect_left(self.numbers, word)]
+            del self.reversed_numbers[bisect_left(self.reversed_numbers, word[::-1])]
+            return
+        slot = self.word_slots.pop(word)
+        self.words[slot] = None
+        self.free_slots.append(slot)
+        self.prefixes.clear()
+
+    def _starting_with(self, ordered, prefix):
+        i = bisect_left(ordered, prefix)
+        while i < len(ordered) and ordered[i].startswith(prefix):
+            yield ordered[i]
+            i += 1
+
+    def matching_words(self, word):
+        """``{indexed word: score}`` for the words a query word could mean"""
+        if word.isdigit():
+            matches = {number: 100.0 for number in self._starting_with(self.numbers, word)}
+            for reversed_number in self._starting_with(self.reversed_numbers, word[::-1]):
+                matches[reversed_number[::-1]] = 100.0
+            return matches
+
+        matches = {}
+        for choice, score, slot in process.extract(
+            word, self.words, scorer=fuzz.ratio, processor=None, limit=None, score_cutoff=WORD_SCORE_CUTOFF
+        ):
+            matches[choice] = score
+        # Every vocabulary word cut to the query's length, built once per length
+        length = len(word)
+        if length not in self.prefixes:
+            self.prefixes[length] = [
+                choice[:length] if choice is not None and len(choice) > length else None for choice in self.words
+            ]
+        for _, score, slot in process.extract(
+            word, self.prefixes[length], scorer=fuzz.ratio, processor=None, limit=None,
+            score_cutoff=WORD_SCORE_CUTOFF
+        ):
+            choice = self.words[slot]
+            matches[choice] = max(matches.get(choice, 0), score * PREFIX_WEIGHT)
+        return matches
+
+    def lookup(self, query, limit=10):
+        """Best ``limit`` records for ``query`` as dicts with a 0-100 ``score``"""
+        words = list(dict.fromkeys(normalize(query)))
+        if not words:
+            return []
+        with self.lock:
+            totals = defaultdict(float)
+            for word in words:
+                best = {}
+                for match, score in self.matching_words(word).items():
+                    for pk in self.postings[match]:
+                        if score > best.get(pk, 0):
+                            best[pk] = score
+                for pk, score in best.items():
+                    totals[pk] += score
+            top = heapq.nlargest(limit, totals.items(), key=lambda item: (item[1], -item[0]))
+            return [{**self.entries[pk], 'score': round(total / len(words), 1)} for pk, total in top]
+
+
+_indexes = {}
+_build_lock = threading.Lock()
+
+
+def _kind(model):
+    return next((kind for kind, (indexed, _) in LOOKUP_FIELDS.items() if indexed is model), None)
+
+
+def build(kind):
+    """A fresh index of every ``kind`` record, read in one query"""
+    model, fields = LOOKUP_FIELDS[kind]
+    fuzzy_index = FuzzyIndex(fields)
+    fuzzy_index.load(model.objects.values_list('pk', *fields).iterator(chunk_size=5000))
+    return fuzzy_index
+
+
+def get_index(kind):
+    """This process's index for ``kind``, built on first use and when it gets too old"""
+    fuzzy_index = _indexes.get(kind)
+    if fuzzy_index is None or time.monotonic() - fuzzy_index.built_at > settings.FUZZY_INDEX_MAX_AGE:
+        with _build_lock:
+            fuzzy_index = _indexes.get(kind)
+            if fuzzy_index is None or time.monotonic() - fuzzy_index.built_at > settings.FUZZY_INDEX_MAX_AGE:
+                fuzzy_index = _indexes[kind] = build(kind)
+    return fuzzy_index
+
+
+def lookup(kind, query, limit=10):
+    return get_index(kind).lookup(query, limit)
+
+
+def update(instance):
+    """Re-index a saved record, if this process has loaded its index"""
+    kind = _kind(type(instance))
+    if kind in _indexes:
+        fields = LOOKUP_FIELDS[kind][1]
+        _indexes[kind].add(instance.pk, [getattr(instance, field) for field in fields])
+
+
+def update_many(model, pks):
+    """Re-index records written in bulk (no signals fire for those)"""
+    kind = _kind(model)
+    if kind in _indexes:
+        fields = LOOKUP_FIELDS[kind][1]
+        for pk, *values in model.objects.filter(pk__in=pks).values_list('pk', *fields):
+            _indexes[kind].add(pk, values)
+
+
+def discard(instance):
+    kind = _kind(type(instance))
+    if kind in _indexes:
+        _indexes[kind].remove(instance.pk)
+
+
+def reset():
+    """Forget the loaded indexes; the next lookup rebuilds them"""
+    _indexes.clear()
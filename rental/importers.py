@@ -0,0 +1,211 @@
+"""Bulk product import from supplier CSV files.
+
+Rows are streamed from the upload and handled in chunks: each chunk is
+validated with the model's own rules, then written with one
+``bulk_create`` for new SKUs and one ``bulk_update`` for SKUs already in
+the catalogue. Barcode rendering is left to a background task queued once
+the import commits.
+
+Uploads from the import page run in a Celery task (``start_import()``),
+so a large file never holds up a web worker; the task records its progress
+and result in the cache, where ``import_status()`` reads them for the
+status page.
+"""
+import csv
+from decimal import Decimal
+from io import TextIOWrapper
+from itertools import islice
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from . import fragment_cache, fuzzy, search
+from .models import Product
+from .tasks import dispatch, generate_product_barcodes, import_products
+
+REQUIRED_COLUMNS = ('name', 'sku', 'rental_price', 'stock', 'is_rentable')
+IMPORT_FIELDS = (
+    'name', 'sku', 'description', 'stock', 'is_rentable', 'is_sellable', 'is_outsourced',
+    'purchase_price', 'rental_price', 'outsourced_purchase_price', 'outsourced_rental_price',
+    'condition', 'purchase_year',
+)
+BOOLEAN_FIELDS = ('is_rentable', 'is_sellable', 'is_outsourced')
+TRUE_VALUES = ('true', '1', 'yes', 'y', 't')
+
+STATUS_KEY = 'rental:product-import:{}'
+# Seconds an import's progress and result stay readable
+STATUS_TTL = 24 * 60 * 60
+
+
+class ImportResult:
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.created = 0
+        self.updated = 0
+        self.errors = []
+
+    def add_error(self, line, sku, message):
+        self.errors.append({'line': line, 'sku': sku, 'message': message})
+
+    @property
+    def processed(self):
+        return self.created + self.updated
+
+    def as_dict(self):
+        return {'dry_run': self.dry_run, 'created': self.created, 'updated': self.updated, 'errors': self.errors}
+
+
+class ProductImporter:
+    """Upsert products by SKU from a CSV stream.
+
+    With ``dry_run`` every row is validated and counted as a create or an
+    update, but nothing is written.
+    """
+    batch_size = 1000
+
+    def __init__(self, file, dry_run=False, batch_size=None, encoding='utf-8', progress=None):
+        self.file = file
+        self.dry_run = dry_run
+        self.batch_size = batch_size or self.batch_size
+        self.encoding = encoding
+        # Called with the number of rows read and the result so far after each chunk
+        self.progress = progress
+
+    def run(self):
+        result = ImportResult(self.dry_run)
+        reader = csv.DictReader(TextIOWrapper(self.file, encoding=self.encoding, newline=''))
+        missing = [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or ())]
+        if missing:
+            result.add_error(1, '', f"Missing required columns: {', '.join(missing)}")
+            return result
+        columns = [field for field in IMPORT_FIELDS if field in reader.fieldnames]
+
+        seen = {}
+        # Line 1 is the header row
+        rows = enumerate(reader, start=2)
+        with transaction.atomic():
+            while True:
+                chunk = list(islice(rows, self.batch_size))
+                if not chunk:
+                    break
+                products = self.validate_chunk(chunk, columns, seen, result)
+                self.write_chunk(products, columns, result)
+                if self.progress:
+                    self.progress(chunk[-1][0] - 1, result)
+        return result
+
+    def build(self, row, columns):
+        values = {}
+        for field in columns:
+            value = (row.get(field) or '').strip()
+            if field in BOOLEAN_FIELDS:
+                values[field] = value.lower() in TRUE_VALUES
+            elif value == '':
+                # Leave the model default for blanks (NULL for the optional prices)
+                continue
+            else:
+                values[field] = value
+        product = Product(**values)
+        if not product.is_outsourced and product.purchase_price is None:
+            # As the import always has: an owned product without a purchase price cost nothing
+            product.purchase_price = Decimal('0.00')
+        return product
+
+    def validate_chunk(self, chunk, columns, seen, result):
+        products = []
+        for line, row in chunk:
+            sku = (row.get('sku') or '').strip()
+            if sku in seen:
+                result.add_error(line, sku, f"Duplicate SKU, already imported from line {seen[sku]}")
+                continue
+            product = self.build(row, columns)
+            try:
+                # Field rules only: Product.clean() wants a purchase price, which the import has never
+                # required; uniqueness is resolved by the upsert and barcodes come later
+                product.clean_fields(exclude=['barcode'])
+            except ValidationError as e:
+                result.add_error(line, sku, '; '.join(
+                    f"{field}: {' '.join(errors)}" if field != '__all__' else ' '.join(errors)
+                    for field, errors in e.message_dict.items()
+                ))
+                continue
+            seen[sku] = line
+            products.append(product)
+        return products
+
+    def write_chunk(self, products, columns, result):
+        if not products:
+            return
+        existing = Product.objects.in_bulk([product.sku for product in products], field_name='sku')
+        to_create, to_update = [], []
+        now = timezone.now()
+        for product in products:
+            current = existing.get(product.sku)
+            if current is None:
+                to_create.append(product)
+                continue
+            for field in columns:
+                setattr(current, field, getattr(product, field))
+            current.updated_at = now
+            to_update.append(current)
+
+        result.created += len(to_create)
+        result.updated += len(to_update)
+        if self.dry_run:
+            return
+
+        created = Product.objects.bulk_create(to_create)
+        if to_update:
+            Product.objects.bulk_update(to_update, [*columns, 'updated_at'])
+        product_ids = [product.pk for product in [*created, *to_update] if product.pk]
+        if product_ids:
+            # bulk writes skip the post_save signal that normally keeps search in step
+            search.reindex(Product, product_ids)
+            fragment_cache.bump(Product)
+            transaction.on_commit(lambda: fuzzy.update_many(Product, product_ids))
+            transaction.on_commit(lambda: dispatch(generate_product_barcodes, product_ids))
+
+
+def set_status(job_id, **status):
+    cache.set(STATUS_KEY.format(job_id), status, STATUS_TTL)
+
+
+def import_status(job_id):
+    """What ``start_import()`` recorded for ``job_id``, or None once it has expired"""
+    return cache.get(STATUS_KEY.format(job_id))
+
+
+def start_import(upload, dry_run=False):
+    """Store ``upload`` where the workers can read it and queue its import, returning the job id"""
+    job_id = uuid4().hex
+    path = default_storage.save(f'imports/{job_id}.csv', upload)
+    set_status(job_id, state='queued', dry_run=dry_run, rows_done=0, rows_total=None)
+    if dispatch(import_products, job_id, path, dry_run) is None:
+        default_storage.delete(path)
+        set_status(job_id, state='failed', dry_run=dry_run, message='The import could not be queued, try again later.')
+    return job_id
+
+
+def run_import(job_id, path, dry_run=False):
+    """Import the stored file ``path``, keeping ``job_id``'s status current; run by the import_products task"""
+    try:
+        with default_storage.open(path, 'rb') as file:
+            rows_total = max(sum(chunk.count(b'\n') for chunk in file.chunks()) - 1, 0)
+        set_status(job_id, state='running', dry_run=dry_run, rows_done=0, rows_total=rows_total)
+
+        def progress(rows_done, result):
+            set_status(job_id, state='running', rows_done=rows_done, rows_total=rows_total, **result.as_dict())
+
+        with default_storage.open(path, 'rb') as file:
+            result = ProductImporter(file, dry_run=dry_run, progress=progress).run()
+        set_status(job_id, state='done', rows_done=rows_total, rows_total=rows_total, **result.as_dict())
+        return result
+    except Exception:
+        set_status(job_id, state='failed', dry_run=dry_run, message='The import failed, nothing was saved.')
+        raise
+    finally:
+        default_storage.delete(path)
@@ -0,0 +1,110 @@
+"""Bulk export of letterhead invoice PDFs as one streamed ZIP archive.
+
+Invoices are loaded with their agreement, customer and items in a few
+queries per chunk, pickled to worker processes (the prefetched relations
+travel with them, so workers never touch the database) and rendered with
+``invoice/invoice_letterpad.html``. Only a small window of renders is in
+flight at once, and each finished PDF is written to the archive and handed
+to the client straight away, so memory stays flat however many invoices
+match.
+"""
+import os
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.apps import apps
+
+from . import documents
+from .models import Invoice
+
+CHUNK_SIZE = 200
+
+
+def invoice_queryset(start_date=None, end_date=None, status=None):
+    invoices = Invoice.objects.select_related(
+        'rental_agreement__customer'
+    ).prefetch_related(
+        'rental_agreement__items__product'
+    ).order_by('issue_date', 'pk')
+    if start_date:
+        invoices = invoices.filter(issue_date__gte=start_date)
+    if end_date:
+        invoices = invoices.filter(issue_date__lte=end_date)
+    if status:
+        invoices = invoices.filter(payment_status=status)
+    return invoices
+
+
+def _init_worker():
+    # Forked workers inherit a configured Django; spawned ones need setting up
+    if not apps.ready:
+        django.setup()
+
+
+def _render(invoice):
+    filename = f"invoice_{invoice.invoice_number}.pdf"
+    try:
+        return filename, documents.letterpad_pdf(invoice), None
+    except Exception as e:
+        return filename, None, str(e)
+
+
+class _ZipStream:
+    """Write-only file object collecting what ZipFile writes until it's drained.
+
+    It isn't seekable, so ZipFile writes data descriptors after each member
+    instead of going back to patch local headers.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def rendered_invoices(invoices, workers=None, window=None):
+    """Yield ``(filename, pdf, error)`` in queryset order, rendering in a process pool"""
+    workers = workers or os.cpu_count() or 1
+    window = window or workers * 2
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        pending = deque()
+        try:
+            for invoice in invoices.iterator(chunk_size=CHUNK_SIZE):
+                pending.append(pool.submit(_render, invoice))
+                if len(pending) >= window:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # A client that disconnects mid-download shouldn't leave renders queued
+            pool.shutdown(cancel_futures=True)
+
+
+def stream_zip(invoices, workers=None):
+    """Yield the bytes of a ZIP archive holding one PDF per invoice"""
+    stream = _ZipStream()
+    errors = []
+    with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for filename, pdf, error in rendered_invoices(invoices, workers):
+            if pdf:
+                archive.writestr(filename, pdf)
+            else:
+                errors.append(f"{filename}: {error or 'rendering failed'}")
+            data = stream.drain()
+            if data:
+                yield data
+        if errors:
+            archive.writestr('errors.txt', '\n'.join(errors))
+    yield stream.drain()
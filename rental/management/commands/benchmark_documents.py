@@ -0,0 +1,48 @@
+from statistics import mean
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rental import documents
+from rental.models import Customer, Invoice, Payment
+
+class Command(BaseCommand):
+    help = 'Times each PDF document layout against existing records'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=20, help='Renders per document type')
+        parser.add_argument('--kind', action='append', choices=list(documents.LAYOUTS), help='Only time these layouts (repeatable)')
+
+    def handle(self, *args, **options):
+        invoice = Invoice.objects.select_related('rental_agreement__customer').prefetch_related(
+            'rental_agreement__items__product', 'rental_agreement__payments'
+        ).first()
+        payment = Payment.objects.select_related('rental_agreement__customer').first()
+        customer = Customer.objects.filter(rentals__isnull=False).first()
+        if invoice is None or payment is None or customer is None:
+            raise CommandError('Needs at least one invoice, payment and customer with rentals to render')
+
+        today = timezone.now().date()
+        builders = {
+            'agreement': lambda: documents.agreement_pdf(invoice.rental_agreement),
+            'invoice': lambda: documents.invoice_pdf(invoice.rental_agreement, invoice),
+            'receipt': lambda: documents.receipt_pdf(payment),
+            'statement': lambda: documents.statement_pdf(customer, today),
+        }
+        # Styles are built once per process; do it before timing anything
+        documents.styles()
+
+        runs = max(options['runs'], 1)
+        for kind in options['kind'] or builders:
+            timings = []
+            for _ in range(runs):
+                started = perf_counter()
+                pdf = builders[kind]()
+                timings.append((perf_counter() - started) * 1000)
+            timings.sort()
+            p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+            self.stdout.write(
+                f'{kind:<10} mean {mean(timings):7.1f} ms  p95 {p95:7.1f} ms  ({len(pdf) / 1024:.0f} KiB)'
+            )
+
+        self.stdout.write(self.style.SUCCESS(f'Rendered {runs} of each document'))
@@ -0,0 +1,151 @@
+import csv
+import io
+import json
+from pathlib import Path
+from statistics import median
+from time import perf_counter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rental import pdf_cache
+from rental.models import Product, RentalAgreement
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'views.json'
+
+
+def import_csv(run, rows=200):
+    """A product CSV of new SKUs (the import is rolled back after timing)"""
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(['name', 'sku', 'stock', 'rental_price', 'purchase_price', 'is_rentable'])
+    for i in range(rows):
+        writer.writerow([f'Benchmark Product {i}', f'BENCH-{run}-{i:04d}', 5, '25.00', '400.00', 'true'])
+    upload = io.BytesIO(out.getvalue().encode('utf-8'))
+    upload.name = 'products.csv'
+    return upload
+
+
+class Command(BaseCommand):
+    help = 'Times the core pages with the test client and compares query counts and wall time to a JSON baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help='Timed requests per scenario (after one warm-up)')
+        parser.add_argument('--scenario', action='append', help='Only run these scenarios (repeatable)')
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE), help='Baseline JSON file')
+        parser.add_argument('--save', action='store_true', help='Write the results as the new baseline')
+        parser.add_argument(
+            '--tolerance', type=float, default=0.25,
+            help='Allowed slowdown of the fastest run before it counts as a regression (0.25 = 25%%)'
+        )
+
+    def scenarios(self):
+        """name -> function(run) returning (method, url, data), for the pages under test"""
+        today = timezone.localdate()
+        rentals = list(RentalAgreement.objects.order_by('-pk').values_list('pk', flat=True)[:50])
+        if not rentals or not Product.objects.exists():
+            raise CommandError('Needs products and rentals; run manage.py generate_data first')
+
+        def pdf(name):
+            def request(run):
+                rental_id = rentals[run % len(rentals)]
+                # Time the render, not a cache hit
+                pdf_cache.discard(rental_id)
+                return 'get', reverse(name, args=[rental_id]), None
+            return request
+
+        return {
+            'dashboard': lambda run: ('get', reverse('dashboard'), None),
+            'product_list': lambda run: ('get', reverse('product_list'), None),
+            'product_search': lambda run: ('get', reverse('product_list'), {'q': 'drill'}),
+            'rental_list': lambda run: ('get', reverse('rental_list'), None),
+            'revenue_report': lambda run: ('get', '/reports/revenue/', None),
+            'financial_report': lambda run: ('get', '/financials/reports/', None),
+            'monthly_revenue': lambda run: (
+                'get', reverse('monthly_revenue_detail'), {'year': today.year, 'month': today.month}
+            ),
+            'invoice_pdf': pdf('rental_invoice_pdf'),
+            'agreement_pdf': pdf('rental_agreement_pdf'),
+            'product_import': lambda run: ('post', reverse('product_import'), {'csv_file': import_csv(run)}),
+        }
+
+    def measure(self, client, request, runs):
+        timings, queries, size = [], 0, 0
+        for run in range(runs + 1):
+            method, url, data = request(run)
+            with transaction.atomic(), CaptureQueriesContext(connection) as captured:
+                started = perf_counter()
+                response = getattr(client, method)(url, data)
+                elapsed = (perf_counter() - started) * 1000
+                # Leave the database as it was (the import writes products)
+                transaction.set_rollback(True)
+            if response.status_code >= 400:
+                raise CommandError(f'{method.upper()} {url} returned {response.status_code}')
+            if run == 0:
+                continue
+            timings.append(elapsed)
+            queries = max(queries, len(captured))
+            size = len(response.getvalue()) if response.streaming else len(response.content)
+        timings.sort()
+        return {
+            'min_ms': round(timings[0], 1),
+            'median_ms': round(median(timings), 1),
+            'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 1),
+            'queries': queries,
+            'bytes': size,
+        }
+
+    def handle(self, *args, **options):
+        scenarios = self.scenarios()
+        selected = options['scenario'] or list(scenarios)
+        unknown = set(selected) - set(scenarios)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+        user, _ = get_user_model().objects.get_or_create(username='loadtest', defaults={'is_staff': True})
+        client = Client()
+        client.force_login(user)
+
+        results = {}
+        for name in selected:
+            results[name] = self.measure(client, scenarios[name], max(options['runs'], 1))
+
+        path = Path(options['baseline'])
+        baseline = json.loads(path.read_text())['scenarios'] if path.exists() else {}
+        regressions = []
+        for name, result in results.items():
+            line = f"{name:<18} {result['median_ms']:8.1f} ms  p95 {result['p95_ms']:8.1f} ms  {result['queries']:4d} queries"
+            before = baseline.get(name)
+            if before:
+                line += f"  (baseline {before['median_ms']:.1f} ms, {before['queries']} queries)"
+                # The fastest run is the least noisy figure; small absolute differences are noise whatever the ratio
+                fastest, was = result['min_ms'], before['min_ms']
+                if result['queries'] > before['queries']:
+                    regressions.append(f"{name}: {before['queries']} -> {result['queries']} queries")
+                elif fastest - was > 5 and fastest > was * (1 + options['tolerance']):
+                    regressions.append(f"{name}: fastest run {was:.1f} -> {fastest:.1f} ms")
+            self.stdout.write(line)
+
+        if options['save']:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps({
+                'recorded_at': timezone.now().isoformat(timespec='seconds'),
+                'database': connection.vendor,
+                'rentals': RentalAgreement.objects.count(),
+                'products': Product.objects.count(),
+                'runs': options['runs'],
+                'scenarios': {**baseline, **results},
+            }, indent=2) + '\n')
+            self.stdout.write(self.style.SUCCESS(f'Saved the baseline to {path}'))
+            return
+
+        if regressions:
+            raise CommandError('Slower than the baseline:\n  ' + '\n  '.join(regressions))
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(results)} scenarios within the baseline' if baseline else f'Ran {len(results)} scenarios (no baseline at {path})'
+        ))
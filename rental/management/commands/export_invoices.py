@@ -0,0 +1,27 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from rental import invoice_export
+from rental.models import Invoice
+
+class Command(BaseCommand):
+    help = 'Renders letterhead invoice PDFs for a date range into a ZIP archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Path of the ZIP file to write')
+        parser.add_argument('--start', type=date.fromisoformat, help='First issue date (YYYY-MM-DD)')
+        parser.add_argument('--end', type=date.fromisoformat, help='Last issue date (YYYY-MM-DD)')
+        parser.add_argument('--status', choices=[choice for choice, _ in Invoice.PAYMENT_STATUS_CHOICES])
+        parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: CPU count)')
+
+    def handle(self, *args, **options):
+        invoices = invoice_export.invoice_queryset(options['start'], options['end'], options['status'])
+        count = invoices.count()
+        if not count:
+            raise CommandError('No invoices match the given filters')
+
+        with open(options['output'], 'wb') as f:
+            for chunk in invoice_export.stream_zip(invoices, workers=options['workers']):
+                f.write(chunk)
+
+        self.stdout.write(self.style.SUCCESS(f'Exported {count} invoices to {options["output"]}'))
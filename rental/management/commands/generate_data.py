@@ -0,0 +1,48 @@
+from time import perf_counter
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from rental import fragment_cache, synthetic
+from rental.models import Customer, Expense, Invoice, Payment, Product, RentalAgreement, RentalItem
+from rental.stats import DashboardStats
+
+class Command(BaseCommand):
+    help = 'Fills the database with seeded synthetic products, customers, rentals, payments and expenses for load testing'
+
+    def add_arguments(self, parser):
+        defaults = synthetic.Volumes()
+        parser.add_argument('--seed', type=int, default=1, help='Same seed, same data')
+        parser.add_argument('--scale', type=float, default=1.0, help='Multiply every record count, e.g. 0.01 for a quick run')
+        parser.add_argument('--products', type=int, default=defaults.products)
+        parser.add_argument('--customers', type=int, default=defaults.customers)
+        parser.add_argument('--rentals', type=int, default=defaults.rentals)
+        parser.add_argument('--max-items', type=int, default=defaults.max_items, help='Items per rental agreement are 1 to this')
+        parser.add_argument('--expenses', type=int, default=defaults.expenses)
+        parser.add_argument('--days', type=int, default=defaults.days, help='Days of history before today')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rental agreements written per transaction')
+
+    def handle(self, *args, **options):
+        volumes = synthetic.Volumes(
+            products=options['products'],
+            customers=options['customers'],
+            rentals=options['rentals'],
+            max_items=options['max_items'],
+            expenses=options['expenses'],
+            days=options['days'],
+        ).scaled(options['scale'])
+
+        started = perf_counter()
+        result = synthetic.generate(
+            volumes, seed=options['seed'], batch_size=options['batch_size'],
+            log=lambda message: self.stdout.write(f'  {message}') if options['verbosity'] > 1 else None
+        )
+        # bulk_create skips the signals and save() hooks that maintain these
+        for command in ('rebuild_reservations', 'rebuild_revenue_reports', 'rebuild_search_index'):
+            call_command(command, stdout=self.stdout)
+        DashboardStats.invalidate()
+        fragment_cache.bump(Product, Customer, RentalAgreement, RentalItem, Invoice, Payment, Expense)
+
+        created = ', '.join(f'{count} {name}' for name, count in result.counts.items())
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {created} in {perf_counter() - started:.1f}s'
+        ))
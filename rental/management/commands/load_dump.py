@@ -0,0 +1,51 @@
+from time import perf_counter
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+from rental import fixtures, fragment_cache
+from rental.stats import DashboardStats
+
+class Command(BaseCommand):
+    help = 'Streams a JSON or JSON Lines data dump into the database with batched inserts, remapping primary keys'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Dump from dumpdata or export_dump (UTF-8 or UTF-16)')
+        parser.add_argument('--dry-run', action='store_true', help='Validate and count, then roll back')
+        parser.add_argument('--batch-size', type=int, default=fixtures.DumpLoader.batch_size, help='Rows per insert')
+
+    def handle(self, *args, **options):
+        started = perf_counter()
+        try:
+            with fixtures.open_dump(options['path']) as stream:
+                result = fixtures.DumpLoader(
+                    stream, dry_run=options['dry_run'], batch_size=options['batch_size']
+                ).run()
+        except OSError as e:
+            raise CommandError(f"Cannot read {options['path']}: {e}")
+        except fixtures.DumpSyntaxError as e:
+            raise CommandError(f'Invalid JSON, nothing was loaded. {e}')
+        except IntegrityError as e:
+            raise CommandError(f'Could not write the dump, nothing was loaded: {e}')
+
+        for error in result.errors:
+            self.stdout.write(self.style.WARNING(
+                f"Line {error['line']}: {error['model']} {error['pk']}: {error['message']}"
+            ))
+        if result.processed and not options['dry_run']:
+            # bulk_create skips the signals and save() hooks that maintain these
+            for command in ('rebuild_reservations', 'rebuild_revenue_reports', 'rebuild_search_index'):
+                call_command(command, stdout=self.stdout)
+            DashboardStats.invalidate()
+            fragment_cache.bump(*result.created)
+
+        summary = ', '.join(
+            f'{count} {label}' for label, count in result.created.items()
+        ) or 'nothing'
+        matched = sum(result.matched.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Would load' if options['dry_run'] else 'Loaded'} {summary} in {perf_counter() - started:.1f}s"
+            f"{f', reused {matched} existing rows' if matched else ''}"
+            f"{f', skipped {result.skipped} objects of unrestored models' if result.skipped else ''}"
+            f"{f', {len(result.errors)} objects had errors' if result.errors else ''}"
+        ))
@@ -0,0 +1,39 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from rental.models import RentalItem, ReservationLedger, RESERVING_STATUSES
+
+class Command(BaseCommand):
+    help = 'Rebuilds the per-day reservation ledger from outstanding rental items'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        booked = defaultdict(int)
+        items = RentalItem.objects.filter(
+            rental__status__in=RESERVING_STATUSES,
+            returned_quantity__lt=F('quantity')
+        ).values_list(
+            'product_id', 'quantity', 'returned_quantity',
+            'rental__start_date', 'rental__expected_return_date'
+        )
+
+        for product_id, quantity, returned, start, end in items.iterator(chunk_size=2000):
+            for n in range((end - start).days + 1):
+                booked[(product_id, start + timedelta(days=n))] += quantity - returned
+
+        with transaction.atomic():
+            ReservationLedger.objects.all().delete()
+            ReservationLedger.objects.bulk_create(
+                (ReservationLedger(product_id=product_id, day=day, reserved=units)
+                 for (product_id, day), units in booked.items()),
+                batch_size=options['batch_size']
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt reservation ledger with {len(booked)} product-days'
+        ))
@@ -0,0 +1,44 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
+from rental.models import Expense, Payment, RevenueReport
+
+class Command(BaseCommand):
+    help = 'Rebuilds the monthly RevenueReport rollup from payments and expenses'
+
+    def handle(self, *args, **kwargs):
+        months = defaultdict(lambda: {'income': Decimal('0.00'), 'expenses': Decimal('0.00')})
+
+        income = Payment.objects.annotate(
+            period=TruncMonth('payment_date')
+        ).values('period').annotate(total=Sum('amount')).order_by()
+        for row in income:
+            months[row['period']]['income'] = row['total'] or Decimal('0.00')
+
+        expenses = Expense.objects.annotate(
+            period=TruncMonth('date')
+        ).values('period').annotate(total=Sum('amount')).order_by()
+        for row in expenses:
+            months[row['period']]['expenses'] = row['total'] or Decimal('0.00')
+
+        with transaction.atomic():
+            RevenueReport.objects.all().delete()
+            RevenueReport.objects.bulk_create([
+                RevenueReport(
+                    month=period.month,
+                    year=period.year,
+                    rental_income=totals['income'],
+                    total_income=totals['income'],
+                    expenses=totals['expenses'],
+                    net_income=totals['income'] - totals['expenses'],
+                )
+                for period, totals in months.items()
+            ])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {len(months)} monthly revenue reports'
+        ))
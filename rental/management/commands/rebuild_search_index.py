@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from rental import search
+from rental.models import Customer, Product
+
+class Command(BaseCommand):
+    help = 'Rebuilds the product and customer full-text search index from their tables'
+
+    def handle(self, *args, **options):
+        backend = search.backend()
+        if backend != 'fts5':
+            self.stdout.write(f'The {backend} search backend needs no rebuild')
+            return
+        for model in (Product, Customer):
+            search.reindex(model)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt the search index for {Product.objects.count()} products and {Customer.objects.count()} customers'
+        ))
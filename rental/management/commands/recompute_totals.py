@@ -0,0 +1,51 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum, DecimalField
+from rental.models import RentalAgreement, RentalItem, Payment
+
+class Command(BaseCommand):
+    help = 'Verifies the stored rental agreement totals against items and payments, optionally repairing them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Rewrite totals that have drifted')
+
+    def handle(self, *args, **options):
+        line_totals = RentalItem.objects.filter(
+            rental=OuterRef('pk')
+        ).values('rental').annotate(
+            total=Sum(F('rental_price') * F('quantity'))
+        ).values('total')
+        payments = Payment.objects.filter(
+            rental_agreement=OuterRef('pk')
+        ).values('rental_agreement').annotate(total=Sum('amount')).values('total')
+
+        agreements = RentalAgreement.objects.annotate(
+            line_total=Subquery(line_totals, output_field=DecimalField()),
+            payments_total=Subquery(payments, output_field=DecimalField()),
+        )
+
+        checked = drifted = 0
+        for agreement in agreements.iterator(chunk_size=500):
+            checked += 1
+            subtotal = (agreement.line_total or Decimal('0.00')) * agreement.rental_days
+            paid = agreement.payments_total or Decimal('0.00')
+            cents = Decimal('0.01')
+            if (agreement.subtotal.quantize(cents) == subtotal.quantize(cents)
+                    and agreement.paid_amount.quantize(cents) == paid.quantize(cents)):
+                continue
+
+            drifted += 1
+            self.stdout.write(
+                f'Rental #{agreement.pk}: stored subtotal {agreement.subtotal} / paid {agreement.paid_amount}, '
+                f'expected {subtotal:.2f} / {paid:.2f}'
+            )
+            if options['fix']:
+                with transaction.atomic():
+                    agreement.update_totals()
+
+        verb = 'Repaired' if options['fix'] else 'Found'
+        self.stdout.write(self.style.SUCCESS(
+            f'Checked {checked} rental agreements. {verb} {drifted} with drifted totals'
+        ))
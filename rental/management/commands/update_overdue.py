@@ -1,19 +1,15 @@
 from django.core.management.base import BaseCommand
-from django.utils import timezone
-from rental.models import RentalAgreement
+from rental.overdue import mark_overdue
 
 class Command(BaseCommand):
     help = 'Updates the status of overdue rental agreements'
-    
-    def handle(self, *args, **kwargs):
-        today = timezone.now().date()
-        overdue_rentals = RentalAgreement.objects.filter(
-            expected_return_date__lt=today,
-            status='active'
-        )
-        
-        count = overdue_rentals.update(status='overdue')
-        
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Agreements updated per statement')
+
+    def handle(self, *args, **options):
+        count = mark_overdue(batch_size=options['batch_size'])
+
         self.stdout.write(self.style.SUCCESS(
             f'Successfully marked {count} rentals as overdue'
-        ))
\ No newline at end of file
+        ))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from rental import barcodes
+from rental.models import Product
+
+class Command(BaseCommand):
+    help = 'Pre-renders cached barcode images for every product SKU using a process pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--symbology', default=barcodes.DEFAULT_SYMBOLOGY, choices=barcodes.SYMBOLOGIES)
+        parser.add_argument('--format', action='append', dest='formats', choices=list(barcodes.FORMATS),
+                            help='Image format to render, repeatable (default: svg)')
+        parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: CPU count)')
+        parser.add_argument('--force', action='store_true', help='Re-render images that are already cached')
+
+    def handle(self, *args, **options):
+        skus = list(Product.objects.exclude(sku='').values_list('sku', flat=True))
+        rendered, failures = barcodes.warm(
+            skus,
+            symbology=options['symbology'],
+            formats=options['formats'] or ['svg'],
+            workers=options['workers'],
+            force=options['force']
+        )
+
+        for sku, error in failures:
+            self.stdout.write(self.style.WARNING(f'Skipped {sku}: {error}'))
+        self.stdout.write(self.style.SUCCESS(
+            f'Rendered {rendered} barcode images for {len(skus)} products into {barcodes.cache_root()}'
+        ))
@@ -0,0 +1,189 @@
+"""Per-request query, SQL time, template time and response size metrics.
+
+``RequestMetricsMiddleware`` counts every query a request runs through a
+database ``execute_wrapper`` and, with the ``MeasuredDjangoTemplates``
+template backend configured in ``TEMPLATES``, times template rendering,
+then:
+
+* logs one ``request_metrics`` line of ``key=value`` pairs per request;
+* keeps the last ``REQUEST_METRICS_WINDOW`` samples per URL name, served
+  as p50/p95 by the staff-only ``request_metrics`` JSON view (figures are
+  per worker process);
+* checks ``VIEW_QUERY_BUDGETS``: over-budget requests log a warning, or
+  raise ``QueryBudgetExceeded`` with ``QUERY_BUDGET_STRICT``, which the
+  tests turn on so a new N+1 fails them.
+
+With ``REQUEST_METRICS_ENABLED = False`` Django drops the middleware at
+startup. Works under WSGI and ASGI.
+"""
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class RequestMetrics:
+    """Figures for the request being handled"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_ms = 0.0
+        self.template_ms = 0.0
+        self.rendering = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # execute_wrapper hook: every query on the wrapped connections passes through here
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.sql_ms += (time.perf_counter() - start) * 1000
+
+
+class MeasuredTemplate(Template):
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        # Outside a measured request, or a template rendered from inside another: nothing to add
+        if metrics is None or metrics.rendering:
+            return super().render(context, request)
+        metrics.rendering += 1
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.rendering -= 1
+            metrics.template_ms += (time.perf_counter() - start) * 1000
+
+
+class MeasuredDjangoTemplates(DjangoTemplates):
+    """The Django template backend, adding render time to the current request's metrics"""
+
+    def from_string(self, template_code):
+        return MeasuredTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return MeasuredTemplate(super().get_template(template_name).template, self)
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class MetricsStore:
+    """Rolling window of request samples per URL name"""
+    FIELDS = ('duration_ms', 'queries', 'sql_ms', 'template_ms', 'bytes')
+
+    def __init__(self, window):
+        self.samples = defaultdict(lambda: deque(maxlen=window))
+        self.lock = threading.Lock()
+
+    def add(self, url_name, sample):
+        with self.lock:
+            self.samples[url_name].append(sample)
+
+    def summary(self):
+        with self.lock:
+            snapshot = {url_name: list(samples) for url_name, samples in self.samples.items()}
+        summary = {}
+        for url_name, samples in sorted(snapshot.items()):
+            figures = {'count': len(samples)}
+            for i, field in enumerate(self.FIELDS):
+                ordered = sorted(sample[i] for sample in samples if sample[i] is not None)
+                figures[field] = {
+                    'p50': percentile(ordered, 0.5), 'p95': percentile(ordered, 0.95), 'max': ordered[-1],
+                } if ordered else None
+            summary[url_name] = figures
+        return summary
+
+    def clear(self):
+        with self.lock:
+            self.samples.clear()
+
+
+store = MetricsStore(getattr(settings, 'REQUEST_METRICS_WINDOW', 500))
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        self.attach(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            self.detach(metrics)
+            _current.reset(token)
+        self.record(request, response, metrics)
+        return response
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        # Connections are per thread: attach in the thread that runs this request's sync views and queries
+        await sync_to_async(self.attach)(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(self.detach)(metrics)
+            _current.reset(token)
+        self.record(request, response, metrics)
+        return response
+
+    def attach(self, metrics):
+        # Every alias, including those not connected yet: wrappers survive (re)connecting
+        metrics.connections = connections.all()
+        for connection in metrics.connections:
+            connection.execute_wrappers.append(metrics)
+
+    def detach(self, metrics):
+        for connection in metrics.connections:
+            if metrics in connection.execute_wrappers:
+                connection.execute_wrappers.remove(metrics)
+
+    def record(self, request, response, metrics):
+        match = request.resolver_match
+        url_name = match.view_name if match and match.view_name else 'unresolved'
+        duration_ms = (time.perf_counter() - metrics.started) * 1000
+        size = None if response.streaming else len(response.content)
+        store.add(url_name, (duration_ms, metrics.queries, metrics.sql_ms, metrics.template_ms, size))
+        logger.info(
+            f"request_metrics url_name={url_name} method={request.method} status={response.status_code} "
+            f"duration_ms={duration_ms:.1f} queries={metrics.queries} sql_ms={metrics.sql_ms:.1f} "
+            f"template_ms={metrics.template_ms:.1f} bytes={'-' if size is None else size}"
+        )
+
+        budget = settings.VIEW_QUERY_BUDGETS.get(url_name)
+        if budget is not None and metrics.queries > budget:
+            message = f"{url_name} ran {metrics.queries} queries, over its budget of {budget}"
+            if settings.QUERY_BUDGET_STRICT:
+                raise QueryBudgetExceeded(message)
+            logger.warning(f"query_budget_exceeded url_name={url_name} queries={metrics.queries} budget={budget}")
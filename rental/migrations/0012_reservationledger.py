@@ -0,0 +1,27 @@
+# Generated by Django 5.2.3 on 2026-10-17 02:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental', '0011_payment_receipt_number'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReservationLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('reserved', models.IntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='rental.product')),
+            ],
+            options={
+                'ordering': ['product', 'day'],
+                'unique_together': {('product', 'day')},
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.3 on 2026-10-17 03:05
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_paid_amount(apps, schema_editor):
+    RentalAgreement = apps.get_model('rental', 'RentalAgreement')
+    Payment = apps.get_model('rental', 'Payment')
+    paid = Payment.objects.filter(
+        rental_agreement=OuterRef('pk')
+    ).values('rental_agreement').annotate(total=Sum('amount')).values('total')
+    RentalAgreement.objects.update(
+        paid_amount=Coalesce(Subquery(paid), Value(Decimal('0.00')), output_field=models.DecimalField())
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental', '0012_reservationledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rentalagreement',
+            name='paid_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.RunPython(populate_paid_amount, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.3 on 2026-10-17 02:36
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental', '0013_rentalagreement_paid_amount'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='revenuereport',
+            name='expenses',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='revenuereport',
+            name='net_income',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.3 on 2026-10-17 02:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental', '0014_revenuereport_expenses_net_income'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('due', 'Due Tomorrow'), ('overdue', 'Overdue')], max_length=20)),
+                ('scheduled_for', models.DateField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sending', 'Sending'), ('sent', 'Sent'), ('failed', 'Failed'), ('skipped', 'Skipped')], default='pending', max_length=20)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('rental', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='rental.rentalagreement')),
+            ],
+            options={
+                'ordering': ['-scheduled_for', 'pk'],
+                'indexes': [models.Index(fields=['scheduled_for', 'status'], name='rental_noti_schedul_6b9e53_idx')],
+                'unique_together': {('rental', 'kind', 'scheduled_for')},
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.3 on 2026-10-17 02:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental', '0015_notificationoutbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SweepState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_run_at', models.DateTimeField(blank=True, null=True)),
+                ('last_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='rentalagreement',
+            index=models.Index(fields=['status', 'expected_return_date'], name='rental_rent_status_df9042_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.3 on 2026-10-17 02:57
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental', '0016_overdue_sweep'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['date', 'category'], name='expense_date_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['payment_status', 'issue_date'], name='invoice_status_issued_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['issue_date'], name='invoice_issue_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rentalagreement',
+            index=models.Index(condition=models.Q(('status', 'active')), fields=['expected_return_date'], name='rental_active_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rentalagreement',
+            index=models.Index(fields=['customer', 'status'], name='rental_customer_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rentalitem',
+            index=models.Index(fields=['product', 'rental'], name='rentalitem_product_rental_idx'),
+        ),
+    ]
@@ -0,0 +1,93 @@
+# Generated by Django 5.2.3 on 2026-10-17 03:05
+
+import django.db.models.deletion
+import rental.models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, models
+from django.db.utils import OperationalError
+
+# (model, fields with bm25 weight and PostgreSQL weight); keep in step with rental.search.SEARCH_FIELDS
+SEARCH_FIELDS = [
+    ('Product', (('name', 10.0, 'A'), ('sku', 5.0, 'A'), ('description', 1.0, 'C'))),
+    ('Customer', (('name', 10.0, 'A'), ('company', 5.0, 'B'), ('email', 2.0, 'C'), ('phone', 2.0, 'C'))),
+]
+
+
+def gin_index(model_name, fields):
+    vectors = [SearchVector(name, weight=weight, config='simple') for name, _, weight in fields]
+    vector = vectors[0]
+    for other in vectors[1:]:
+        vector = vector + other
+    return GinIndex(vector, name=f'{model_name.lower()}_search_idx')
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for model_name, fields in SEARCH_FIELDS:
+        model = apps.get_model('rental', model_name)
+        if vendor == 'postgresql':
+            schema_editor.add_index(model, gin_index(model_name, fields))
+        elif vendor == 'sqlite':
+            table = f'{model._meta.db_table}_fts'
+            columns = ', '.join(name for name, _, _ in fields)
+            values = ', '.join(f"COALESCE({name}, '')" for name, _, _ in fields)
+            weights = ', '.join(str(weight) for _, weight, _ in fields)
+            try:
+                schema_editor.execute(
+                    f"CREATE VIRTUAL TABLE \"{table}\" USING fts5({columns}, "
+                    f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+                )
+            except OperationalError:
+                # SQLite built without FTS5: search falls back to icontains
+                return
+            # Default ranking weighs the columns like SEARCH_FIELDS does
+            schema_editor.execute(f"INSERT INTO \"{table}\" (\"{table}\", rank) VALUES ('rank', 'bm25({weights})')")
+            schema_editor.execute(
+                f'INSERT INTO "{table}" (rowid, {columns}) SELECT id, {values} FROM "{model._meta.db_table}"'
+            )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for model_name, fields in SEARCH_FIELDS:
+        model = apps.get_model('rental', model_name)
+        if vendor == 'postgresql':
+            schema_editor.remove_index(model, gin_index(model_name, fields))
+        elif vendor == 'sqlite':
+            schema_editor.execute(f'DROP TABLE IF EXISTS "{model._meta.db_table}_fts"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental', '0017_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerSearchIndex',
+            fields=[
+                ('customer', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='rental.customer')),
+                ('document', rental.models.SearchDocumentField(db_column='rental_customer_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'rental_customer_fts',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductSearchIndex',
+            fields=[
+                ('product', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='rental.product')),
+                ('document', rental.models.SearchDocumentField(db_column='rental_product_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'rental_product_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
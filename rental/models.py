@@ -1,15 +1,23 @@
-from django.db import models
+from django.db import connection, models, transaction
 from django.core.validators import MinValueValidator, MaxValueValidator
 from decimal import Decimal
 from django.core.exceptions import ValidationError
 from django.utils import timezone
-import barcode
-from barcode.writer import ImageWriter
-from io import BytesIO
-from django.core.files import File
-from django.db.models import Sum, F
-from datetime import date
+from django.urls import reverse
+from django.db.models import Sum, Count, F, Max, OuterRef, Subquery, Case, When, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.lookups import GreaterThan, GreaterThanOrEqual
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+from datetime import date, timedelta
+from dateutil.relativedelta import relativedelta
 from django.conf import settings
+from . import search
+
+# Agreement statuses whose outstanding items hold stock on the reservation ledger
+RESERVING_STATUSES = ('active', 'overdue')
+
+VAT_RATE = Decimal('0.05')
 
 class ExpenseCategory(models.Model):
     CATEGORY_CHOICES = [
@@ -41,11 +49,16 @@ class Expense(models.Model):
     amount = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0.01)])
     product = models.ForeignKey('Product', on_delete=models.SET_NULL, null=True, blank=True, related_name='expenses')
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
 
     class Meta:
         ordering = ['-date']
         verbose_name_plural = "Expenses"
+        indexes = [
+            # Date-range listings and reports, optionally narrowed to a category
+            models.Index(fields=['date', 'category'], name='expense_date_category_idx'),
+        ]
 
     def __str__(self):
         return f"{self.date} - {self.category}: {self.description[:20]}"
@@ -56,7 +69,25 @@ class Expense(models.Model):
             user = get_user(self._request)
             if user.is_authenticated:
                 self.created_by = user
-        super().save(*args, **kwargs)
+
+        with transaction.atomic():
+            previous = None
+            if self.pk:
+                previous = Expense.objects.filter(pk=self.pk).values('date', 'amount').first()
+            super().save(*args, **kwargs)
+            if previous:
+                RevenueReport.apply(previous['date'], expenses=-previous['amount'])
+            RevenueReport.apply(self.expense_date, expenses=Decimal(str(self.amount)))
+
+    @property
+    def expense_date(self):
+        # ``date`` defaults to timezone.now, so it can still be a datetime before a refresh
+        return self._meta.get_field('date').to_python(self.date)
+
+class CustomerQuerySet(models.QuerySet):
+    def search(self, query):
+        """Customers matching every word of ``query`` as a prefix, see rental/search.py"""
+        return search.search(self, query)
 
 class Customer(models.Model):
     name = models.CharField(max_length=200)
@@ -73,6 +104,9 @@ class Customer(models.Model):
     )
     join_date = models.DateField(auto_now_add=True)
     notes = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = CustomerQuerySet.as_manager()
 
     class Meta:
         ordering = ['name']
@@ -100,6 +134,87 @@ class Customer(models.Model):
     def total_spent(self):
         return self.rentals.aggregate(total=Sum('total'))['total'] or Decimal('0.00')
 
+class DaysBetween(models.Func):
+    """Whole days from ``start`` to ``end`` for two date expressions"""
+    output_field = models.IntegerField()
+
+    def __init__(self, end, start, **extra):
+        super().__init__(end, start, **extra)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        # PostgreSQL and Oracle subtract dates natively
+        return super().as_sql(compiler, connection, template='(%(expressions)s)', arg_joiner=' - ', **extra_context)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler, connection,
+            template='CAST(julianday(%(expressions)s) AS INTEGER)',
+            arg_joiner=') - julianday(',
+            **extra_context
+        )
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, function='DATEDIFF', **extra_context)
+
+
+class ProductQuerySet(models.QuerySet):
+    def with_availability(self, start=None, end=None):
+        """Annotate ``rented_units`` and ``available_units`` for a window (default today) in the same query"""
+        today = timezone.localdate()
+        start = start or today
+        end = end or start
+
+        def booked(start, end):
+            peak = ReservationLedger.objects.filter(
+                product=OuterRef('pk'),
+                day__range=(start, end)
+            ).values('product').annotate(peak=Max('reserved')).values('peak')
+            return Coalesce(Subquery(peak, output_field=models.IntegerField()), 0)
+
+        if end < today:
+            rented = booked(start, end)
+        else:
+            # Units past their return date stay out, from today on, until they come back
+            overdue = ReservationLedger.overdue_items(today).filter(product=OuterRef('pk')).values('product').annotate(
+                units=Sum(F('quantity') - F('returned_quantity'))
+            ).values('units')
+            rented = booked(max(start, today), end) + Coalesce(Subquery(overdue, output_field=models.IntegerField()), 0)
+            if start < today:
+                rented = Greatest(booked(start, today - timedelta(days=1)), rented)
+        return self.annotate(
+            rented_units=rented,
+            available_units=F('stock') - F('rented_units'),
+        )
+
+    def with_performance(self):
+        """Annotate rental count, rental-days revenue, expenses and net profit.
+
+        Each figure is its own correlated subquery so rental items and
+        expenses are never joined against each other (which would multiply
+        both sums).
+        """
+        money = models.DecimalField(max_digits=14, decimal_places=2)
+        items = RentalItem.objects.filter(product=OuterRef('pk')).order_by().values('product')
+        expenses = Expense.objects.filter(product=OuterRef('pk')).order_by().values('product')
+        return self.annotate(
+            rental_count=Coalesce(Subquery(items.annotate(n=Count('pk')).values('n')), 0),
+            rental_revenue=Coalesce(
+                Subquery(items.annotate(total=Sum(RentalItem.revenue_expression())).values('total'), output_field=money),
+                Value(Decimal('0.00')),
+                output_field=money
+            ),
+            expenses_total=Coalesce(
+                Subquery(expenses.annotate(total=Sum('amount')).values('total'), output_field=money),
+                Value(Decimal('0.00')),
+                output_field=money
+            ),
+            net_profit=models.ExpressionWrapper(F('rental_revenue') - F('expenses_total'), output_field=money),
+        )
+
+    def search(self, query):
+        """Products matching every word of ``query`` as a prefix, see rental/search.py"""
+        return search.search(self, query)
+
 class Product(models.Model):
     CONDITION_CHOICES = [
         ('new', 'Brand New'),
@@ -175,10 +290,12 @@ class Product(models.Model):
             MaxValueValidator(timezone.now().year)
         ]
     )
+    # Legacy stored PNGs; barcode images are now rendered and cached by rental/barcodes.py
     barcode = models.ImageField(upload_to='barcodes/', blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
-    
+
+    objects = ProductQuerySet.as_manager()
 
     def clean(self):
         if self.is_outsourced:
@@ -210,30 +327,26 @@ class Product(models.Model):
     class Meta:
         ordering = ['name']
 
-    def save(self, *args, **kwargs):
-        if self.pk:
-            old = Product.objects.get(pk=self.pk)
-            if old.sku != self.sku and old.barcode:
-                old.barcode.delete(save=False)
-        
-        if not self.barcode and self.sku:
-            CODE128 = barcode.get_barcode_class('code128')
-            code = CODE128(self.sku, writer=ImageWriter())
-            buffer = BytesIO()
-            code.write(buffer)
-            self.barcode.save(f'{self.sku}.png', File(buffer), save=False)
-        super().save(*args, **kwargs)
+    def barcode_url(self, fmt='svg'):
+        """Image served (and cached on first request) by the barcode service, see rental/barcodes.py"""
+        return reverse('product_barcode', args=[self.sku, fmt])
     
+    def availability(self, start, end=None):
+        """Units free for the whole of ``start``..``end`` (inclusive), read from the reservation ledger"""
+        return self.stock - ReservationLedger.peak(self.pk, start, end or start)
+
     @property
     def rented_count(self):
-        return self.rental_items.filter(
-            returned_quantity__lt=F('quantity'),
-            rental__status='active'
-        ).aggregate(total=models.Sum('quantity'))['total'] or 0
+        # Prefer the figures from Product.objects.with_availability() when present
+        if hasattr(self, 'rented_units'):
+            return self.rented_units
+        return ReservationLedger.peak(self.pk, timezone.localdate())
     
     @property
     def available_stock(self):
-        return self.stock - self.rented_count
+        if hasattr(self, 'available_units'):
+            return self.available_units
+        return self.availability(timezone.localdate())
     
     @property
     def total_expenses(self):
@@ -244,10 +357,7 @@ class Product(models.Model):
         revenue = RentalItem.objects.filter(
             product=self
         ).aggregate(
-            total=Sum(
-                F('quantity') * F('rental_price') * F('agreement__rental_days'),
-                output_field=models.DecimalField()
-            )
+            total=Sum(RentalItem.revenue_expression())
         )['total'] or Decimal('0.00')
         return revenue - self.total_expenses
 
@@ -271,6 +381,7 @@ class RentalAgreement(models.Model):
     total = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     discount = models.DecimalField(max_digits=5, decimal_places=2, default=0)
     advance_payment = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    paid_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     balance_due = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active')
     apply_vat = models.BooleanField(default=True)
@@ -278,12 +389,70 @@ class RentalAgreement(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Overdue sweep and reminders: active agreements past a return date
+            models.Index(fields=['status', 'expected_return_date']),
+            # The same lookups, kept small by leaving returned/cancelled history out
+            # (backends without partial indexes fall back to the one above)
+            models.Index(
+                fields=['expected_return_date'],
+                condition=models.Q(status='active'),
+                name='rental_active_due_idx',
+            ),
+            # Per-customer rental counts on the customer pages
+            models.Index(fields=['customer', 'status'], name='rental_customer_status_idx'),
+        ]
+
+    # Maintained with F() deltas from item/payment writes, see apply_totals()
+    TOTALS_FIELDS = ('subtotal', 'vat', 'total', 'paid_amount', 'balance_due')
+    # Changing any of these re-prices the whole agreement
+    PRICING_FIELDS = ('start_date', 'expected_return_date', 'actual_return_date', 'discount', 'apply_vat')
+
     @property
     def rental_days(self):
         if self.actual_return_date:
             return (self.actual_return_date - self.start_date).days + 1
         return (self.expected_return_date - self.start_date).days + 1
     
+    def save(self, *args, **kwargs):
+        """Save the agreement, moving its ledger bookings and re-pricing it as needed.
+
+        Saving an existing agreement never writes TOTALS_FIELDS unless they are
+        named in ``update_fields``: values assigned to them are discarded. They
+        change through item and payment saves (apply_totals()) or, after a
+        change to PRICING_FIELDS, update_totals().
+        """
+        previous = None
+        if self.pk and not self._state.adding:
+            previous = RentalAgreement.objects.filter(pk=self.pk).values(
+                'status', *self.PRICING_FIELDS
+            ).first()
+            if kwargs.get('update_fields') is None:
+                # Never write back a possibly stale copy of the delta-maintained totals
+                kwargs['update_fields'] = [
+                    f.name for f in self._meta.concrete_fields
+                    if not f.primary_key and f.name not in self.TOTALS_FIELDS
+                ]
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if not previous:
+                return
+
+            booking = ('status', 'start_date', 'expected_return_date')
+            if any(previous[f] != getattr(self, f) for f in booking):
+                # Dates or status moved: shift every item's booking on the ledger
+                for item in self.items.all():
+                    old = ReservationLedger.span(
+                        item.product_id, item.outstanding_quantity, previous['status'],
+                        previous['start_date'], previous['expected_return_date']
+                    )
+                    item.sync_reservation(old)
+
+            if any(previous[f] != getattr(self, f) for f in self.PRICING_FIELDS):
+                self.update_totals()
+
     def get_daily_rate_for_product(self, product_id):
         """Get the daily rate for a specific product in this rental"""
         item = self.items.filter(product_id=product_id).first()
@@ -292,11 +461,18 @@ class RentalAgreement(models.Model):
         return Decimal('0.00')
     
     def update_totals(self):
-        """Update all financial calculations"""
-        self.subtotal = sum(item.total_price for item in self.items.all())
+        """Recompute the stored totals from scratch.
+
+        Normal writes keep the totals current through apply_totals(); this is the
+        repair path used when pricing inputs change and by recompute_totals.
+        """
+        line_total = self.items.aggregate(
+            total=Sum(F('rental_price') * F('quantity'))
+        )['total'] or Decimal('0.00')
+        self.subtotal = line_total * self.rental_days
         
         if self.apply_vat:
-            self.vat = self.subtotal * Decimal('0.05')
+            self.vat = self.subtotal * VAT_RATE
         else:
             self.vat = Decimal('0.00')
             
@@ -309,11 +485,52 @@ class RentalAgreement(models.Model):
         )['total'] or Decimal('0.00')
         
         self.balance_due = max(Decimal('0.00'), self.total - self.paid_amount)
-        self.save()
+        # update() skips auto_now: set updated_at so cached fragments of these rows expire
+        now = timezone.now()
+        RentalAgreement.objects.filter(pk=self.pk).update(
+            **{field: getattr(self, field) for field in self.TOTALS_FIELDS}, updated_at=now
+        )
         
         # Update related invoice if exists
-        if hasattr(self, 'invoice'):
-            self.invoice.update_payment_status()
+        Invoice.objects.filter(rental_agreement_id=self.pk).update(
+            paid_amount=self.paid_amount,
+            payment_status=Invoice.status_expression(Value(self.paid_amount)),
+            updated_at=now
+        )
+
+    @classmethod
+    def apply_totals(cls, pk, subtotal_delta=Decimal('0.00'), paid_delta=Decimal('0.00')):
+        """Shift the stored totals of agreement ``pk`` by the given deltas in two UPDATEs.
+
+        Every column is derived from the row being updated, so concurrent writers
+        can't lose each other's changes.
+        """
+        subtotal_delta, paid_delta = Decimal(subtotal_delta), Decimal(paid_delta)
+        if not (subtotal_delta or paid_delta):
+            return
+
+        subtotal = F('subtotal') + Value(subtotal_delta)
+        paid = F('paid_amount') + Value(paid_delta)
+        vat = Case(When(apply_vat=True, then=subtotal * Value(VAT_RATE)), default=Value(Decimal('0.00')))
+        # Multiply rather than divide: SQLite stores whole-number decimals as integers
+        total = subtotal - subtotal * F('discount') * Value(Decimal('0.01')) + vat
+        now = timezone.now()
+        cls.objects.filter(pk=pk).update(
+            subtotal=subtotal,
+            vat=vat,
+            total=total,
+            paid_amount=paid,
+            balance_due=Greatest(total - paid, Value(Decimal('0.00'))),
+            updated_at=now,
+        )
+
+        if paid_delta:
+            invoice_paid = F('paid_amount') + Value(paid_delta)
+            Invoice.objects.filter(rental_agreement_id=pk).update(
+                paid_amount=invoice_paid,
+                payment_status=Invoice.status_expression(invoice_paid),
+                updated_at=now
+            )
 
     def total_days(self):
         if self.actual_return_date:
@@ -325,7 +542,7 @@ class RentalAgreement(models.Model):
 
     @property
     def is_overdue(self):
-        return self.status == 'active' and timezone.now().date() > self.expected_return_date
+        return self.status in RESERVING_STATUSES and timezone.now().date() > self.expected_return_date
 
     def __str__(self):
         return f"Rental #{self.id} - {self.customer.name}"
@@ -344,31 +561,98 @@ class RentalItem(models.Model):
     def total_price(self):
         return self.rental_price * self.quantity * self.rental.rental_days
 
+    @staticmethod
+    def revenue_expression():
+        """``total_price`` as a database expression, matching ``RentalAgreement.rental_days``"""
+        rental_days = DaysBetween(
+            Coalesce('rental__actual_return_date', 'rental__expected_return_date'),
+            'rental__start_date'
+        ) + 1
+        return models.ExpressionWrapper(
+            F('rental_price') * F('quantity') * rental_days,
+            output_field=models.DecimalField(max_digits=14, decimal_places=2)
+        )
+
     @property
     def is_returned(self):
         return self.returned_quantity >= self.quantity
 
+    @property
+    def outstanding_quantity(self):
+        return max(0, self.quantity - self.returned_quantity)
+
+    def reservation(self):
+        """The (product_id, start, end, units) span this item holds on the ledger, or None"""
+        rental = self.rental
+        return ReservationLedger.span(
+            self.product_id, self.outstanding_quantity, rental.status,
+            rental.start_date, rental.expected_return_date
+        )
+
+    def sync_reservation(self, old):
+        """Move this item's ledger booking from ``old`` to its current span, refusing to overbook"""
+        new = self.reservation()
+        ReservationLedger.move(old, new)
+        if ReservationLedger.grows(old, new):
+            product_id, start, end, units = new
+            peak = ReservationLedger.peak(product_id, start, end)
+            if peak > self.product.stock:
+                free = self.product.stock - (peak - units)
+                raise ValidationError(
+                    f"Only {max(free, 0)} of {self.product.name} available between {start} and {end}"
+                )
+
     def __str__(self):
         return f"{self.product.name} ({self.quantity}) in Rental #{self.rental.id}"
 
     class Meta:
         ordering = ['rental__start_date']
+        indexes = [
+            # A product's rentals joined to their agreement without touching the item rows
+            models.Index(fields=['product', 'rental'], name='rentalitem_product_rental_idx'),
+        ]
 
     def clean(self):
         if not self.product_id:
             raise ValidationError("Product must be selected")
         if self.product and not self.product.is_rentable:
             raise ValidationError("This product is not available for rent")
-        if self.quantity > self.product.available_stock and not self.is_returned:
-            raise ValidationError(f"Only {self.product.available_stock} available in stock")
-    
+        if self.is_returned:
+            return
 
+        if self.rental_id:
+            start, end = self.rental.start_date, self.rental.expected_return_date
+        else:
+            start = end = timezone.localdate()
+        available = self.product.availability(start, end)
+        if self.pk:
+            # Don't count this item's own booking against itself when editing
+            previous = RentalItem.objects.select_related('rental').filter(pk=self.pk).first()
+            span = previous.reservation() if previous else None
+            if span and span[0] == self.product_id:
+                available += span[3]
+        if self.quantity > available:
+            raise ValidationError(f"Only {available} available in stock")
 
     def save(self, *args, **kwargs):
         if not self.rental_price:
             # Use the effective rental price from the product
             self.rental_price = self.product.effective_rental_price
-        super().save(*args, **kwargs)
+
+        with transaction.atomic():
+            old, previous = None, None
+            if self.pk:
+                previous = RentalItem.objects.select_related('rental').filter(pk=self.pk).first()
+                old = previous.reservation() if previous else None
+            super().save(*args, **kwargs)
+            self.sync_reservation(old)
+
+            if previous and previous.rental_id != self.rental_id:
+                RentalAgreement.apply_totals(previous.rental_id, subtotal_delta=-previous.total_price)
+                RentalAgreement.apply_totals(self.rental_id, subtotal_delta=self.total_price)
+            else:
+                old_total = previous.total_price if previous else Decimal('0.00')
+                RentalAgreement.apply_totals(self.rental_id, subtotal_delta=self.total_price - old_total)
 
     def calculate_profit(self):
         if self.product.is_outsourced:
@@ -387,6 +671,101 @@ class RentalItem(models.Model):
     def __str__(self):
         return f"{self.product.name if self.product_id else 'Unknown Product'} x{self.quantity}"
 
+class ReservationLedger(models.Model):
+    """Units of a product booked out on a given day.
+
+    Kept in step with RentalItem and RentalAgreement saves so availability over
+    any window is one indexed range read instead of a scan of rental history.
+
+    An item books ``start_date``..``expected_return_date``. Units still out
+    after that date aren't on the ledger: they are counted by ``peak()`` as
+    booked on every day from today on, until they are returned.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    day = models.DateField()
+    reserved = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('product', 'day')
+        ordering = ['product', 'day']
+
+    def __str__(self):
+        return f"{self.product_id} on {self.day}: {self.reserved}"
+
+    @staticmethod
+    def span(product_id, units, status, start_date, end_date):
+        if units <= 0 or status not in RESERVING_STATUSES or not (start_date and end_date):
+            return None
+        return (product_id, start_date, end_date, units)
+
+    @staticmethod
+    def grows(old, new):
+        """True if ``new`` books anything on a day/product that ``old`` did not"""
+        if not new:
+            return False
+        if not old or old[0] != new[0]:
+            return True
+        return new[3] > old[3] or new[1] < old[1] or new[2] > old[2]
+
+    @staticmethod
+    def overdue_items(today=None):
+        """Items with units still out past their agreement's return date"""
+        return RentalItem.objects.filter(
+            rental__status__in=RESERVING_STATUSES,
+            rental__expected_return_date__lt=today or timezone.localdate(),
+            returned_quantity__lt=F('quantity'),
+        ).order_by()
+
+    @classmethod
+    def peak(cls, product_id, start, end=None):
+        """Highest number of units booked on any day in ``start``..``end``"""
+        end = end or start
+        today = timezone.localdate()
+        if end < today:
+            return cls.booked(product_id, start, end)
+        overdue = cls.overdue_items(today).filter(product_id=product_id).aggregate(
+            units=Sum(F('quantity') - F('returned_quantity'))
+        )['units'] or 0
+        peak = cls.booked(product_id, max(start, today), end) + overdue
+        if start < today:
+            peak = max(peak, cls.booked(product_id, start, today - timedelta(days=1)))
+        return peak
+
+    @classmethod
+    def booked(cls, product_id, start, end):
+        """Highest number of units on the ledger on any day in ``start``..``end``"""
+        return cls.objects.filter(
+            product_id=product_id,
+            day__range=(start, end)
+        ).aggregate(peak=Max('reserved'))['peak'] or 0
+
+    @classmethod
+    def adjust(cls, product_id, start, end, delta):
+        if not delta or start > end:
+            return
+        days = (end - start).days + 1
+        cls.objects.bulk_create(
+            [cls(product_id=product_id, day=start + timedelta(days=n)) for n in range(days)],
+            ignore_conflicts=True
+        )
+        cls.objects.filter(
+            product_id=product_id,
+            day__range=(start, end)
+        ).update(reserved=F('reserved') + delta)
+
+    @classmethod
+    def move(cls, old, new):
+        if old == new:
+            return
+        if old and new and old[:3] == new[:3]:
+            cls.adjust(*new[:3], new[3] - old[3])
+            return
+        if old:
+            cls.adjust(*old[:3], -old[3])
+        if new:
+            cls.adjust(*new)
+
+
 class Invoice(models.Model):
     PAYMENT_STATUS_CHOICES = [
         ('paid', 'Paid'),
@@ -409,6 +788,15 @@ class Invoice(models.Model):
         choices=PAYMENT_STATUS_CHOICES,
         default='unpaid'
     )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Outstanding (unpaid/partial) invoices, optionally before a date
+            models.Index(fields=['payment_status', 'issue_date'], name='invoice_status_issued_idx'),
+            # Revenue for a month or year, and the newest-first listings
+            models.Index(fields=['issue_date'], name='invoice_issue_date_idx'),
+        ]
     
     def update_payment_status(self):
         """Update status based on payments"""
@@ -420,6 +808,15 @@ class Invoice(models.Model):
             self.payment_status = 'unpaid'
         self.save()
 
+    @staticmethod
+    def status_expression(paid):
+        """SQL equivalent of update_payment_status() for a paid amount expression"""
+        return Case(
+            When(GreaterThanOrEqual(paid, F('total_amount')), then=Value('paid')),
+            When(GreaterThan(paid, Value(Decimal('0.00'))), then=Value('partial')),
+            default=Value('unpaid'),
+        )
+
 class InvoiceLineItem(models.Model):
     ITEM_TYPE_CHOICES = [
         ('rental', 'Rental Charge'),
@@ -463,6 +860,7 @@ class Payment(models.Model):
         on_delete=models.SET_NULL,
         null=True
     )
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-payment_date']
@@ -470,15 +868,43 @@ class Payment(models.Model):
     def save(self, *args, **kwargs):
         if not self.receipt_number:
             self.receipt_number = f"PYMT-{timezone.now().strftime('%Y%m%d%H%M%S')}"
-        super().save(*args, **kwargs)
-        self.rental_agreement.update_totals()
+
+        with transaction.atomic():
+            previous = None
+            if self.pk:
+                previous = Payment.objects.filter(pk=self.pk).values(
+                    'rental_agreement_id', 'amount', 'payment_date'
+                ).first()
+            super().save(*args, **kwargs)
+
+            amount = Decimal(str(self.amount))
+            if previous and previous['rental_agreement_id'] != self.rental_agreement_id:
+                RentalAgreement.apply_totals(previous['rental_agreement_id'], paid_delta=-previous['amount'])
+                RentalAgreement.apply_totals(self.rental_agreement_id, paid_delta=amount)
+            else:
+                RentalAgreement.apply_totals(
+                    self.rental_agreement_id,
+                    paid_delta=amount - (previous['amount'] if previous else Decimal('0.00'))
+                )
+
+            payment_date = self._meta.get_field('payment_date').to_python(self.payment_date)
+            if previous:
+                RevenueReport.apply(previous['payment_date'], income=-previous['amount'])
+            RevenueReport.apply(payment_date, income=amount)
 
 class RevenueReport(models.Model):
+    """Monthly income/expense rollup.
+
+    Kept current by Payment and Expense writes (see apply()); rebuild it with
+    manage.py rebuild_revenue_reports after bulk loads.
+    """
     month = models.PositiveSmallIntegerField()
     year = models.PositiveSmallIntegerField()
     rental_income = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
     other_income = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
     total_income = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    expenses = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    net_income = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -489,6 +915,41 @@ class RevenueReport(models.Model):
     def __str__(self):
         return f"{self.month}/{self.year} - ${self.total_income}"
 
+    @property
+    def period_start(self):
+        return date(self.year, self.month, 1)
+
+    @classmethod
+    def apply(cls, day, income=Decimal('0.00'), expenses=Decimal('0.00')):
+        """Add ``income``/``expenses`` (either may be negative) to the month containing ``day``"""
+        if not (income or expenses):
+            return
+        income, expenses = Decimal(income), Decimal(expenses)
+        cls.objects.bulk_create([cls(month=day.month, year=day.year)], ignore_conflicts=True)
+        cls.objects.filter(month=day.month, year=day.year).update(
+            rental_income=F('rental_income') + income,
+            total_income=F('total_income') + income,
+            expenses=F('expenses') + expenses,
+            net_income=F('net_income') + (income - expenses),
+            updated_at=timezone.now(),
+        )
+
+    @classmethod
+    def series(cls, first, last):
+        """One report per month from ``first`` to ``last`` inclusive, zero-filled, read in one query"""
+        first, last = first.replace(day=1), last.replace(day=1)
+        rows = cls.objects.filter(year__gte=first.year, year__lte=last.year)
+        by_month = {(row.year, row.month): row for row in rows}
+
+        reports = []
+        current = first
+        while current <= last:
+            reports.append(
+                by_month.get((current.year, current.month)) or cls(year=current.year, month=current.month)
+            )
+            current += relativedelta(months=1)
+        return reports
+
     @classmethod
     def get_current_month_report(cls):
         now = timezone.now()
@@ -501,4 +962,152 @@ class RevenueReport(models.Model):
                 'total_income': Decimal('0.00')
             }
         )
-        return report
\ No newline at end of file
+        return report
+
+
+class SearchDocumentField(models.TextField):
+    """The hidden column named after an FTS5 table, which MATCHes against all of its columns"""
+
+
+@SearchDocumentField.register_lookup
+class Match(models.Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', [*lhs_params, *rhs_params]
+
+
+class ProductSearchIndex(models.Model):
+    """A product's row in the rental_product_fts table (SQLite only), maintained by rental/search.py"""
+    product = models.OneToOneField(
+        Product, primary_key=True, db_column='rowid', on_delete=models.DO_NOTHING,
+        db_constraint=False, related_name='search_index'
+    )
+    document = SearchDocumentField(db_column='rental_product_fts')
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'rental_product_fts'
+
+
+class CustomerSearchIndex(models.Model):
+    """A customer's row in the rental_customer_fts table (SQLite only), maintained by rental/search.py"""
+    customer = models.OneToOneField(
+        Customer, primary_key=True, db_column='rowid', on_delete=models.DO_NOTHING,
+        db_constraint=False, related_name='search_index'
+    )
+    document = SearchDocumentField(db_column='rental_customer_fts')
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'rental_customer_fts'
+
+
+class SweepState(models.Model):
+    """Bookkeeping for a periodic sweep: when it last ran and what it changed"""
+    name = models.CharField(max_length=50, unique=True)
+    last_run_at = models.DateTimeField(null=True, blank=True)
+    last_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} (last run {self.last_run_at})"
+
+
+class NotificationOutbox(models.Model):
+    """One customer notification per agreement, kind and day, and how its delivery went.
+
+    Rows are enqueued idempotently, so re-running the daily job never adds a
+    second reminder, and workers claim pending or failed rows in batches so
+    each message is sent by exactly one of them.
+    """
+    KIND_CHOICES = [
+        ('due', 'Due Tomorrow'),
+        ('overdue', 'Overdue'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+        ('skipped', 'Skipped'),
+    ]
+    # Failed rows are retried until they've been attempted this many times
+    MAX_ATTEMPTS = 5
+    # A batch still 'sending' after this long belongs to a worker that died
+    CLAIM_TIMEOUT = timedelta(minutes=30)
+
+    rental = models.ForeignKey(RentalAgreement, on_delete=models.CASCADE, related_name='notifications')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    scheduled_for = models.DateField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('rental', 'kind', 'scheduled_for')
+        indexes = [models.Index(fields=['scheduled_for', 'status'])]
+        ordering = ['-scheduled_for', 'pk']
+
+    def __str__(self):
+        return f"{self.get_kind_display()} for rental #{self.rental_id} on {self.scheduled_for}: {self.status}"
+
+    @classmethod
+    def enqueue(cls, kind, rental_ids, day):
+        """Add a pending row per agreement; ones already queued for ``day`` are left alone"""
+        cls.objects.bulk_create(
+            [cls(rental_id=rental_id, kind=kind, scheduled_for=day) for rental_id in rental_ids],
+            ignore_conflicts=True,
+            batch_size=500,
+        )
+
+    @classmethod
+    def claimable(cls, day):
+        now = timezone.now()
+        return cls.objects.filter(scheduled_for=day).filter(
+            models.Q(status='pending')
+            | models.Q(status='failed', attempts__lt=cls.MAX_ATTEMPTS)
+            | models.Q(status='sending', claimed_at__lt=now - cls.CLAIM_TIMEOUT)
+        )
+
+    @classmethod
+    def claim(cls, day, limit):
+        """Mark up to ``limit`` deliverable rows for ``day`` as 'sending' and return them.
+
+        Rows other workers hold locks on are skipped where the database
+        supports it; either way the conditional UPDATE only takes rows that
+        are still claimable, so two workers never get the same row.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            candidates = cls.claimable(day).order_by('pk')
+            if connection.features.has_select_for_update_skip_locked:
+                candidates = candidates.select_for_update(skip_locked=True)
+            ids = list(candidates.values_list('pk', flat=True)[:limit])
+            cls.claimable(day).filter(pk__in=ids).update(
+                status='sending', claimed_at=now, attempts=F('attempts') + 1
+            )
+        return list(cls.objects.filter(pk__in=ids, status='sending', claimed_at=now).order_by('pk'))
+
+
+@receiver(pre_delete, sender=RentalItem)
+def release_rental_item(sender, instance, **kwargs):
+    ReservationLedger.move(instance.reservation(), None)
+    RentalAgreement.apply_totals(instance.rental_id, subtotal_delta=-instance.total_price)
+
+
+@receiver(pre_delete, sender=Payment)
+def reverse_payment(sender, instance, **kwargs):
+    RentalAgreement.apply_totals(instance.rental_agreement_id, paid_delta=-instance.amount)
+    RevenueReport.apply(instance.payment_date, income=-instance.amount)
+
+
+@receiver(pre_delete, sender=Expense)
+def reverse_expense(sender, instance, **kwargs):
+    RevenueReport.apply(instance.expense_date, expenses=-instance.amount)
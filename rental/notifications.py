@@ -0,0 +1,181 @@
+"""Customer e-mail reminders for rentals due back tomorrow and rentals overdue.
+
+Rentals are loaded with their customer and items in a fixed number of
+queries per batch, every message is built up front as an ``EmailMessage``,
+and the whole batch goes out over a single mail connection. Each message
+is sent on its own so one bad address or dropped connection is recorded
+against that rental instead of aborting the rest of the batch.
+
+Deliveries go through the ``NotificationOutbox`` table: the daily job
+enqueues one row per agreement and kind, and workers claim rows in
+batches (see ``deliver_batch``), so a retry or a second worker never
+repeats a message that already went out.
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import RESERVING_STATUSES, NotificationOutbox, RentalAgreement
+
+logger = logging.getLogger(__name__)
+
+FROM_EMAIL = 'noreply@axeglobal.com'
+BILLING_EMAIL = 'billing@axeglobal.com'
+
+# kind: (subject, template, extra recipients)
+REMINDERS = {
+    'due': ("Equipment Return Reminder - Rental #{id}", 'rental/emails/return_reminder.txt', ()),
+    'overdue': ("Overdue Equipment - Rental #{id}", 'rental/emails/overdue_notification.txt', (BILLING_EMAIL,)),
+}
+
+
+class SendResult:
+    def __init__(self, kind):
+        self.kind = kind
+        self.sent = []
+        self.failed = []
+
+    def add_failure(self, rental_id, error):
+        self.failed.append({'rental': rental_id, 'error': error})
+
+    def as_dict(self):
+        return {'kind': self.kind, 'sent': len(self.sent), 'failed': self.failed}
+
+
+def due_rentals(kind, today=None):
+    """Agreements that should get a ``kind`` reminder today"""
+    today = today or timezone.now().date()
+    if kind == 'due':
+        return RentalAgreement.objects.filter(expected_return_date=today + timedelta(days=1), status='active')
+    if kind == 'overdue':
+        # The nightly sweep flips these to 'overdue'; they still need chasing
+        return RentalAgreement.objects.filter(expected_return_date__lt=today, status__in=RESERVING_STATUSES)
+    raise ValueError(f"Unknown reminder kind {kind}")
+
+
+def reminder_context(kind, rental, today):
+    context = {'rental': rental, 'customer': rental.customer}
+    if kind == 'overdue':
+        days_overdue = (today - rental.expected_return_date).days
+        daily_rate = sum((item.rental_price * item.quantity for item in rental.items.all()), 0)
+        context.update(days_overdue=days_overdue, overdue_fees=daily_rate * days_overdue)
+    return context
+
+
+def build_message(kind, rental, today=None, connection=None):
+    """The ``EmailMessage`` for one rental, or None if the customer has no address"""
+    if not rental.customer.email:
+        return None
+    subject, template, extra = REMINDERS[kind]
+    body = render_to_string(template, reminder_context(kind, rental, today or timezone.now().date()))
+    return EmailMessage(
+        subject.format(id=rental.id),
+        body,
+        FROM_EMAIL,
+        [rental.customer.email, *extra],
+        connection=connection,
+    )
+
+
+def send_reminders(kind, rental_ids, today=None):
+    """Send ``kind`` reminders for the given agreements over one connection"""
+    today = today or timezone.now().date()
+    result = SendResult(kind)
+    rentals = RentalAgreement.objects.filter(pk__in=rental_ids).select_related('customer').prefetch_related(
+        'items__product'
+    ).order_by('pk')
+
+    connection = get_connection(fail_silently=False)
+    messages = []
+    for rental in rentals:
+        try:
+            message = build_message(kind, rental, today, connection)
+        except Exception as e:
+            result.add_failure(rental.pk, f"Could not render message: {e}")
+            continue
+        if message is None:
+            result.add_failure(rental.pk, "Customer has no e-mail address")
+            continue
+        messages.append((rental.pk, message))
+
+    if not messages:
+        return result
+    try:
+        connection.open()
+    except Exception as e:
+        for rental_id, _ in messages:
+            result.add_failure(rental_id, f"Could not connect to mail server: {e}")
+        return result
+    try:
+        for rental_id, message in messages:
+            try:
+                connection.send_messages([message])
+            except Exception as e:
+                result.add_failure(rental_id, str(e))
+                # A failed SMTP conversation can leave the session unusable; reconnect for
+                # the rest (if that fails too, each send retries and records its own error)
+                connection.close()
+                try:
+                    connection.open()
+                except Exception:
+                    pass
+            else:
+                result.sent.append(rental_id)
+    finally:
+        connection.close()
+
+    for failure in result.failed:
+        logger.warning(f"{kind} reminder for rental {failure['rental']} not sent: {failure['error']}")
+    return result
+
+
+def enqueue(today=None):
+    """Queue today's reminders in the outbox; returns how many agreements each kind covers"""
+    today = today or timezone.now().date()
+    queued = {}
+    for kind in REMINDERS:
+        rental_ids = list(due_rentals(kind, today).values_list('pk', flat=True))
+        NotificationOutbox.enqueue(kind, rental_ids, today)
+        queued[kind] = len(rental_ids)
+    return queued
+
+
+def deliver_batch(today=None, limit=None):
+    """Claim up to ``limit`` outbox rows for ``today``, send them and record the outcome.
+
+    Returns a dict of sent/failed/skipped counts; an empty claim means the
+    outbox is drained.
+    """
+    today = today or timezone.now().date()
+    rows = NotificationOutbox.claim(today, limit or settings.REMINDER_BATCH_SIZE)
+    counts = {'sent': 0, 'failed': 0, 'skipped': 0}
+    if not rows:
+        return counts
+
+    by_kind = defaultdict(list)
+    for row in rows:
+        by_kind[row.kind].append(row)
+    now = timezone.now()
+    for kind, kind_rows in by_kind.items():
+        rental_ids = [row.rental_id for row in kind_rows]
+        # Agreements returned since the rows were queued no longer need chasing
+        still_due = set(due_rentals(kind, today).filter(pk__in=rental_ids).values_list('pk', flat=True))
+        result = send_reminders(kind, [rental_id for rental_id in rental_ids if rental_id in still_due], today)
+        sent = set(result.sent)
+        errors = {failure['rental']: failure['error'] for failure in result.failed}
+        for row in kind_rows:
+            if row.rental_id not in still_due:
+                row.status = 'skipped'
+            elif row.rental_id in sent:
+                row.status, row.sent_at, row.last_error = 'sent', now, ''
+            else:
+                row.status = 'failed'
+                row.last_error = errors.get(row.rental_id, "Not sent")
+            counts[row.status] += 1
+    NotificationOutbox.objects.bulk_update(rows, ['status', 'sent_at', 'last_error'])
+    return counts
@@ -0,0 +1,57 @@
+"""Moving active agreements past their return date to 'overdue'.
+
+Shared by the nightly ``mark_overdue`` Celery task and the
+``update_overdue`` management command. Candidates are read from the
+partial index on active agreements' return dates and updated in bounded
+batches, so the sweep never scans or locks the whole agreements table.
+
+Swept agreements leave that index, so each run reads only what has fallen
+due since the last one plus anything entered or edited with a return date
+already in the past.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import fragment_cache
+from .models import RentalAgreement, SweepState
+from .stats import DashboardStats
+
+logger = logging.getLogger(__name__)
+
+SWEEP_NAME = 'mark_overdue'
+
+
+def mark_overdue(today=None, batch_size=None):
+    """Mark every active agreement due back before ``today`` as overdue; returns how many changed"""
+    today = today or timezone.now().date()
+    batch_size = batch_size or settings.OVERDUE_SWEEP_BATCH_SIZE
+    started = time.monotonic()
+    state, _ = SweepState.objects.get_or_create(name=SWEEP_NAME)
+
+    candidates = RentalAgreement.objects.filter(status='active', expected_return_date__lt=today)
+    count = 0
+    while True:
+        ids = list(candidates.order_by('expected_return_date', 'pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            break
+        # Re-check the status so a rental returned mid-sweep isn't flipped back
+        count += RentalAgreement.objects.filter(pk__in=ids, status='active').update(
+            status='overdue', updated_at=timezone.now()
+        )
+        if len(ids) < batch_size:
+            break
+
+    state.last_run_at = timezone.now()
+    state.last_count = count
+    state.save()
+
+    if count:
+        DashboardStats.invalidate()
+        fragment_cache.bump(RentalAgreement)
+    logger.info(
+        f"overdue_sweep count={count} duration_ms={(time.monotonic() - started) * 1000:.0f}"
+    )
+    return count
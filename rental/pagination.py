@@ -0,0 +1,171 @@
+"""Keyset (cursor) pagination for the long list views.
+
+Instead of ``OFFSET n`` plus a ``COUNT(*)`` per page, each page is read
+with a ``WHERE`` on the ordering columns of the last (or first) row shown,
+so page 5000 costs the same as page 1 and uses the same index. Links carry
+an opaque cursor encoding those column values; the ordering always ends in
+the primary key so it is total.
+
+Counting is optional and capped: ``approximate_count_limit`` rows are
+counted at most, and larger results are shown as "N+".
+"""
+import base64
+import binascii
+import json
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from django.http import Http404
+
+CURSOR_PARAM = 'cursor'
+
+
+def encode_cursor(direction, values):
+    payload = json.dumps([direction, values], default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """``(direction, values)`` from a cursor; ValueError if it has been tampered with"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        direction, values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (binascii.Error, UnicodeError, TypeError, ValueError):
+        raise ValueError("Malformed cursor")
+    if direction not in ('next', 'prev') or not isinstance(values, list):
+        raise ValueError("Malformed cursor")
+    return direction, values
+
+
+def parse_ordering(ordering):
+    """``[(field, descending), ...]`` from ``('-created_at', '-pk')`` style ordering"""
+    return [(field.lstrip('-'), field.startswith('-')) for field in ordering]
+
+
+def after(fields, values, reverse=False):
+    """Q matching rows that sort after ``values`` (before them with ``reverse``).
+
+    For ``a DESC, b DESC`` that is ``a < x OR (a = x AND b < y)``.
+    """
+    clauses = []
+    for i, (field, descending) in enumerate(fields):
+        lookup = 'lt' if descending != reverse else 'gt'
+        equal = {name: value for (name, _), value in zip(fields[:i], values)}
+        clauses.append(Q(**equal, **{f'{field}__{lookup}': values[i]}))
+    return reduce(or_, clauses)
+
+
+class KeysetPage:
+    """Stand-in for Django's ``Page`` with cursor links instead of page numbers"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None, count=None, count_is_exact=True):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.count = count
+        self.count_is_exact = count_is_exact
+        self.next_url = self.previous_url = self.first_url = None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginationMixin:
+    """Cursor pagination for a ``ListView``.
+
+    Set ``keyset_ordering`` to the list's ordering, ending in ``pk`` (and
+    ideally matching an index). Templates get ``page_obj`` with
+    ``next_url``/``previous_url``/``first_url`` and can include
+    ``rental/includes/pagination.html``.
+    """
+    keyset_ordering = ('-created_at', '-pk')
+    # Count at most this many rows for the "N results" label; None skips counting
+    approximate_count_limit = None
+
+    def get_keyset_ordering(self):
+        return self.keyset_ordering
+
+    @staticmethod
+    def cursor_value(model, name, value):
+        if name == 'pk':
+            return model._meta.pk.to_python(value)
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            # An annotation such as search_rank: JSON has kept its type
+            if value is not None and not isinstance(value, (int, float, str)):
+                raise ValueError("Malformed cursor")
+            return value
+        return field.to_python(value)
+
+    def paginate_queryset(self, queryset, page_size):
+        ordering = list(self.get_keyset_ordering())
+        fields = parse_ordering(ordering)
+        direction, values = 'next', None
+        cursor = self.request.GET.get(CURSOR_PARAM)
+        if cursor:
+            try:
+                direction, values = decode_cursor(cursor)
+                if len(values) != len(fields):
+                    raise ValueError("Malformed cursor")
+                values = [self.cursor_value(queryset.model, name, value) for (name, _), value in zip(fields, values)]
+            except (ValueError, ValidationError, LookupError):
+                raise Http404("Invalid page cursor")
+
+        page_queryset = queryset
+        if direction == 'prev':
+            reversed_ordering = [name if descending else f'-{name}' for name, descending in fields]
+            if values is not None:
+                page_queryset = page_queryset.filter(after(fields, values, reverse=True))
+            rows = list(page_queryset.order_by(*reversed_ordering)[:page_size + 1])
+            more_before = len(rows) > page_size
+            rows = rows[:page_size][::-1]
+            has_next, has_previous = values is not None, more_before
+        else:
+            if values is not None:
+                page_queryset = page_queryset.filter(after(fields, values))
+            rows = list(page_queryset.order_by(*ordering)[:page_size + 1])
+            has_next = len(rows) > page_size
+            rows = rows[:page_size]
+            has_previous = values is not None
+
+        def key(row):
+            return [getattr(row, name) for name, _ in fields]
+
+        page = KeysetPage(
+            rows,
+            next_cursor=encode_cursor('next', key(rows[-1])) if rows and has_next else None,
+            previous_cursor=encode_cursor('prev', key(rows[0])) if rows and has_previous else None,
+        )
+        if self.approximate_count_limit:
+            limit = self.approximate_count_limit
+            count = queryset.order_by()[:limit + 1].count()
+            page.count, page.count_is_exact = min(count, limit), count <= limit
+        self.add_page_urls(page)
+        return None, page, page.object_list, page.has_other_pages()
+
+    def add_page_urls(self, page):
+        """Links to neighbouring pages that keep the list's other filters"""
+        params = self.request.GET.copy()
+        params.pop(CURSOR_PARAM, None)
+        params.pop('page', None)
+        for attr, cursor in (('next_url', page.next_cursor), ('previous_url', page.previous_cursor)):
+            if cursor:
+                params[CURSOR_PARAM] = cursor
+                setattr(page, attr, f'?{params.urlencode()}')
+        params.pop(CURSOR_PARAM, None)
+        page.first_url = f'?{params.urlencode()}'
@@ -0,0 +1,149 @@
+"""Content-addressed cache of rendered agreement and invoice PDFs.
+
+A document is keyed by a hash of everything printed on it (agreement,
+customer, invoice, items and payments), so a download only renders when
+that state has changed since the last one. Files live under
+``settings.PDF_CACHE_DIR/<kind>/<agreement id>/<hash>.pdf``; writing a new
+version removes the older ones.
+
+With ``settings.PDF_BACKGROUND_RENDER`` enabled, writes queue a Celery task
+that re-renders the agreement's documents ahead of the next download.
+"""
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.http import FileResponse, Http404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from . import documents
+from .models import Invoice, Payment, RentalAgreement, RentalItem
+
+# Bump when a layout changes so every cached document is re-rendered
+LAYOUT_VERSION = 2
+
+KINDS = ('agreement', 'invoice', 'letterpad')
+
+
+class PDFRenderError(Exception):
+    pass
+
+
+def state(rental_id):
+    """Everything that ends up on an agreement's documents, as JSON-ready values"""
+    rental = RentalAgreement.objects.filter(pk=rental_id).values(
+        'id', 'start_date', 'expected_return_date', 'actual_return_date', 'status', 'discount',
+        'apply_vat', 'subtotal', 'vat', 'total', 'advance_payment', 'paid_amount', 'balance_due', 'notes',
+        'customer__name', 'customer__company', 'customer__email', 'customer__phone',
+    ).first()
+    if rental is None:
+        return None
+    return {
+        'rental': rental,
+        'invoice': Invoice.objects.filter(rental_agreement_id=rental_id).values(
+            'id', 'invoice_number', 'issue_date', 'due_date', 'total_amount', 'paid_amount', 'payment_status'
+        ).first(),
+        'items': list(RentalItem.objects.filter(rental_id=rental_id).order_by('pk').values_list(
+            'pk', 'product__name', 'quantity', 'rental_price', 'returned_quantity'
+        )),
+        'payments': list(Payment.objects.filter(rental_agreement_id=rental_id).order_by('pk').values_list(
+            'pk', 'amount', 'payment_date', 'payment_method', 'receipt_number', 'notes'
+        )),
+    }
+
+
+def fingerprint(kind, rental_id):
+    """Content hash for ``kind`` of the agreement, or None if it doesn't exist"""
+    current = state(rental_id)
+    if current is None:
+        return None
+    payload = json.dumps([LAYOUT_VERSION, kind, current], default=str, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def document_dir(kind, rental_id):
+    return Path(settings.PDF_CACHE_DIR) / kind / str(rental_id)
+
+
+def render(kind, rental_id):
+    rental = RentalAgreement.objects.select_related('customer').prefetch_related('items__product').get(pk=rental_id)
+    if kind == 'agreement':
+        pdf = documents.agreement_pdf(rental)
+    elif kind == 'invoice':
+        pdf = documents.invoice_pdf(rental, rental.invoice)
+    else:
+        pdf = documents.letterpad_pdf(rental.invoice)
+    if not pdf:
+        raise PDFRenderError(f"Failed to render {kind} PDF for agreement {rental_id}")
+    return pdf
+
+
+def get_or_render(kind, rental_id, force=False):
+    """``(path, key)`` of the current document, rendering it synchronously on a miss"""
+    if kind not in KINDS:
+        raise ValueError(f"Unknown document kind {kind}")
+    key = fingerprint(kind, rental_id)
+    if key is None:
+        raise RentalAgreement.DoesNotExist
+    directory = document_dir(kind, rental_id)
+    path = directory / f'{key}.pdf'
+    if force or not path.exists():
+        pdf = render(kind, rental_id)
+        directory.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(pdf)
+        os.replace(tmp, path)
+        for stale in directory.glob('*.pdf'):
+            if stale != path:
+                stale.unlink(missing_ok=True)
+    return path, key
+
+
+def serve(request, kind, rental_id, filename, disposition='attachment'):
+    """Cached PDF response with ETag/Last-Modified; 304 when the client copy is current"""
+    try:
+        path, key = get_or_render(kind, rental_id)
+    except (RentalAgreement.DoesNotExist, Invoice.DoesNotExist):
+        raise Http404("Document not found")
+    etag = f'"{key}"'
+    last_modified = int(path.stat().st_mtime)
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    response = FileResponse(open(path, 'rb'), content_type='application/pdf')
+    response['Content-Disposition'] = f'{disposition}; filename="{filename}"'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    # Let browsers keep a copy but always revalidate, since the agreement can change
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def refresh(rental_id):
+    """Re-render every document of an agreement whose content changed"""
+    rendered = 0
+    for kind in KINDS:
+        if kind != 'agreement' and not Invoice.objects.filter(rental_agreement_id=rental_id).exists():
+            continue
+        try:
+            get_or_render(kind, rental_id)
+        except RentalAgreement.DoesNotExist:
+            return rendered
+        rendered += 1
+    return rendered
+
+
+def discard(rental_id):
+    """Drop every cached document of a deleted agreement"""
+    for kind in KINDS:
+        directory = document_dir(kind, rental_id)
+        for path in directory.glob('*'):
+            path.unlink(missing_ok=True)
+        if directory.exists():
+            directory.rmdir()
@@ -0,0 +1,122 @@
+import json
+from datetime import date, timedelta
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
+from django.db.models import Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncQuarter, TruncWeek, TruncYear
+
+from .models import Payment
+
+PERIODS = {
+    'daily': (TruncDay, relativedelta(days=1)),
+    'weekly': (TruncWeek, relativedelta(weeks=1)),
+    'monthly': (TruncMonth, relativedelta(months=1)),
+    'quarterly': (TruncQuarter, relativedelta(months=3)),
+    'yearly': (TruncYear, relativedelta(years=1)),
+}
+
+
+def bucket_start(day, period):
+    """The first day of the ``period`` bucket containing ``day``, matching the SQL Trunc functions"""
+    if period == 'weekly':
+        return day - timedelta(days=day.weekday())
+    if period == 'monthly':
+        return day.replace(day=1)
+    if period == 'quarterly':
+        return date(day.year, (day.month - 1) // 3 * 3 + 1, 1)
+    if period == 'yearly':
+        return date(day.year, 1, 1)
+    return day
+
+
+def period_label(start, period):
+    if period == 'weekly':
+        year, week, _ = start.isocalendar()
+        return f"Week {week}, {year}"
+    if period == 'monthly':
+        return start.strftime('%b %Y')
+    if period == 'quarterly':
+        return f"Q{(start.month - 1) // 3 + 1} {start.year}"
+    if period == 'yearly':
+        return start.strftime('%Y')
+    return start.strftime('%Y-%m-%d')
+
+
+def revenue_series(start_date, end_date, period='monthly', payments=None):
+    """Payment totals per ``period`` between two dates (inclusive).
+
+    One GROUP BY query whatever the span; buckets without payments are filled
+    with zeros here so charts get a continuous axis.
+    """
+    if period not in PERIODS:
+        period = 'monthly'
+    trunc, step = PERIODS[period]
+    payments = Payment.objects.all() if payments is None else payments
+
+    totals = dict(
+        payments.filter(
+            payment_date__gte=start_date,
+            payment_date__lte=end_date
+        ).annotate(
+            bucket=trunc('payment_date')
+        ).values('bucket').annotate(
+            total=Sum('amount')
+        ).order_by().values_list('bucket', 'total')
+    )
+
+    rows = []
+    previous = None
+    current = bucket_start(start_date, period)
+    while current <= end_date:
+        last_day = min(current + step - timedelta(days=1), end_date)
+        days = (last_day - max(current, start_date)).days + 1
+        revenue = totals.get(current) or Decimal('0.00')
+        rows.append({
+            'start': current,
+            'period': period_label(current, period),
+            'rental_revenue': revenue,
+            'sales_revenue': Decimal('0.00'),
+            'total_revenue': revenue,
+            'avg_daily': revenue / days,
+            'percent_change': _percent_change(previous, revenue),
+        })
+        previous = revenue
+        current += step
+    return rows
+
+
+def _percent_change(old, new):
+    if not old:
+        return 0
+    return float((new - old) / old * 100)
+
+
+def revenue_report_context(start_date, end_date, period='monthly'):
+    """Context shared by the revenue report views and rental/revenue_report.html"""
+    report_data = revenue_series(start_date, end_date, period)
+    total = sum((row['total_revenue'] for row in report_data), Decimal('0.00'))
+    days = (end_date - start_date).days + 1
+    first = report_data[0]['total_revenue'] if report_data else Decimal('0.00')
+    last = report_data[-1]['total_revenue'] if report_data else Decimal('0.00')
+
+    labels = [row['period'] for row in report_data]
+    rental_data = [float(row['rental_revenue']) for row in report_data]
+    return {
+        'period': period if period in PERIODS else 'monthly',
+        'start_date': start_date,
+        'end_date': end_date,
+        'report_data': report_data,
+        'totals': {
+            'rental': total,
+            'sales': Decimal('0.00'),
+            'total': total,
+            'avg_daily': total / days if days > 0 else Decimal('0.00'),
+            'percent_change': _percent_change(first, last),
+        },
+        'labels': labels,
+        'trend_labels': json.dumps(labels),
+        'rental_data': rental_data,
+        'sales_data': [0.0] * len(report_data),
+        'chart_data': {'labels': labels, 'data': rental_data},
+    }
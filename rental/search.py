@@ -0,0 +1,131 @@
+"""Full-text search over products and customers.
+
+On SQLite each model has an FTS5 table (``rental_product_fts``,
+``rental_customer_fts``) whose rowid is the model's primary key, mapped
+by the unmanaged ``ProductSearchIndex``/``CustomerSearchIndex`` models so
+searches are an ordinary join. On PostgreSQL the same fields are searched
+through a weighted ``SearchVector`` backed by a GIN expression index.
+Other databases, or SQLite builds without FTS5, fall back to
+``icontains``.
+
+Every word of the query is matched as a prefix, so "dri 18v" finds
+"Cordless Drill 18V", and results carry a ``search_rank`` annotation where
+lower is more relevant (bm25 on SQLite, negated ts_rank on PostgreSQL).
+
+Signals keep the index in step with saves and deletes (rental/signals.py);
+bulk writes call ``reindex()`` and ``manage.py rebuild_search_index``
+rebuilds it from scratch.
+"""
+import re
+from functools import reduce
+from operator import and_, or_
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import F, FloatField, Q, Value
+
+# Searchable fields per model, most important first, with their weights
+# (bm25 column weights on SQLite, A-D on PostgreSQL)
+SEARCH_FIELDS = {
+    'rental.product': (('name', 10.0, 'A'), ('sku', 5.0, 'A'), ('description', 1.0, 'C')),
+    'rental.customer': (('name', 10.0, 'A'), ('company', 5.0, 'B'), ('email', 2.0, 'C'), ('phone', 2.0, 'C')),
+}
+
+_fts_available = {}
+
+
+def fields(model):
+    return SEARCH_FIELDS[model._meta.label_lower]
+
+
+def fts_table(model):
+    return f'{model._meta.db_table}_fts'
+
+
+def backend():
+    """'fts5', 'postgres' or 'basic' for the default database"""
+    if connection.vendor == 'postgresql':
+        return 'postgres'
+    if connection.vendor != 'sqlite':
+        return 'basic'
+    # Keyed on the database name so the test database is checked separately
+    key = connection.settings_dict['NAME']
+    if key not in _fts_available:
+        tables = set(connection.introspection.table_names())
+        _fts_available[key] = all(
+            f"{label.replace('.', '_')}_fts" in tables for label in SEARCH_FIELDS
+        )
+    return 'fts5' if _fts_available[key] else 'basic'
+
+
+def terms(text):
+    return re.findall(r'\w+', (text or '').lower())
+
+
+def search_vector(model):
+    return reduce(lambda a, b: a + b, (
+        SearchVector(name, weight=weight, config='simple') for name, _, weight in fields(model)
+    ))
+
+
+def search(queryset, text):
+    """``queryset`` narrowed to rows matching every word of ``text`` as a prefix, annotated with ``search_rank``"""
+    words = terms(text)
+    if not words:
+        return queryset
+    mode = backend()
+    if mode == 'fts5':
+        # Quoted so FTS5 operators and column filters in user input are taken literally
+        match = ' '.join(f'"{word}"*' for word in words)
+        return queryset.filter(search_index__document__match=match).annotate(
+            search_rank=F('search_index__rank')
+        )
+    if mode == 'postgres':
+        vector = search_vector(queryset.model)
+        query = SearchQuery(' & '.join(f'{word}:*' for word in words), search_type='raw', config='simple')
+        # Filter on the same expression the GIN index was built from
+        return queryset.annotate(search_document=vector).filter(search_document=query).annotate(
+            search_rank=SearchRank(vector, query) * Value(-1.0)
+        )
+    return queryset.filter(reduce(and_, (
+        reduce(or_, (Q(**{f'{name}__icontains': word}) for name, _, _ in fields(queryset.model)))
+        for word in words
+    ))).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+# Index maintenance (FTS5 only: PostgreSQL's expression index maintains itself)
+
+def _copy_rows(cursor, model, pks=None):
+    table, source = fts_table(model), model._meta.db_table
+    names = [name for name, _, _ in fields(model)]
+    columns = ', '.join(f'"{name}"' for name in names)
+    values = ', '.join(f'''COALESCE("{model._meta.get_field(name).column}", '')''' for name in names)
+    sql = f'INSERT INTO "{table}" (rowid, {columns}) SELECT "{model._meta.pk.column}", {values} FROM "{source}"'
+    if pks is None:
+        cursor.execute(f'DELETE FROM "{table}"')
+        cursor.execute(sql)
+        return
+    for start in range(0, len(pks), 500):
+        chunk = list(pks[start:start + 500])
+        placeholders = ', '.join(['%s'] * len(chunk))
+        cursor.execute(f'DELETE FROM "{table}" WHERE rowid IN ({placeholders})', chunk)
+        cursor.execute(f'{sql} WHERE "{model._meta.pk.column}" IN ({placeholders})', chunk)
+
+
+def reindex(model, pks=None):
+    """Refresh the index rows of ``pks`` (every row when None) from the model table"""
+    if backend() != 'fts5':
+        return
+    with connection.cursor() as cursor:
+        _copy_rows(cursor, model, pks)
+
+
+def index(instance):
+    reindex(type(instance), [instance.pk])
+
+
+def unindex(instance):
+    if backend() != 'fts5':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM "{fts_table(type(instance))}" WHERE rowid = %s', [instance.pk])
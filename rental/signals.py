@@ -0,0 +1,67 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import fragment_cache, fuzzy, pdf_cache, search
+from .models import Customer, Expense, Invoice, Payment, Product, RentalAgreement, RentalItem
+from .stats import DashboardStats
+from .tasks import dispatch, render_agreement_documents
+
+
+@receiver([post_save, post_delete], sender=Payment)
+@receiver([post_save, post_delete], sender=Expense)
+@receiver([post_save, post_delete], sender=RentalAgreement)
+@receiver([post_save, post_delete], sender=RentalItem)
+def invalidate_dashboard_stats(sender, **kwargs):
+    DashboardStats.invalidate()
+
+
+@receiver([post_save, post_delete], sender=Payment)
+@receiver([post_save, post_delete], sender=Invoice)
+@receiver(post_save, sender=RentalAgreement)
+@receiver([post_save, post_delete], sender=RentalItem)
+def queue_document_render(sender, instance, **kwargs):
+    if not settings.PDF_BACKGROUND_RENDER:
+        return
+    if sender is RentalAgreement:
+        rental_id = instance.pk
+    elif sender is RentalItem:
+        rental_id = instance.rental_id
+    else:
+        rental_id = instance.rental_agreement_id
+    transaction.on_commit(lambda: dispatch(render_agreement_documents, rental_id))
+
+
+@receiver(post_delete, sender=RentalAgreement)
+def discard_documents(sender, instance, **kwargs):
+    pdf_cache.discard(instance.pk)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Customer)
+def update_search_index(sender, instance, **kwargs):
+    search.index(instance)
+    # The in-memory index can't roll back, so it only follows committed changes
+    transaction.on_commit(lambda: fuzzy.update(instance))
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Customer)
+def remove_from_search_index(sender, instance, **kwargs):
+    search.unindex(instance)
+    transaction.on_commit(lambda: fuzzy.discard(instance))
+
+
+@receiver([post_save, post_delete], sender=RentalItem)
+def touch_agreement(sender, instance, **kwargs):
+    # Items have no updated_at of their own: the agreement's keys its item list
+    RentalAgreement.objects.filter(pk=instance.rental_id).update(updated_at=timezone.now())
+
+
+@receiver([post_save, post_delete])
+def bump_fragment_generation(sender, **kwargs):
+    # Cached fragments that list a model's rows are keyed on its generation
+    if sender._meta.app_label == 'rental':
+        fragment_cache.bump(sender)
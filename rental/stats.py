@@ -0,0 +1,142 @@
+import time
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from .models import RESERVING_STATUSES, Customer, Expense, Product, RentalAgreement, RevenueReport
+
+
+def percentage_change(old, new):
+    if not old or old == 0:
+        return 100 if new > 0 else 0
+    return round(((new - old) / old) * 100, 1)
+
+
+class DashboardStats:
+    """Everything the dashboard shows, computed in a handful of grouped queries.
+
+    Snapshots are cached for DASHBOARD_STATS_TTL seconds and dropped whenever a
+    payment, expense or rental changes (see rental.signals). Each carries a
+    ``stats_version`` that the dashboard's cached fragments are keyed on, so
+    they are re-rendered exactly when the snapshot is recomputed.
+    """
+    CACHE_KEY = 'rental:dashboard-stats'
+
+    def __init__(self, today=None):
+        self.today = today or timezone.localdate()
+        self.last_month = self.today - relativedelta(months=1)
+
+    @classmethod
+    def cache_key(cls, today=None):
+        return f"{cls.CACHE_KEY}:{(today or timezone.localdate()).isoformat()}"
+
+    @classmethod
+    def get(cls):
+        key = cls.cache_key()
+        snapshot = cache.get(key)
+        if snapshot is None:
+            snapshot = cls().compute()
+            cache.set(key, snapshot, getattr(settings, 'DASHBOARD_STATS_TTL', 60))
+        return snapshot
+
+    @classmethod
+    def invalidate(cls):
+        cache.delete(cls.cache_key())
+
+    def compute(self):
+        stats = {}
+        stats.update(self._inventory())
+        stats.update(self._money())
+        stats.update(self._rentals())
+        stats.update(self._customers())
+        stats['recent_rentals'] = list(
+            RentalAgreement.objects.select_related('customer').order_by('-created_at')[:5]
+        )
+        stats['recent_expenses'] = list(
+            Expense.objects.select_related('category').order_by('-date')[:5]
+        )
+        stats['stats_version'] = time.time_ns()
+        return stats
+
+    def _inventory(self):
+        totals = Product.objects.aggregate(
+            total_products=Count('id'),
+            product_investment=Sum('purchase_price', filter=Q(
+                is_outsourced=False,
+                purchase_price__isnull=False,
+                stock__gt=0
+            )),
+        )
+        return {
+            'total_products': totals['total_products'],
+            'product_investment': totals['product_investment'] or 0,
+        }
+
+    def _money(self):
+        # Six months of payment/expense totals from the monthly rollup, oldest first
+        reports = RevenueReport.series(self.today - relativedelta(months=5), self.today)
+        current, previous = reports[-1], reports[-2]
+
+        net_profit = current.total_income - current.expenses
+        last_month_profit = (
+            previous.total_income - previous.expenses if previous.total_income else Decimal('0.00')
+        )
+        return {
+            'monthly_revenue': current.total_income,
+            'revenue_change': percentage_change(previous.total_income, current.total_income),
+            'monthly_expenses': current.expenses,
+            'expense_change': percentage_change(previous.expenses, current.expenses),
+            'net_profit': net_profit,
+            'profit_change': percentage_change(last_month_profit, net_profit),
+            'revenue_data': [float(report.total_income) for report in reports],
+            'revenue_labels': [report.period_start.strftime('%b %Y') for report in reports],
+        }
+
+    def _rentals(self):
+        today, last_month = self.today, self.last_month
+        counts = RentalAgreement.objects.aggregate(
+            active=Count('id', filter=Q(status='active')),
+            returned=Count('id', filter=Q(status='returned')),
+            overdue=Count('id', filter=Q(status='overdue')),
+            cancelled=Count('id', filter=Q(status='cancelled')),
+            # Past due, whether or not the nightly sweep has marked it yet
+            overdue_now=Count('id', filter=Q(status__in=RESERVING_STATUSES, expected_return_date__lt=today)),
+            last_month_active=Count('id', filter=Q(
+                status='active',
+                start_date__lte=last_month,
+                expected_return_date__gte=last_month
+            )),
+            last_month_overdue=Count(
+                'id', filter=Q(status__in=RESERVING_STATUSES, expected_return_date__lt=last_month)
+            ),
+        )
+
+        overdue_list = RentalAgreement.objects.filter(
+            status__in=RESERVING_STATUSES,
+            expected_return_date__lt=today
+        ).select_related('customer').annotate(
+            days_overdue=today - F('expected_return_date')
+        ).order_by('expected_return_date')[:5]
+
+        return {
+            'active_rentals': counts['active'],
+            'active_rentals_change': percentage_change(counts['last_month_active'], counts['active']),
+            'overdue_rentals': counts['overdue_now'],
+            'overdue_rentals_list': list(overdue_list),
+            'overdue_rentals_change': percentage_change(counts['last_month_overdue'], counts['overdue_now']),
+            'status_data': [counts[k] for k in ['active', 'returned', 'overdue', 'cancelled']],
+        }
+
+    def _customers(self):
+        counts = Customer.objects.aggregate(
+            total=Count('id'),
+            last_month=Count('id', filter=Q(join_date__lte=self.last_month)),
+        )
+        return {
+            'total_customers': counts['total'],
+            'customer_growth': percentage_change(counts['last_month'], counts['total']),
+        }
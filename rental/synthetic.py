@@ -0,0 +1,303 @@
+"""Seeded synthetic data for load testing.
+
+``generate()`` writes products, customers, rental agreements with their
+items, invoices and payments, and expenses through ``bulk_create``, in
+chunks so a million rental items never sit in memory at once. Because no
+``save()`` runs, agreement and invoice totals are computed here the same
+way ``RentalAgreement.update_totals()`` does, and the derived tables (the
+reservation ledger, revenue reports, search index) are rebuilt afterwards
+by ``manage.py generate_data``.
+
+History is spread over ``days`` before today: older agreements are
+returned (a few cancelled), recent ones active or overdue, so the
+dashboard, overdue sweep and reports all have something to show. The
+same seed always produces the same rows.
+"""
+import random
+import re
+from contextlib import contextmanager
+from dataclasses import dataclass, field, replace
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+
+from .models import (
+    VAT_RATE, Customer, Expense, ExpenseCategory, Invoice, Payment, Product, RentalAgreement, RentalItem
+)
+
+CENTS = Decimal('0.01')
+
+FIRST_NAMES = (
+    'Ahmed', 'Aisha', 'Ali', 'Anil', 'Anjali', 'Arjun', 'David', 'Deepa', 'Fatima', 'George', 'Hassan',
+    'Joseph', 'John', 'Khalid', 'Lakshmi', 'Maria', 'Mohammed', 'Noor', 'Omar', 'Praveen', 'Priya',
+    'Rahul', 'Rashid', 'Sara', 'Suresh', 'Thomas', 'Vijay', 'Yusuf', 'Zainab', 'Meera',
+)
+LAST_NAMES = (
+    'Abraham', 'Al Mansoori', 'Al Nuaimi', 'Bose', 'Chacko', 'D\'Souza', 'Fernandes', 'Hassan', 'Iyer',
+    'Joseph', 'Khan', 'Kumar', 'Mathew', 'Menon', 'Nair', 'Pillai', 'Qureshi', 'Rahman', 'Reddy',
+    'Shaikh', 'Sharma', 'Thomas', 'Varghese', 'Verma', 'Zacharia',
+)
+COMPANY_WORDS = (
+    'Al Noor', 'Apex', 'Blue Line', 'Crescent', 'Desert Rose', 'Falcon', 'Gulf', 'Horizon', 'Emirates',
+    'Metro', 'Oasis', 'Pearl', 'Prime', 'Skyline', 'Summit', 'United', 'Vertex',
+)
+COMPANY_KINDS = ('Contracting', 'Building Contracting', 'Technical Services', 'Interiors', 'Events', 'Trading')
+EQUIPMENT = (
+    ('Rotary Hammer Drill', 'RH'), ('Cordless Drill', 'CD'), ('Angle Grinder', 'AG'), ('Tile Cutter', 'TC'),
+    ('Concrete Mixer', 'CM'), ('Plate Compactor', 'PC'), ('Diesel Generator', 'DG'), ('Scaffold Tower', 'ST'),
+    ('Aluminium Ladder', 'AL'), ('Pressure Washer', 'PW'), ('Wet Vacuum', 'WV'), ('Core Drill', 'CR'),
+    ('Demolition Breaker', 'DB'), ('Laser Level', 'LL'), ('Welding Machine', 'WM'), ('Air Compressor', 'AC'),
+    ('Floor Sander', 'FS'), ('Scissor Lift', 'SL'), ('Dehumidifier', 'DH'), ('Submersible Pump', 'SP'),
+)
+BRANDS = ('Bosch', 'Makita', 'DeWalt', 'Hilti', 'Honda', 'Stanley', 'Karcher', 'Milwaukee', 'Atlas Copco')
+
+
+@dataclass
+class Volumes:
+    products: int = 5000
+    customers: int = 100000
+    rentals: int = 400000
+    # Items per agreement are 1..max_items, so rentals * (max_items + 1) / 2 items overall
+    max_items: int = 4
+    expenses: int = 20000
+    days: int = 730
+
+    def scaled(self, factor):
+        """Record counts multiplied by ``factor``; the shape (items per rental, days) stays"""
+        counts = ('products', 'customers', 'rentals', 'expenses')
+        return replace(self, **{name: max(1, round(getattr(self, name) * factor)) for name in counts})
+
+
+@dataclass
+class Generated:
+    counts: dict = field(default_factory=dict)
+
+    def add(self, model, n):
+        name = str(model._meta.verbose_name_plural).lower()
+        self.counts[name] = self.counts.get(name, 0) + n
+
+
+@contextmanager
+def backdating(*models):
+    """Let bulk writes set auto_now/auto_now_add fields, so history can be dated in the past"""
+    fields = [
+        f for model in models for f in model._meta.concrete_fields if getattr(f, 'auto_now', False)
+        or getattr(f, 'auto_now_add', False)
+    ]
+    saved = [(f, f.auto_now, f.auto_now_add) for f in fields]
+    for f in fields:
+        f.auto_now = f.auto_now_add = False
+    try:
+        yield
+    finally:
+        for f, auto_now, auto_now_add in saved:
+            f.auto_now, f.auto_now_add = auto_now, auto_now_add
+
+
+def money(value):
+    return Decimal(value).quantize(CENTS)
+
+
+def at_noon(day):
+    return timezone.make_aware(datetime.combine(day, time(12)))
+
+
+def generate(volumes, seed=1, batch_size=5000, log=None):
+    """Write ``volumes`` of synthetic records and return what was created"""
+    rng = random.Random(seed)
+    today = timezone.localdate()
+    result = Generated()
+    log = log or (lambda message: None)
+    user, _ = get_user_model().objects.get_or_create(
+        username='loadtest', defaults={'is_staff': True, 'first_name': 'Load', 'last_name': 'Test'}
+    )
+
+    with backdating(Product, Customer, RentalAgreement, Invoice, Expense):
+        products = generate_products(rng, volumes, today, batch_size, result)
+        log(f'{len(products)} products')
+        customers = generate_customers(rng, volumes, today, batch_size, result)
+        log(f'{len(customers)} customers')
+        generate_rentals(rng, volumes, today, products, customers, user, batch_size, result, log)
+        generate_expenses(rng, volumes, today, products, user, batch_size, result)
+        log(f'{volumes.expenses} expenses')
+    return result
+
+
+def generate_products(rng, volumes, today, batch_size, result):
+    products = []
+    for i in range(volumes.products):
+        name, code = rng.choice(EQUIPMENT)
+        brand = rng.choice(BRANDS)
+        price = money(rng.choice((15, 20, 25, 35, 50, 75, 120, 250)) * rng.uniform(0.8, 1.2))
+        outsourced = rng.random() < 0.1
+        created = today - timedelta(days=volumes.days + rng.randint(0, 180))
+        products.append(Product(
+            name=f'{brand} {name}',
+            sku=f'SYN-{code}-{i + 1:06d}',
+            description=f'{brand} {name.lower()}, model {rng.randint(100, 999)}',
+            stock=rng.randint(3, 40),
+            is_outsourced=outsourced,
+            purchase_price=None if outsourced else money(price * rng.randint(15, 40)),
+            rental_price=None if outsourced else price,
+            outsourced_purchase_price=money(price * Decimal('0.6')) if outsourced else None,
+            outsourced_rental_price=price if outsourced else None,
+            condition=rng.choice(('new', 'excellent', 'good', 'good', 'fair')),
+            purchase_year=rng.randint(max(1900, today.year - 8), today.year),
+            created_at=at_noon(created),
+            updated_at=at_noon(created),
+        ))
+    with transaction.atomic():
+        products = Product.objects.bulk_create(products, batch_size=batch_size)
+    result.add(Product, len(products))
+    # (pk, daily price) is all the rentals need
+    return [(product.pk, product.rental_price or product.outsourced_rental_price) for product in products]
+
+
+def generate_customers(rng, volumes, today, batch_size, result):
+    customers = []
+    for i in range(volumes.customers):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        company = f'{rng.choice(COMPANY_WORDS)} {rng.choice(COMPANY_KINDS)} LLC' if rng.random() < 0.6 else None
+        domain = company.split()[0].lower() if company else rng.choice(('gmail', 'outlook', 'yahoo'))
+        customers.append(Customer(
+            name=f'{first} {last}',
+            email=f'{first.lower()}.{re.sub("[^a-z]", "", last.lower())}{i}@{domain}.com' if rng.random() < 0.85 else None,
+            phone=f'05{rng.choice("024568")} {rng.randint(100, 999)} {rng.randint(1000, 9999)}',
+            company=company,
+            discount_rate=Decimal(rng.choice((0, 0, 0, 0, 5, 10))),
+            join_date=today - timedelta(days=rng.randint(0, volumes.days)),
+        ))
+    for start in range(0, len(customers), batch_size):
+        with transaction.atomic():
+            Customer.objects.bulk_create(customers[start:start + batch_size])
+    result.add(Customer, len(customers))
+    return [(customer.pk, customer.discount_rate) for customer in customers]
+
+
+def generate_rentals(rng, volumes, today, products, customers, user, batch_size, result, log):
+    # Most agreements are history; the last few weeks hold the active and overdue ones
+    for start in range(0, volumes.rentals, batch_size):
+        rentals, plans = [], []
+        for _ in range(min(batch_size, volumes.rentals - start)):
+            customer_id, discount = rng.choice(customers)
+            started = today - timedelta(days=int(rng.triangular(0, volumes.days, 0)))
+            expected = started + timedelta(days=rng.choice((1, 2, 3, 5, 7, 7, 14, 30)))
+            status, returned = 'returned', expected + timedelta(days=rng.choice((-1, 0, 0, 0, 1, 3)))
+            if expected >= today - timedelta(days=1):
+                status, returned = 'active', None
+            elif today - expected < timedelta(days=21) and rng.random() < 0.3:
+                status, returned = 'overdue', None
+            elif rng.random() < 0.02:
+                status, returned = 'cancelled', None
+            if returned:
+                returned = min(max(returned, started), today)
+            rental = RentalAgreement(
+                customer_id=customer_id,
+                start_date=started,
+                expected_return_date=expected,
+                actual_return_date=returned,
+                discount=discount,
+                apply_vat=rng.random() < 0.9,
+                status=status,
+                created_at=at_noon(started),
+                updated_at=at_noon(returned or started),
+            )
+            lines = [
+                (product_id, rng.choice((1, 1, 1, 2, 3)), price)
+                for product_id, price in rng.sample(products, rng.randint(1, min(volumes.max_items, len(products))))
+            ]
+            rentals.append(rental)
+            plans.append((lines, price_rental(rng, rental, lines, today)))
+
+        with transaction.atomic():
+            RentalAgreement.objects.bulk_create(rentals)
+            write_rental_details(rng, rentals, plans, user, result)
+        result.add(RentalAgreement, len(rentals))
+        log(f'{start + len(rentals)} rental agreements')
+
+
+def price_rental(rng, rental, lines, today):
+    """Set the stored totals of an unsaved agreement, as update_totals() would, and pick its payments"""
+    line_total = sum((price * quantity for _, quantity, price in lines), Decimal('0.00'))
+    subtotal = line_total * rental.rental_days
+    vat = subtotal * VAT_RATE if rental.apply_vat else Decimal('0.00')
+    total = money(subtotal - subtotal * rental.discount / Decimal('100') + vat)
+
+    if rental.status == 'returned':
+        amounts = [total] if rng.random() < 0.9 else [money(total / 2)]
+    elif rental.status in ('active', 'overdue') and rng.random() < 0.5:
+        # Advance payment
+        amounts = [money(total * Decimal('0.3'))]
+    else:
+        amounts = []
+    payments = [(amount, min(rental.actual_return_date or rental.start_date, today)) for amount in amounts if amount > 0]
+
+    paid = sum((amount for amount, _ in payments), Decimal('0.00'))
+    rental.subtotal, rental.vat, rental.total = money(subtotal), money(vat), total
+    rental.paid_amount, rental.balance_due = paid, max(Decimal('0.00'), total - paid)
+    return payments
+
+
+def write_rental_details(rng, rentals, plans, user, result):
+    """Items, invoice and payments for a chunk of saved agreements"""
+    items, invoices, payments = [], [], []
+    for rental, (lines, rental_payments) in zip(rentals, plans):
+        returned = rental.status == 'returned'
+        items.extend(
+            RentalItem(
+                rental_id=rental.pk, product_id=product_id, quantity=quantity, rental_price=price,
+                returned_quantity=quantity if returned else 0, return_condition='good' if returned else '',
+            )
+            for product_id, quantity, price in lines
+        )
+        invoices.append(Invoice(
+            rental_agreement_id=rental.pk,
+            invoice_number=f'INV-{rental.pk:05d}',
+            issue_date=rental.start_date,
+            due_date=rental.expected_return_date,
+            total_amount=rental.total,
+            paid_amount=rental.paid_amount,
+            payment_status=(
+                'paid' if rental.paid_amount >= rental.total else 'partial' if rental.paid_amount else 'unpaid'
+            ),
+        ))
+        payments.extend(
+            Payment(
+                rental_agreement_id=rental.pk, amount=amount, payment_date=day,
+                payment_method=rng.choice(('cash', 'card', 'bank')),
+                receipt_number=f'PYMT-SYN-{rental.pk:07d}-{n}', processed_by=user,
+            )
+            for n, (amount, day) in enumerate(rental_payments, 1)
+        )
+
+    RentalItem.objects.bulk_create(items)
+    Invoice.objects.bulk_create(invoices)
+    Payment.objects.bulk_create(payments)
+    result.add(RentalItem, len(items))
+    result.add(Invoice, len(invoices))
+    result.add(Payment, len(payments))
+
+
+def generate_expenses(rng, volumes, today, products, user, batch_size, result):
+    categories = [
+        ExpenseCategory.objects.get_or_create(name=name)[0] for name, _ in ExpenseCategory.CATEGORY_CHOICES
+    ]
+    expenses = []
+    for _ in range(volumes.expenses):
+        category = rng.choice(categories)
+        day = today - timedelta(days=rng.randint(0, volumes.days))
+        expenses.append(Expense(
+            date=day,
+            category=category,
+            description=f'{category.get_name_display()} {rng.choice(("invoice", "bill", "service", "purchase"))}',
+            amount=money(rng.uniform(20, 2500)),
+            product_id=rng.choice(products)[0] if category.name == 'maintenance' else None,
+            created_by=user,
+            created_at=at_noon(day),
+        ))
+    with transaction.atomic():
+        Expense.objects.bulk_create(expenses, batch_size=batch_size)
+    result.add(Expense, len(expenses))
@@ -1,50 +1,93 @@
+import logging
+import math
+from datetime import date
+
 from celery import shared_task
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
+from django.conf import settings
 from django.utils import timezone
-from .models import RentalAgreement
+from . import barcodes, notifications, overdue, pdf_cache
+from .models import NotificationOutbox, Product
+
+logger = logging.getLogger(__name__)
+
+
+def dispatch(task, *args, **kwargs):
+    """Queue ``task``; a missing or unreachable broker is logged rather than failing the request.
+
+    With ``CELERY_TASK_ALWAYS_EAGER`` (tests, single-process setups) the task
+    runs inline without touching the broker at all.
+    """
+    if getattr(settings, 'CELERY_TASK_ALWAYS_EAGER', False):
+        return task.apply(args, kwargs)
+    try:
+        return task.delay(*args, **kwargs)
+    except Exception as e:
+        logger.warning(f"Could not queue {task.name}: {e}")
+        return None
+
+
+@shared_task
+def generate_product_barcodes(product_ids=None):
+    """Pre-render cached barcode images for the given products (all when omitted)"""
+    products = Product.objects.exclude(sku='')
+    if product_ids is not None:
+        products = products.filter(pk__in=product_ids)
+    # Celery's prefork workers can't start a process pool of their own
+    rendered, failures = barcodes.warm(products.values_list('sku', flat=True).iterator(), workers=1)
+    for sku, error in failures:
+        logger.error(f"Failed to generate barcode for {sku}: {error}")
+    return f"Generated {rendered} barcodes"
+
+
+@shared_task
+def render_agreement_documents(rental_id):
+    """Bring the cached PDFs of an agreement up to date"""
+    return f"Rendered {pdf_cache.refresh(rental_id)} documents for agreement {rental_id}"
+
 
 @shared_task
 def send_rental_reminders():
-    # Reminders for rentals due tomorrow
-    tomorrow = timezone.now().date() + timezone.timedelta(days=1)
-    due_rentals = RentalAgreement.objects.filter(
-        expected_return_date=tomorrow,
-        status='active'
-    )
-    
-    for rental in due_rentals:
-        subject = f"Equipment Return Reminder - Rental #{rental.id}"
-        message = render_to_string('rental/emails/return_reminder.txt', {
-            'rental': rental,
-            'customer': rental.customer
-        })
-        send_mail(
-            subject,
-            message,
-            'noreply@axeglobal.com',
-            [rental.customer.email],
-            fail_silently=False,
-        )
-    
-    # Overdue reminders
-    overdue_rentals = RentalAgreement.objects.filter(
-        expected_return_date__lt=timezone.now().date(),
-        status='active'
+    """Queue today's due and overdue reminders in the outbox and start draining it.
+
+    Safe to re-run: agreements already in today's outbox aren't queued twice.
+    """
+    queued = notifications.enqueue()
+    batches = drain_notification_outbox()
+    return f"Queued {queued['due']} reminders and {queued['overdue']} overdue notifications in {batches} batches"
+
+
+@shared_task
+def drain_notification_outbox():
+    """Start one delivery task per batch of deliverable outbox rows; pending and retryable rows alike"""
+    today = timezone.now().date()
+    pending = NotificationOutbox.claimable(today).count()
+    batches = math.ceil(pending / settings.REMINDER_BATCH_SIZE)
+    for _ in range(batches):
+        dispatch(send_notification_batch, today.isoformat())
+    return batches
+
+
+@shared_task
+def send_notification_batch(day=None):
+    """Claim and send one batch from the outbox; any number of these can run side by side"""
+    today = date.fromisoformat(day) if day else None
+    counts = notifications.deliver_batch(today)
+    logger.info(
+        f"Reminders sent: {counts['sent']}, failed: {counts['failed']}, skipped: {counts['skipped']}"
     )
-    
-    for rental in overdue_rentals:
-        subject = f"Overdue Equipment - Rental #{rental.id}"
-        message = render_to_string('rental/emails/overdue_notification.txt', {
-            'rental': rental,
-            'customer': rental.customer
-        })
-        send_mail(
-            subject,
-            message,
-            'noreply@axeglobal.com',
-            [rental.customer.email, 'billing@axeglobal.com'],
-            fail_silently=False,
-        )
-    
-    return f"Sent {due_rentals.count()} reminders and {overdue_rentals.count()} overdue notifications"
\ No newline at end of file
+    return counts
+
+
+@shared_task
+def mark_overdue():
+    """Nightly sweep moving active agreements past their return date to 'overdue'"""
+    return f"Marked {overdue.mark_overdue()} rentals as overdue"
+
+
+@shared_task
+def import_products(job_id, path, dry_run=False):
+    """Import an uploaded product CSV stored at ``path``, see rental/importers.py"""
+    # importers queues this task, so it is imported here rather than at the top
+    from .importers import run_import
+    result = run_import(job_id, path, dry_run)
+    return f"Imported {result.created} new and {result.updated} updated products, {len(result.errors)} rows had errors"
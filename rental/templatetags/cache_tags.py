@@ -0,0 +1,52 @@
+from django import template
+from django.template.base import token_kwargs
+
+from rental import fragment_cache
+
+register = template.Library()
+
+
+class CacheFragmentNode(template.Node):
+    def __init__(self, nodelist, name, vary_on, depends_on, timeout):
+        self.nodelist = nodelist
+        self.name = name
+        self.vary_on = vary_on
+        self.depends_on = depends_on
+        self.timeout = timeout
+
+    def render(self, context):
+        vary_on = [value.resolve(context) for value in self.vary_on]
+        depends_on = self.depends_on.resolve(context).split() if self.depends_on else ()
+        timeout = self.timeout.resolve(context) if self.timeout else None
+        return fragment_cache.get_or_render(
+            self.name, lambda: self.nodelist.render(context), vary_on, depends_on,
+            int(timeout) if timeout is not None else None
+        )
+
+
+@register.tag
+def cachefragment(parser, token):
+    """
+    Caches the enclosed block until anything it varies on or depends on changes.
+    Usage: {% cachefragment "name" obj1 obj2 models="rental.RentalItem rental.Payment" %}...{% endcachefragment %}
+
+    Model instances count by pk and updated_at, other values by their text,
+    and each model in ``models`` by its generation (see rental/fragment_cache.py).
+    An optional ``timeout=`` overrides FRAGMENT_CACHE_TTL.
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' tag requires a fragment name")
+    name = bits[1].strip('"\'')
+    vary_on = []
+    remaining = bits[2:]
+    while remaining and '=' not in remaining[0]:
+        vary_on.append(parser.compile_filter(remaining.pop(0)))
+    options = token_kwargs(remaining, parser)
+    if remaining or set(options) - {'models', 'timeout'}:
+        raise template.TemplateSyntaxError(
+            f"'{bits[0]}' takes a name, values to vary on, then optional models= and timeout="
+        )
+    nodelist = parser.parse(('endcachefragment',))
+    parser.delete_first_token()
+    return CacheFragmentNode(nodelist, name, vary_on, options.get('models'), options.get('timeout'))
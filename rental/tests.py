@@ -1,3 +1,1728 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import tempfile
+import zipfile
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed, ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F, Sum
+from django.http import HttpResponse
+from django.shortcuts import resolve_url
+from django.template.loader import get_template, render_to_string
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import load_workbook
+
+from . import barcodes, fixtures, fragment_cache, fuzzy, middleware, notifications, pdf_cache, search
+from .importers import ProductImporter
+from .models import (
+    Customer, Expense, ExpenseCategory, Invoice, NotificationOutbox, Payment, Product, RentalAgreement, RentalItem,
+    ReservationLedger, RevenueReport, SweepState,
+)
+from .overdue import mark_overdue
+from .pagination import encode_cursor
+from .reports import revenue_series
+from .stats import DashboardStats
+from .tasks import drain_notification_outbox, send_rental_reminders
+from .utilization import compute_utilization
+from .views import CustomerListView, ProductListView, ProductUtilizationReportView
+
+
+class BouncingEmailBackend(EmailBackend):
+    """locmem backend that refuses any message addressed to a bounce@ mailbox"""
+
+    def send_messages(self, messages):
+        for message in messages:
+            if any(address.startswith('bounce@') for address in message.recipients()):
+                raise OSError("Mailbox unavailable")
+        return super().send_messages(messages)
+
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    CELERY_TASK_ALWAYS_EAGER=True,
+    REMINDER_BATCH_SIZE=2,
+)
+class RentalReminderTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.today = timezone.now().date()
+        cls.product = Product.objects.create(name='Drill', sku='DR-1', stock=10, rental_price=Decimal('5.00'))
+
+    def rent(self, email, expected_return_date, name='Acme'):
+        customer = Customer.objects.create(name=name, phone='1', email=email)
+        rental = RentalAgreement.objects.create(
+            customer=customer,
+            start_date=self.today - timedelta(days=10),
+            expected_return_date=expected_return_date,
+        )
+        RentalItem.objects.create(rental=rental, product=self.product, quantity=1, rental_price=Decimal('5.00'))
+        return rental
+
+    def test_sends_due_and_overdue_reminders_in_batches(self):
+        tomorrow = self.today + timedelta(days=1)
+        due = [self.rent(f'due{i}@example.com', tomorrow) for i in range(3)]
+        overdue = self.rent('late@example.com', self.today - timedelta(days=2))
+        self.rent('later@example.com', self.today + timedelta(days=5))
+
+        self.assertEqual(
+            send_rental_reminders(), "Queued 3 reminders and 1 overdue notifications in 2 batches"
+        )
+
+        self.assertEqual(len(mail.outbox), 4)
+        subjects = {message.subject for message in mail.outbox}
+        self.assertEqual(subjects, {
+            *(f"Equipment Return Reminder - Rental #{rental.id}" for rental in due),
+            f"Overdue Equipment - Rental #{overdue.id}",
+        })
+        overdue_message = next(message for message in mail.outbox if 'Overdue' in message.subject)
+        self.assertEqual(overdue_message.to, ['late@example.com', notifications.BILLING_EMAIL])
+        self.assertIn('2 days overdue', overdue_message.body)
+        self.assertIn('$10.00', overdue_message.body)
+
+    def test_batch_loads_rentals_in_constant_queries(self):
+        tomorrow = self.today + timedelta(days=1)
+        rental_ids = [self.rent(f'due{i}@example.com', tomorrow).pk for i in range(5)]
+
+        # Agreements with customers, then their items and products
+        with self.assertNumQueries(3):
+            result = notifications.send_reminders('due', rental_ids, self.today)
+
+        self.assertEqual(len(result.sent), 5)
+        self.assertEqual(len(mail.outbox), 5)
+
+    @override_settings(EMAIL_BACKEND='rental.tests.BouncingEmailBackend')
+    def test_failures_are_recorded_per_rental(self):
+        tomorrow = self.today + timedelta(days=1)
+        first = self.rent('first@example.com', tomorrow)
+        bounced = self.rent('bounce@example.com', tomorrow)
+        no_email = self.rent(None, tomorrow)
+        last = self.rent('last@example.com', tomorrow)
+
+        result = notifications.send_reminders('due', [first.pk, bounced.pk, no_email.pk, last.pk], self.today)
+
+        self.assertEqual(result.sent, [first.pk, last.pk])
+        self.assertEqual([failure['rental'] for failure in result.failed], [no_email.pk, bounced.pk])
+        self.assertEqual(result.failed[1]['error'], "Mailbox unavailable")
+        self.assertEqual([message.to for message in mail.outbox], [['first@example.com'], ['last@example.com']])
+
+    def test_rerunning_the_job_does_not_resend(self):
+        self.rent('due@example.com', self.today + timedelta(days=1))
+        self.rent('late@example.com', self.today - timedelta(days=1))
+
+        send_rental_reminders()
+        send_rental_reminders()
+
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(NotificationOutbox.objects.filter(status='sent', attempts=1).count(), 2)
+
+    def test_retries_only_resend_failed_rows(self):
+        tomorrow = self.today + timedelta(days=1)
+        self.rent('first@example.com', tomorrow)
+        bounced = self.rent('bounce@example.com', tomorrow)
+        with self.settings(EMAIL_BACKEND='rental.tests.BouncingEmailBackend'):
+            send_rental_reminders()
+        self.assertEqual(len(mail.outbox), 1)
+        failed = NotificationOutbox.objects.get(status='failed')
+        self.assertEqual((failed.rental_id, failed.attempts, failed.last_error), (bounced.pk, 1, "Mailbox unavailable"))
+
+        Customer.objects.filter(rentals=bounced).update(email='fixed@example.com')
+        self.assertEqual(drain_notification_outbox(), 1)
+
+        self.assertEqual([message.to for message in mail.outbox], [['first@example.com'], ['fixed@example.com']])
+        self.assertFalse(NotificationOutbox.objects.exclude(status='sent').exists())
+        self.assertEqual(drain_notification_outbox(), 0)
+
+    def test_returned_rentals_are_skipped(self):
+        rental = self.rent('due@example.com', self.today + timedelta(days=1))
+        notifications.enqueue(self.today)
+        RentalAgreement.objects.filter(pk=rental.pk).update(status='returned')
+
+        self.assertEqual(notifications.deliver_batch(self.today), {'sent': 0, 'failed': 0, 'skipped': 1})
+        self.assertEqual(len(mail.outbox), 0)
+
+
+class ReservationLedgerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.today = timezone.localdate()
+        cls.customer = Customer.objects.create(name='Acme', phone='1')
+        cls.product = Product.objects.create(name='Drill', sku='DR-1', stock=2, rental_price=Decimal('5.00'))
+
+    def book(self, quantity, start, days=3):
+        rental = RentalAgreement.objects.create(
+            customer=self.customer, start_date=start, expected_return_date=start + timedelta(days=days)
+        )
+        return RentalItem.objects.create(
+            rental=rental, product=self.product, quantity=quantity, rental_price=Decimal('5.00')
+        )
+
+    def test_overlapping_bookings_share_the_stock(self):
+        self.book(1, self.today)
+        self.book(1, self.today + timedelta(days=2))
+
+        self.assertEqual(self.product.availability(self.today, self.today + timedelta(days=1)), 1)
+        self.assertEqual(self.product.availability(self.today + timedelta(days=2), self.today + timedelta(days=3)), 0)
+        self.assertEqual(self.product.availability(self.today + timedelta(days=6)), 2)
+        with self.assertRaisesMessage(ValidationError, 'Only 0 of Drill available'):
+            self.book(1, self.today + timedelta(days=1))
+
+    def test_disjoint_bookings_do_not_conflict(self):
+        self.book(2, self.today)
+        self.book(2, self.today + timedelta(days=4))
+
+        self.assertEqual(self.product.availability(self.today, self.today + timedelta(days=3)), 0)
+        self.assertEqual(self.product.availability(self.today + timedelta(days=8)), 2)
+
+    def test_past_due_units_stay_reserved_until_returned(self):
+        item = self.book(2, self.today - timedelta(days=5), days=3)
+
+        product = Product.objects.with_availability().get(pk=self.product.pk)
+        self.assertEqual((product.rented_units, product.available_units), (2, 0))
+        self.assertEqual((self.product.rented_count, self.product.available_stock), (2, 0))
+        self.assertEqual(self.product.availability(self.today + timedelta(days=10)), 0)
+        with self.assertRaisesMessage(ValidationError, 'Only 0 of Drill available'):
+            self.book(2, self.today)
+
+        item.returned_quantity = 2
+        item.save()
+        self.assertEqual(self.product.available_stock, 2)
+        self.book(2, self.today)
+
+    def test_past_due_units_are_not_counted_twice(self):
+        self.book(1, self.today - timedelta(days=5), days=4)
+
+        # Yesterday holds the booking itself, today on only the overdue unit
+        self.assertEqual(self.product.availability(self.today - timedelta(days=1), self.today + timedelta(days=1)), 1)
+        product = Product.objects.with_availability(
+            self.today - timedelta(days=1), self.today + timedelta(days=1)
+        ).get(pk=self.product.pk)
+        self.assertEqual(product.available_units, 1)
+
+    def test_partial_return_releases_only_returned_units(self):
+        item = self.book(2, self.today)
+        item.returned_quantity = 1
+        item.save()
+
+        self.assertEqual(self.product.available_stock, 1)
+        self.assertEqual(set(ReservationLedger.objects.filter(product=self.product).values_list('reserved', flat=True)), {1})
+
+    def test_cancelling_or_returning_the_agreement_releases_its_items(self):
+        cancelled = self.book(2, self.today).rental
+        cancelled.status = 'cancelled'
+        cancelled.save()
+        self.assertEqual(self.product.available_stock, 2)
+
+        returned = self.book(2, self.today - timedelta(days=5), days=2).rental
+        self.assertEqual(self.product.available_stock, 0)
+        returned.status = 'returned'
+        returned.save()
+        self.assertEqual(self.product.available_stock, 2)
+        self.assertFalse(ReservationLedger.objects.exclude(reserved=0).exists())
+
+    def test_moving_dates_moves_the_booking(self):
+        rental = self.book(2, self.today).rental
+        rental.start_date += timedelta(days=10)
+        rental.expected_return_date += timedelta(days=10)
+        rental.save()
+
+        self.assertEqual(self.product.availability(self.today, self.today + timedelta(days=3)), 2)
+        self.assertEqual(self.product.availability(self.today + timedelta(days=10)), 0)
+
+    def test_deleting_an_item_releases_it(self):
+        self.book(2, self.today).delete()
+        self.assertEqual(self.product.available_stock, 2)
+
+    def test_rebuild_matches_incremental_ledger(self):
+        self.book(1, self.today - timedelta(days=2))
+        item = self.book(1, self.today + timedelta(days=1))
+        item.returned_quantity = 1
+        item.save()
+        expected = list(ReservationLedger.objects.exclude(reserved=0).values_list('product', 'day', 'reserved'))
+
+        call_command('rebuild_reservations', stdout=StringIO())
+
+        self.assertEqual(list(ReservationLedger.objects.values_list('product', 'day', 'reserved')), expected)
+
+    def stock_products(self, count, prefix='SW'):
+        """``count`` products with rentals out now, past due, returned and cancelled"""
+        products = [
+            Product.objects.create(name=f'{prefix} {i}', sku=f'{prefix}-{i}', stock=10, rental_price=Decimal('5.00'))
+            for i in range(count)
+        ]
+        for i, product in enumerate(products):
+            for status, start, quantity in (
+                ('active', self.today - timedelta(days=1), 1 + i % 3),
+                ('active', self.today - timedelta(days=6), 2),
+                ('returned', self.today - timedelta(days=2), 4),
+                ('cancelled', self.today, 3),
+            ):
+                rental = RentalAgreement.objects.create(
+                    customer=self.customer, start_date=start, expected_return_date=start + timedelta(days=3)
+                )
+                RentalItem.objects.create(rental=rental, product=product, quantity=quantity, rental_price=Decimal('5.00'))
+                if status != 'active':
+                    rental.status = status
+                    rental.save()
+        return products
+
+    def test_with_availability_matches_the_per_row_figures(self):
+        self.stock_products(4)
+        annotated = {product.pk: product for product in Product.objects.with_availability()}
+        for product in Product.objects.all():
+            with self.subTest(sku=product.sku):
+                # What the per-row properties summed before the ledger existed
+                out = product.rental_items.filter(
+                    returned_quantity__lt=F('quantity'), rental__status='active'
+                ).aggregate(total=Sum('quantity'))['total'] or 0
+                self.assertEqual((product.rented_count, product.available_stock), (out, product.stock - out))
+                self.assertEqual(
+                    (annotated[product.pk].rented_count, annotated[product.pk].available_stock),
+                    (out, product.stock - out)
+                )
+
+    def test_product_list_queries_do_not_grow_with_the_page(self):
+        self.client.force_login(User.objects.create_user('clerk', password='x'))
+        url = reverse('product_list')
+        self.stock_products(2)
+        with CaptureQueriesContext(connection) as small_page:
+            self.client.get(url)
+
+        self.stock_products(30, prefix='HM')
+        for page_size in (20, 50):
+            with self.subTest(page_size=page_size), mock.patch.object(ProductListView, 'paginate_by', page_size):
+                with self.assertNumQueries(len(small_page)):
+                    response = self.client.get(url)
+                self.assertEqual(len(response.context['products']), min(page_size, Product.objects.count()))
+
+
+    def test_product_api_reads_availability_in_one_query(self):
+        self.book(1, self.today - timedelta(days=5), days=2)
+        self.book(1, self.today + timedelta(days=2))
+        url = reverse('product_api', args=[self.product.pk])
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url).json()['available_stock'], 1)
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {
+                'start': self.today.isoformat(), 'end': (self.today + timedelta(days=3)).isoformat()
+            })
+        self.assertEqual(response.json()['available_stock'], 0)
+
+
+class AgreementTotalsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.today = timezone.localdate()
+        cls.customer = Customer.objects.create(name='Acme', phone='1')
+        cls.product = Product.objects.create(name='Drill', sku='DR-1', stock=10, rental_price=Decimal('10.00'))
+
+    def setUp(self):
+        # Three days at 2 x 10.00 a day
+        self.rental = RentalAgreement.objects.create(
+            customer=self.customer, start_date=self.today, expected_return_date=self.today + timedelta(days=2)
+        )
+        self.item = RentalItem.objects.create(
+            rental=self.rental, product=self.product, quantity=2, rental_price=Decimal('10.00')
+        )
+        self.invoice = Invoice.objects.create(
+            rental_agreement=self.rental, invoice_number='INV-1', due_date=self.today, total_amount=Decimal('63.00')
+        )
+
+    def assertTotals(self, subtotal, vat, total, paid, balance):
+        self.rental.refresh_from_db()
+        self.assertEqual(
+            [getattr(self.rental, field) for field in RentalAgreement.TOTALS_FIELDS],
+            [Decimal(value) for value in (subtotal, vat, total, paid, balance)]
+        )
+
+    def pay(self, amount):
+        return Payment.objects.create(
+            rental_agreement=self.rental, amount=Decimal(amount), payment_date=self.today, payment_method='cash'
+        )
+
+    def test_item_writes_apply_their_deltas(self):
+        self.assertTotals('60.00', '3.00', '63.00', '0.00', '63.00')
+
+        self.item.quantity = 3
+        self.item.save()
+        self.assertTotals('90.00', '4.50', '94.50', '0.00', '94.50')
+
+        RentalItem.objects.create(rental=self.rental, product=self.product, quantity=1, rental_price=Decimal('5.00'))
+        self.assertTotals('105.00', '5.25', '110.25', '0.00', '110.25')
+
+        self.item.delete()
+        self.assertTotals('15.00', '0.75', '15.75', '0.00', '15.75')
+
+    def test_payments_update_agreement_and_invoice(self):
+        payment = self.pay('20.00')
+        self.assertTotals('60.00', '3.00', '63.00', '20.00', '43.00')
+        self.invoice.refresh_from_db()
+        self.assertEqual((self.invoice.paid_amount, self.invoice.payment_status), (Decimal('20.00'), 'partial'))
+
+        payment.amount = Decimal('63.00')
+        payment.save()
+        self.assertTotals('60.00', '3.00', '63.00', '63.00', '0.00')
+        self.invoice.refresh_from_db()
+        self.assertEqual(self.invoice.payment_status, 'paid')
+
+        payment.delete()
+        self.assertTotals('60.00', '3.00', '63.00', '0.00', '63.00')
+        self.invoice.refresh_from_db()
+        self.assertEqual((self.invoice.paid_amount, self.invoice.payment_status), (Decimal('0.00'), 'unpaid'))
+
+    def test_pricing_changes_recompute_the_totals(self):
+        self.pay('10.00')
+        self.rental.refresh_from_db()
+        self.rental.discount = Decimal('10.00')
+        self.rental.save()
+        self.assertTotals('60.00', '3.00', '57.00', '10.00', '47.00')
+
+        self.rental.apply_vat = False
+        self.rental.actual_return_date = self.today
+        self.rental.save()
+        self.assertTotals('20.00', '0.00', '18.00', '10.00', '8.00')
+
+    def test_saving_a_stale_copy_keeps_the_stored_totals(self):
+        stale = RentalAgreement.objects.get(pk=self.rental.pk)
+        self.pay('30.00')
+        stale.notes = 'Deliver to site'
+        stale.balance_due = Decimal('0.00')
+        stale.save()
+
+        self.assertTotals('60.00', '3.00', '63.00', '30.00', '33.00')
+        self.assertEqual(self.rental.notes, 'Deliver to site')
+
+    def test_recompute_totals_finds_and_repairs_drift(self):
+        self.pay('10.00')
+        out = StringIO()
+        call_command('recompute_totals', stdout=out)
+        self.assertIn('Found 0 with drifted totals', out.getvalue())
+
+        RentalAgreement.objects.filter(pk=self.rental.pk).update(subtotal=Decimal('1.00'), paid_amount=0)
+        out = StringIO()
+        call_command('recompute_totals', '--fix', stdout=out)
+        self.assertIn('Repaired 1 with drifted totals', out.getvalue())
+        self.assertTotals('60.00', '3.00', '63.00', '10.00', '53.00')
+
+
+class RevenueReportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('clerk', password='x')
+        customer = Customer.objects.create(name='Acme', phone='1')
+        cls.rental = RentalAgreement.objects.create(
+            customer=customer, start_date=date(2026, 1, 10), expected_return_date=date(2026, 1, 12)
+        )
+        cls.category = ExpenseCategory.objects.create(name='maintenance')
+
+    def pay(self, amount, day):
+        return Payment.objects.create(
+            rental_agreement=self.rental, amount=Decimal(amount), payment_date=day, payment_method='cash',
+            receipt_number=f'R-{Payment.objects.count() + 1}'
+        )
+
+    def spend(self, amount, day):
+        return Expense.objects.create(
+            date=day, amount=Decimal(amount), category=self.category, description='Service', created_by=self.user
+        )
+
+    def months(self):
+        """``{(year, month): (income, expenses, net)}`` for the months with any figures"""
+        return {
+            (report.year, report.month): (report.total_income, report.expenses, report.net_income)
+            for report in RevenueReport.objects.all()
+            if report.total_income or report.expenses
+        }
+
+    def test_payments_and_expenses_add_to_their_month(self):
+        self.pay('100.00', date(2026, 1, 15))
+        self.pay('50.00', date(2026, 1, 31))
+        self.spend('30.00', date(2026, 1, 2))
+        self.spend('20.00', date(2026, 2, 1))
+
+        self.assertEqual(self.months(), {
+            (2026, 1): (Decimal('150.00'), Decimal('30.00'), Decimal('120.00')),
+            (2026, 2): (Decimal('0.00'), Decimal('20.00'), Decimal('-20.00')),
+        })
+
+    def test_edits_move_the_difference_or_the_whole_amount(self):
+        payment = self.pay('100.00', date(2026, 1, 15))
+        expense = self.spend('30.00', date(2026, 1, 2))
+
+        payment.amount = Decimal('80.00')
+        payment.save()
+        expense.amount = Decimal('35.00')
+        expense.save()
+        self.assertEqual(self.months(), {(2026, 1): (Decimal('80.00'), Decimal('35.00'), Decimal('45.00'))})
+
+        payment.payment_date = date(2026, 3, 1)
+        payment.save()
+        expense.date = date(2025, 12, 31)
+        expense.save()
+        self.assertEqual(self.months(), {
+            (2025, 12): (Decimal('0.00'), Decimal('35.00'), Decimal('-35.00')),
+            (2026, 3): (Decimal('80.00'), Decimal('0.00'), Decimal('80.00')),
+        })
+
+    def test_deletes_reverse_their_amounts(self):
+        self.pay('100.00', date(2026, 1, 15)).delete()
+        self.spend('30.00', date(2026, 1, 2)).delete()
+        self.assertEqual(self.months(), {})
+
+    def test_rebuild_matches_the_incremental_rollup(self):
+        self.pay('100.00', date(2026, 1, 15))
+        moved = self.pay('40.00', date(2026, 1, 20))
+        moved.payment_date = date(2026, 2, 2)
+        moved.save()
+        self.pay('25.00', date(2025, 11, 30)).delete()
+        self.spend('30.00', date(2026, 2, 2))
+        expected = self.months()
+
+        call_command('rebuild_revenue_reports', stdout=StringIO())
+        self.assertEqual(self.months(), expected)
+
+    def test_series_is_zero_filled_in_one_query(self):
+        self.pay('100.00', date(2026, 1, 15))
+        with self.assertNumQueries(1):
+            reports = RevenueReport.series(date(2025, 11, 20), date(2026, 2, 3))
+        self.assertEqual(
+            [(report.period_start, report.total_income) for report in reports],
+            [(date(2025, 11, 1), 0), (date(2025, 12, 1), 0), (date(2026, 1, 1), Decimal('100.00')), (date(2026, 2, 1), 0)]
+        )
+
+    def test_financial_dashboard_charts_invoiced_totals(self):
+        today = timezone.localdate()
+        invoice = Invoice.objects.create(
+            rental_agreement=self.rental, invoice_number='INV-1', due_date=today, total_amount=Decimal('70.00')
+        )
+        self.pay('100.00', today)
+        response = self.client.get(reverse('financial_dashboard'))
+        self.assertEqual(response.context['revenue_labels'][-1], today.strftime('%b %Y'))
+        self.assertEqual(response.context['revenue_data'], [0.0] * 6 + [70.0])
+
+        Invoice.objects.filter(pk=invoice.pk).update(issue_date=today - relativedelta(months=2))
+        response = self.client.get(reverse('financial_dashboard'))
+        self.assertEqual(response.context['revenue_data'], [0.0] * 4 + [70.0, 0.0, 0.0])
+
+
+class RevenueSeriesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        customer = Customer.objects.create(name='Acme', phone='1')
+        rental = RentalAgreement.objects.create(
+            customer=customer, start_date=date(2023, 1, 1), expected_return_date=date(2023, 1, 2)
+        )
+        for i, (day, amount) in enumerate((
+            (date(2023, 1, 3), '10.00'), (date(2023, 1, 4), '5.00'), (date(2024, 6, 30), '20.00'),
+            (date(2025, 11, 2), '40.00'),
+        )):
+            Payment.objects.create(
+                rental_agreement=rental, amount=Decimal(amount), payment_date=day, payment_method='cash',
+                receipt_number=f'R-{i}'
+            )
+
+    def test_multi_year_ranges_take_one_query(self):
+        # 2023-01-01 is a Sunday, so the first week starts in 2022
+        for period, buckets in (('daily', 1096), ('weekly', 158), ('monthly', 36)):
+            with self.subTest(period=period), self.assertNumQueries(1):
+                rows = revenue_series(date(2023, 1, 1), date(2025, 12, 31), period)
+            self.assertEqual(len(rows), buckets)
+            self.assertEqual(sum(row['total_revenue'] for row in rows), Decimal('75.00'))
+
+    def test_empty_buckets_are_zero_filled(self):
+        rows = revenue_series(date(2023, 1, 1), date(2023, 4, 30), 'monthly')
+        self.assertEqual([row['start'] for row in rows], [date(2023, month, 1) for month in range(1, 5)])
+        self.assertEqual([row['total_revenue'] for row in rows], [Decimal('15.00'), 0, 0, 0])
+
+        rows = revenue_series(date(2023, 1, 2), date(2023, 1, 5), 'daily')
+        self.assertEqual([row['total_revenue'] for row in rows], [0, Decimal('10.00'), Decimal('5.00'), 0])
+
+    def test_monthly_detail_averages_the_months_with_payments(self):
+        response = self.client.get(reverse('monthly_revenue_detail'))
+        self.assertEqual(response.context['total_collected'], Decimal('75.00'))
+        self.assertEqual(response.context['average_collected'], Decimal('25.00'))
+
+        response = self.client.get(reverse('monthly_revenue_detail'), {'year': '2023'})
+        self.assertEqual(len(response.context['monthly_totals']), 12)
+        self.assertEqual(response.context['average_collected'], Decimal('15.00'))
+
+    def test_monthly_detail_rejects_bad_dates(self):
+        for params in ({'year': 'abc'}, {'year': '2023', 'month': '13'}, {'month': '0'}, {'year': '0'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(reverse('monthly_revenue_detail'), params).status_code, 400)
+
+
+class DashboardStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.today = timezone.localdate()
+        cls.staff = User.objects.create_user('staff', password='x', is_staff=True)
+        cls.customer = Customer.objects.create(name='Acme', phone='1')
+        Customer.objects.create(name='Globex', phone='2')
+        cls.product = Product.objects.create(
+            name='Drill', sku='DR-1', stock=5, rental_price=Decimal('10.00'), purchase_price=Decimal('400.00')
+        )
+        cls.rental = RentalAgreement.objects.create(
+            customer=cls.customer, start_date=cls.today, expected_return_date=cls.today + timedelta(days=2)
+        )
+        RentalItem.objects.create(rental=cls.rental, product=cls.product, quantity=1, rental_price=Decimal('10.00'))
+        RentalAgreement.objects.create(
+            customer=cls.customer, start_date=cls.today - timedelta(days=9),
+            expected_return_date=cls.today - timedelta(days=7), status='returned'
+        )
+        Expense.objects.create(
+            date=cls.today, amount=Decimal('15.00'), category=ExpenseCategory.objects.create(name='maintenance'),
+            description='Service', created_by=cls.staff
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_snapshot_figures(self):
+        Payment.objects.create(
+            rental_agreement=self.rental, amount=Decimal('25.00'), payment_date=self.today, payment_method='cash'
+        )
+        stats = DashboardStats.get()
+
+        self.assertEqual(stats['total_products'], 1)
+        self.assertEqual(stats['product_investment'], Decimal('400.00'))
+        self.assertEqual(stats['total_customers'], 2)
+        self.assertEqual(stats['active_rentals'], 1)
+        self.assertEqual(stats['status_data'], [1, 1, 0, 0])
+        self.assertEqual(stats['monthly_revenue'], Decimal('25.00'))
+        self.assertEqual(stats['monthly_expenses'], Decimal('15.00'))
+        self.assertEqual(stats['net_profit'], Decimal('10.00'))
+        self.assertEqual(len(stats['revenue_data']), 6)
+        self.assertEqual(len(stats['recent_rentals']), 2)
+
+    def test_snapshot_is_cached_until_a_write_invalidates_it(self):
+        DashboardStats.get()
+        with self.assertNumQueries(0):
+            self.assertEqual(DashboardStats.get()['monthly_revenue'], Decimal('0.00'))
+
+        Payment.objects.create(
+            rental_agreement=self.rental, amount=Decimal('25.00'), payment_date=self.today, payment_method='cash'
+        )
+        self.assertEqual(DashboardStats.get()['monthly_revenue'], Decimal('25.00'))
+
+    def test_dashboard_renders_the_snapshot(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_customers'], 2)
+
+
+class UtilizationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        customer = Customer.objects.create(name='Acme', phone='1')
+        cls.drill = Product.objects.create(name='Drill', sku='DR-1', stock=2, rental_price=Decimal('5.00'))
+        cls.saw = Product.objects.create(name='Saw', sku='SW-1', stock=1, rental_price=Decimal('5.00'))
+
+        def rent(product, start, end, returned=None, status='returned'):
+            rental = RentalAgreement.objects.create(
+                customer=customer, start_date=start, expected_return_date=end,
+                actual_return_date=returned, status=status
+            )
+            RentalItem.objects.create(rental=rental, product=product, quantity=1, rental_price=Decimal('5.00'))
+
+        # 10 unit-days in January, and 3 of a rental that started in December and came back early
+        rent(cls.drill, date(2026, 1, 1), date(2026, 1, 10))
+        rent(cls.drill, date(2025, 12, 25), date(2026, 1, 5), returned=date(2026, 1, 3))
+        rent(cls.saw, date(2026, 1, 1), date(2026, 1, 20), status='cancelled')
+
+    def test_unit_days_are_clipped_to_the_window(self):
+        result = compute_utilization(date(2026, 1, 1), date(2026, 2, 28))
+        rows = {row['key']: row for row in result['rows']}
+
+        self.assertEqual(result['months'], [date(2026, 1, 1), date(2026, 2, 1)])
+        self.assertEqual((rows[self.drill.pk]['rented_unit_days'], rows[self.drill.pk]['owned_unit_days']), (13, 118))
+        self.assertAlmostEqual(rows[self.drill.pk]['utilization'], 1300 / 118)
+        self.assertAlmostEqual(rows[self.drill.pk]['monthly'][0], 1300 / 62)
+        self.assertEqual(rows[self.drill.pk]['monthly'][1], 0)
+        # Cancelled agreements never took the saw out
+        self.assertEqual(rows[self.saw.pk]['rented_unit_days'], 0)
+        self.assertAlmostEqual(result['overall'], 1300 / 177)
+
+    def test_past_due_items_count_until_today(self):
+        today = timezone.localdate()
+        hammer = Product.objects.create(name='Hammer', sku='HM-1', stock=2, rental_price=Decimal('5.00'))
+        for status in ('active', 'overdue'):
+            rental = RentalAgreement.objects.create(
+                customer=Customer.objects.get(), start_date=today - timedelta(days=10),
+                expected_return_date=today - timedelta(days=5)
+            )
+            RentalItem.objects.create(rental=rental, product=hammer, quantity=1, rental_price=Decimal('5.00'))
+            RentalAgreement.objects.filter(pk=rental.pk).update(status=status)
+
+        products = Product.objects.filter(pk=hammer.pk)
+        for end in (today, today + timedelta(days=5)):
+            with self.subTest(end=end):
+                row = compute_utilization(today - timedelta(days=9), end, products)['rows'][0]
+                self.assertEqual(row['rented_unit_days'], 20)
+
+        rental.actual_return_date = today - timedelta(days=3)
+        rental.status = 'returned'
+        rental.save()
+        row = compute_utilization(today - timedelta(days=9), today, products)['rows'][0]
+        self.assertEqual(row['rented_unit_days'], 10 + 7)
+
+    def test_grouping_pools_stock_and_rentals(self):
+        result = compute_utilization(date(2026, 1, 1), date(2026, 1, 31), group_by='is_outsourced')
+
+        self.assertEqual(len(result['rows']), 1)
+        self.assertEqual(result['rows'][0]['key'], False)
+        self.assertEqual((result['rows'][0]['rented_unit_days'], result['rows'][0]['owned_unit_days']), (13, 93))
+
+
+class ProductPerformanceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('clerk', password='x')
+        cls.customer = Customer.objects.create(name='Acme', phone='1')
+        cls.category = ExpenseCategory.objects.create(name='maintenance')
+        cls.drill = cls.product('DR')
+
+    @classmethod
+    def product(cls, sku):
+        product = Product.objects.create(name=sku, sku=sku, stock=5, rental_price=Decimal('7.50'))
+        # Across a leap day, a year end, returned early, and still out
+        for start, end, returned, quantity in (
+            (date(2024, 2, 27), date(2024, 3, 2), None, 2),
+            (date(2025, 12, 30), date(2026, 1, 4), date(2026, 1, 1), 1),
+            (date(2026, 3, 1), date(2026, 3, 1), None, 3),
+        ):
+            rental = RentalAgreement.objects.create(
+                customer=cls.customer, start_date=start, expected_return_date=end, actual_return_date=returned,
+                status='returned' if returned else 'active'
+            )
+            RentalItem.objects.create(rental=rental, product=product, quantity=quantity, rental_price=Decimal('7.50'))
+        Expense.objects.create(
+            category=cls.category, description='Service', amount=Decimal('12.25'), product=product, created_by=cls.user
+        )
+        return product
+
+    def test_revenue_matches_the_item_totals(self):
+        Product.objects.create(name='Unused', sku='UN', stock=1, rental_price=Decimal('5.00'))
+        for product in Product.objects.with_performance():
+            with self.subTest(sku=product.sku):
+                items = RentalItem.objects.filter(product=product).select_related('rental')
+                revenue = sum((item.total_price for item in items), Decimal('0.00'))
+                expenses = sum((expense.amount for expense in product.expenses.all()), Decimal('0.00'))
+                self.assertEqual(product.rental_revenue, revenue)
+                self.assertEqual((product.rental_count, product.expenses_total), (len(items), expenses))
+                self.assertEqual(product.net_profit, revenue - expenses)
+        # 2 x 5 days + 1 x 3 days + 3 x 1 day at 7.50
+        self.assertEqual(Product.objects.with_performance().get(pk=self.drill.pk).rental_revenue, Decimal('120.00'))
+
+    def test_report_queries_do_not_grow_with_products_or_sort(self):
+        self.client.force_login(self.user)
+        url = reverse('product_utilization_report')
+        with CaptureQueriesContext(connection) as one_product:
+            self.client.get(url)
+
+        for i in range(30):
+            self.product(f'P{i}')
+        for key in ProductUtilizationReportView.SORT_FIELDS:
+            for sort in (key, f'-{key}'):
+                with self.subTest(sort=sort), self.assertNumQueries(len(one_product)):
+                    response = self.client.get(url, {'sort': sort})
+                self.assertEqual(len(response.context['products']), 25)
+
+
+class ProductImportTests(TestCase):
+    HEADER = 'name,sku,stock,rental_price,purchase_price,is_rentable\n'
+
+    def run_import(self, body, **kwargs):
+        return ProductImporter(BytesIO((self.HEADER + body).encode('utf-8')), **kwargs).run()
+
+    def test_creates_and_updates_by_sku_in_batches(self):
+        Product.objects.create(name='Old Drill', sku='DR-1', stock=1, rental_price=Decimal('5.00'))
+
+        result = self.run_import(
+            'Drill,DR-1,4,7.50,300,yes\n'
+            'Saw,SW-1,2,5.00,200,no\n'
+            'Ladder,LD-1,1,3.00,90,1\n',
+            batch_size=2
+        )
+
+        self.assertEqual((result.created, result.updated, result.errors), (2, 1, []))
+        self.assertEqual(
+            list(Product.objects.order_by('sku').values_list('sku', 'name', 'stock', 'rental_price', 'is_rentable')),
+            [
+                ('DR-1', 'Drill', 4, Decimal('7.50'), True),
+                ('LD-1', 'Ladder', 1, Decimal('3.00'), True),
+                ('SW-1', 'Saw', 2, Decimal('5.00'), False),
+            ]
+        )
+
+    def test_invalid_and_duplicate_rows_are_reported_by_line(self):
+        result = self.run_import(
+            'Drill,DR-1,4,7.50,300,yes\n'
+            'Saw,SW-1,lots,5.00,,yes\n'
+            'Drill again,DR-1,1,7.50,300,yes\n'
+        )
+
+        self.assertEqual(result.created, 1)
+        self.assertEqual([(error['line'], error['sku']) for error in result.errors], [(3, 'SW-1'), (4, 'DR-1')])
+        self.assertIn('stock:', result.errors[0]['message'])
+        self.assertIn('already imported from line 2', result.errors[1]['message'])
+        self.assertEqual(list(Product.objects.values_list('sku', flat=True)), ['DR-1'])
+
+    def test_dry_run_counts_without_writing(self):
+        Product.objects.create(name='Old Drill', sku='DR-1', stock=1, rental_price=Decimal('5.00'))
+
+        result = self.run_import('Drill,DR-1,4,7.50,300,yes\nSaw,SW-1,2,5.00,200,no\n', dry_run=True)
+
+        self.assertEqual((result.created, result.updated), (1, 1))
+        self.assertEqual(list(Product.objects.values_list('sku', 'name')), [('DR-1', 'Old Drill')])
+
+    def test_owned_products_without_a_purchase_price_cost_nothing(self):
+        result = self.run_import('Drill,DR-1,4,7.50,,yes\n')
+
+        self.assertEqual((result.created, result.errors), (1, []))
+        self.assertEqual(Product.objects.get().purchase_price, Decimal('0.00'))
+
+    def test_progress_is_reported_per_chunk(self):
+        calls = []
+        self.run_import(
+            'Drill,DR-1,4,7.50,300,yes\nSaw,SW-1,2,5.00,200,no\nLadder,LD-1,1,3.00,90,1\n',
+            batch_size=2, progress=lambda rows, result: calls.append((rows, result.created))
+        )
+        self.assertEqual(calls, [(2, 2), (3, 3)])
+
+    @override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+    def test_uploads_are_imported_by_a_task(self):
+        self.client.force_login(User.objects.create_user('clerk', password='x'))
+        upload = SimpleUploadedFile(
+            'products.csv', (self.HEADER + 'Drill,DR-1,4,7.50,300,yes\nSaw,SW-1,x,5.00,1,no\n').encode()
+        )
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+            response = self.client.post(reverse('product_import'), {'csv_file': upload})
+            self.assertEqual(os.listdir(os.path.join(media, 'imports')), [])
+
+        status = self.client.get(response['Location'])
+        self.assertEqual(status.context['status']['state'], 'done')
+        self.assertEqual((status.context['status']['rows_done'], status.context['percent']), (2, 100))
+        self.assertContains(status, 'Import completed with 1 products created and 0 updated')
+        self.assertContains(status, 'stock:')
+        self.assertEqual(list(Product.objects.values_list('sku', flat=True)), ['DR-1'])
+
+    def test_unqueued_imports_are_reported(self):
+        self.client.force_login(User.objects.create_user('clerk', password='x'))
+        upload = SimpleUploadedFile('products.csv', (self.HEADER + 'Drill,DR-1,4,7.50,300,yes\n').encode())
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media), \
+                mock.patch('rental.importers.dispatch', return_value=None):
+            response = self.client.post(reverse('product_import'), {'csv_file': upload})
+        self.assertContains(self.client.get(response['Location']), 'could not be queued')
+        self.assertFalse(Product.objects.exists())
+        self.assertEqual(self.client.get(reverse('product_import_status', args=['unknown'])).status_code, 404)
+
+    def test_missing_columns_stop_the_import(self):
+        result = ProductImporter(BytesIO(b'name,sku\nDrill,DR-1\n')).run()
+
+        self.assertEqual(result.errors[0]['line'], 1)
+        self.assertIn('rental_price, stock, is_rentable', result.errors[0]['message'])
+        self.assertFalse(Product.objects.exists())
+
+
+class BarcodeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('clerk', password='x')
+        Product.objects.create(name='Drill', sku='DR-1', stock=1, rental_price=Decimal('5.00'))
+        Product.objects.create(name='Saw', sku='4006381333931', stock=1, rental_price=Decimal('5.00'))
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(BARCODE_CACHE_DIR=directory.name))
+        self.client.force_login(self.user)
+
+    def cached_files(self):
+        return sorted(path.name for path in barcodes.cache_root().rglob('*.*'))
+
+    def test_first_request_renders_and_later_ones_hit_the_cache(self):
+        url = reverse('product_barcode', args=['DR-1', 'svg'])
+        response = self.client.get(url)
+        self.assertEqual((response.status_code, response['Content-Type']), (200, 'image/svg+xml'))
+        self.assertTrue(b''.join(response.streaming_content).lstrip().startswith(b'<?xml'))
+        self.assertEqual(self.cached_files(), [barcodes.cache_path('DR-1').name])
+
+        with mock.patch('rental.barcodes.render') as render:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        render.assert_not_called()
+
+        self.assertEqual(self.client.get(reverse('product_barcode', args=['DR-1', 'png']))['Content-Type'], 'image/png')
+
+    def test_unknown_skus_and_formats_are_not_found(self):
+        for sku, fmt, params in (
+            ('NOT-A-PRODUCT', 'svg', {}), ('DR-1', 'gif', {}), ('DR-1', 'svg', {'symbology': 'qr'}),
+            # A real SKU that the symbology can't encode
+            ('DR-1', 'svg', {'symbology': 'ean13'}),
+        ):
+            with self.subTest(sku=sku, fmt=fmt, params=params):
+                self.assertEqual(self.client.get(reverse('product_barcode', args=[sku, fmt]), params).status_code, 404)
+        self.assertEqual(self.cached_files(), [])
+
+    def test_requires_login(self):
+        self.client.logout()
+        response = self.client.get(reverse('product_barcode', args=['DR-1', 'svg']))
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response['Location'].startswith(resolve_url(settings.LOGIN_URL)))
+        self.assertEqual(self.cached_files(), [])
+
+    def test_warm_barcodes_renders_what_is_missing(self):
+        out = StringIO()
+        call_command('warm_barcodes', '--symbology', 'ean13', '--format', 'svg', '--format', 'png', stdout=out)
+        self.assertIn('Skipped DR-1', out.getvalue())
+        self.assertIn('Rendered 2 barcode images for 2 products', out.getvalue())
+        self.assertEqual(len(self.cached_files()), 2)
+
+        out = StringIO()
+        call_command('warm_barcodes', stdout=out)
+        self.assertIn('Rendered 2 barcode images', out.getvalue())
+        out = StringIO()
+        call_command('warm_barcodes', stdout=out)
+        self.assertIn('Rendered 0 barcode images', out.getvalue())
+        self.assertEqual(len(self.cached_files()), 4)
+
+
+class PDFCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        today = timezone.localdate()
+        customer = Customer.objects.create(name='Acme', phone='1')
+        product = Product.objects.create(name='Drill', sku='DR-1', stock=5, rental_price=Decimal('10.00'))
+        cls.rental = RentalAgreement.objects.create(
+            customer=customer, start_date=today, expected_return_date=today + timedelta(days=2)
+        )
+        RentalItem.objects.create(rental=cls.rental, product=product, quantity=1, rental_price=Decimal('10.00'))
+        Invoice.objects.create(
+            rental_agreement=cls.rental, invoice_number='INV-1', due_date=today, total_amount=Decimal('31.50')
+        )
+        cls.payment = Payment.objects.create(
+            rental_agreement=cls.rental, amount=Decimal('10.00'), payment_date=today, payment_method='cash',
+            receipt_number='RCPT-1'
+        )
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(PDF_CACHE_DIR=directory.name))
+
+    def test_unchanged_documents_are_served_from_the_cache(self):
+        path, key = pdf_cache.get_or_render('agreement', self.rental.pk)
+        self.assertTrue(path.read_bytes().startswith(b'%PDF'))
+
+        with mock.patch.object(pdf_cache, 'render') as render:
+            self.assertEqual(pdf_cache.get_or_render('agreement', self.rental.pk), (path, key))
+        render.assert_not_called()
+
+    def test_edits_to_printed_fields_render_a_new_version(self):
+        path, key = pdf_cache.get_or_render('agreement', self.rental.pk)
+        self.rental.notes = 'Deliver to site'
+        self.rental.save()
+
+        new_path, new_key = pdf_cache.get_or_render('agreement', self.rental.pk)
+        self.assertNotEqual(new_key, key)
+        self.assertFalse(path.exists())
+        self.assertEqual(list(new_path.parent.glob('*.pdf')), [new_path])
+
+    def test_payment_edits_change_the_invoice(self):
+        key = pdf_cache.fingerprint('invoice', self.rental.pk)
+        for field, value in (('receipt_number', 'RCPT-2'), ('notes', 'Paid at the counter')):
+            with self.subTest(field=field):
+                setattr(self.payment, field, value)
+                self.payment.save()
+                self.assertNotEqual(pdf_cache.fingerprint('invoice', self.rental.pk), key)
+                key = pdf_cache.fingerprint('invoice', self.rental.pk)
+
+    def test_every_printed_field_is_in_the_fingerprint(self):
+        rental, payment = self.rental, self.payment
+        item = rental.items.get()
+        edits = [
+            (rental, 'start_date', rental.start_date - timedelta(days=1)),
+            (rental, 'expected_return_date', rental.expected_return_date + timedelta(days=1)),
+            (rental, 'status', 'returned'),
+            (rental, 'discount', Decimal('5.00')),
+            (rental, 'apply_vat', False),
+            (rental, 'notes', 'Deliver to site'),
+            (rental.customer, 'name', 'Acme Ltd'),
+            (rental.customer, 'company', 'Acme Holdings'),
+            (rental.customer, 'phone', '2'),
+            (rental.customer, 'email', 'acme@example.com'),
+            (item.product, 'name', 'Hammer Drill'),
+            (item, 'quantity', 2),
+            (item, 'rental_price', Decimal('12.00')),
+            (rental.invoice, 'invoice_number', 'INV-9'),
+            (rental.invoice, 'due_date', rental.invoice.due_date + timedelta(days=7)),
+            (payment, 'payment_date', payment.payment_date - timedelta(days=1)),
+            (payment, 'receipt_number', 'RCPT-9'),
+            (payment, 'payment_method', 'card'),
+            (payment, 'amount', Decimal('15.00')),
+        ]
+        for obj, field, value in edits:
+            with self.subTest(model=obj._meta.model_name, field=field):
+                before = {kind: pdf_cache.fingerprint(kind, rental.pk) for kind in pdf_cache.KINDS}
+                setattr(obj, field, value)
+                obj.save()
+                for kind in pdf_cache.KINDS:
+                    self.assertNotEqual(pdf_cache.fingerprint(kind, rental.pk), before[kind], kind)
+
+    def test_deleted_agreements_are_discarded(self):
+        path, _ = pdf_cache.get_or_render('agreement', self.rental.pk)
+        pdf_cache.discard(self.rental.pk)
+        self.assertFalse(path.parent.exists())
+        self.assertIsNone(pdf_cache.fingerprint('agreement', 0))
+
+    def test_receipts_and_statements_require_login(self):
+        urls = [
+            reverse('payment_receipt_pdf', args=[self.payment.pk]),
+            reverse('customer_statement_pdf', args=[self.rental.customer_id]),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 302)
+                self.assertTrue(response['Location'].startswith(resolve_url(settings.LOGIN_URL)))
+
+        self.client.force_login(User.objects.create_user('clerk', password='x'))
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual((response.status_code, response['Content-Type']), (200, 'application/pdf'))
+                self.assertTrue(response.content.startswith(b'%PDF'))
+
+
+@override_settings(INVOICE_EXPORT_WORKERS=1)
+class InvoiceExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('clerk', password='x')
+        customer = Customer.objects.create(name='Acme', phone='1')
+        product = Product.objects.create(name='Drill', sku='DR-1', stock=5, rental_price=Decimal('10.00'))
+        for number, issued, status in (
+            ('INV-1', date(2026, 1, 5), 'paid'), ('INV-2', date(2026, 1, 20), 'unpaid'), ('INV-3', date(2026, 2, 3), 'paid'),
+        ):
+            rental = RentalAgreement.objects.create(
+                customer=customer, start_date=issued, expected_return_date=issued + timedelta(days=1), status='returned'
+            )
+            RentalItem.objects.create(rental=rental, product=product, quantity=1, rental_price=Decimal('10.00'))
+            invoice = Invoice.objects.create(
+                rental_agreement=rental, invoice_number=number, due_date=issued, total_amount=Decimal('21.00'),
+                payment_status=status
+            )
+            Invoice.objects.filter(pk=invoice.pk).update(issue_date=issued)
+
+    def export(self, **params):
+        response = self.client.get(reverse('invoice_export'), params)
+        self.assertEqual(response.status_code, 200)
+        return zipfile.ZipFile(BytesIO(b''.join(response.streaming_content)))
+
+    def test_exports_the_invoices_in_range_as_one_zip(self):
+        self.client.force_login(self.user)
+
+        archive = self.export(start_date='2026-01-01', end_date='2026-01-31')
+        self.assertEqual(archive.namelist(), ['invoice_INV-1.pdf', 'invoice_INV-2.pdf'])
+        self.assertTrue(archive.read('invoice_INV-1.pdf').startswith(b'%PDF'))
+        self.assertEqual(self.export(status='paid').namelist(), ['invoice_INV-1.pdf', 'invoice_INV-3.pdf'])
+
+    def test_rejects_bad_filters(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('invoice_export'), {'start_date': 'January'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('invoice_export'), {'status': 'lost'}).status_code, 400)
+
+    def test_requires_login(self):
+        response = self.client.get(reverse('invoice_export'))
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response['Location'].startswith(resolve_url(settings.LOGIN_URL)))
+
+
+class OverdueSweepTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.today = timezone.localdate()
+        cls.staff = User.objects.create_user('staff', password='x', is_staff=True)
+        cls.customer = Customer.objects.create(name='Acme', phone='1')
+        cls.product = Product.objects.create(name='Drill', sku='DR-1', stock=10, rental_price=Decimal('5.00'))
+
+    def setUp(self):
+        cache.clear()
+
+    def rent(self, due_in, status='active'):
+        rental = RentalAgreement.objects.create(
+            customer=self.customer, start_date=self.today - timedelta(days=10),
+            expected_return_date=self.today + timedelta(days=due_in), status=status
+        )
+        RentalItem.objects.create(rental=rental, product=self.product, quantity=1, rental_price=Decimal('5.00'))
+        return rental
+
+    def statuses(self, *rentals):
+        return [RentalAgreement.objects.get(pk=rental.pk).status for rental in rentals]
+
+    def test_marks_past_due_active_agreements_in_batches(self):
+        late = [self.rent(-1), self.rent(-3), self.rent(-5)]
+        due_today, returned = self.rent(0), self.rent(-2, status='returned')
+
+        self.assertEqual(mark_overdue(batch_size=2), 3)
+
+        self.assertEqual(self.statuses(*late, due_today, returned), ['overdue'] * 3 + ['active', 'returned'])
+        self.assertEqual(SweepState.objects.get(name='mark_overdue').last_count, 3)
+        self.assertEqual(mark_overdue(), 0)
+
+    def test_back_dated_agreements_are_swept_on_the_next_run(self):
+        self.rent(-1)
+        mark_overdue()
+        back_dated = self.rent(-30)
+        edited = self.rent(5)
+        edited.expected_return_date = self.today - timedelta(days=20)
+        edited.save()
+
+        self.assertEqual(mark_overdue(), 2)
+        self.assertEqual(self.statuses(back_dated, edited), ['overdue', 'overdue'])
+
+    def test_swept_agreements_still_count_as_overdue(self):
+        rental = self.rent(-2)
+        mark_overdue()
+        rental.refresh_from_db()
+
+        self.assertTrue(rental.is_overdue)
+        stats = DashboardStats.get()
+        self.assertEqual(stats['overdue_rentals'], 1)
+        self.assertEqual([overdue.pk for overdue in stats['overdue_rentals_list']], [rental.pk])
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('customer_detail', args=[self.customer.pk]))
+        self.assertEqual(response.context['overdue_rentals'].count(), 1)
+        # Swept agreements keep their stock
+        self.assertEqual(self.product.available_stock, 9)
+
+    def test_swept_agreements_can_be_returned(self):
+        rental = self.rent(-2)
+        mark_overdue()
+        self.client.force_login(self.staff)
+        url = reverse('rental_return', args=[rental.pk])
+
+        self.assertEqual(self.client.get(url).status_code, 200)
+        response = self.client.post(url, {
+            'return_date': self.today.isoformat(), 'amount_to_collect': '0', 'payment_method': 'cash',
+        })
+
+        self.assertRedirects(response, reverse('rental_detail', args=[rental.pk]), fetch_redirect_response=False)
+        self.assertEqual(self.statuses(rental), ['returned'])
+        self.assertEqual(self.product.available_stock, 10)
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', password='x', is_staff=True)
+        # Repeated names and dates, so pages must break ties on the primary key
+        for i in range(45):
+            Customer.objects.create(name=f'Customer {i % 7}', phone=str(i))
+        category = ExpenseCategory.objects.create(name='maintenance')
+        today = timezone.localdate()
+        for i in range(45):
+            Expense.objects.create(
+                date=today - timedelta(days=i % 4), amount=Decimal('1.00'), category=category,
+                description=f'Expense {i}', created_by=cls.staff
+            )
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def walk(self, url, context_name, params=None):
+        """Every page from the first, following next links, then back again with previous links"""
+        response = self.client.get(url, params)
+        pages = [[obj.pk for obj in response.context[context_name]]]
+        while response.context['page_obj'].has_next():
+            response = self.client.get(url + response.context['page_obj'].next_url)
+            pages.append([obj.pk for obj in response.context[context_name]])
+        backwards = [pages[-1]]
+        while response.context['page_obj'].has_previous():
+            response = self.client.get(url + response.context['page_obj'].previous_url)
+            backwards.append([obj.pk for obj in response.context[context_name]])
+        return pages, backwards[::-1]
+
+    def test_pages_cover_the_ordering_exactly_once(self):
+        for url, context_name, expected in (
+            (reverse('customer_list'), 'customers', Customer.objects.order_by('name', 'pk')),
+            (reverse('expense_list'), 'expenses', Expense.objects.order_by('-date', '-pk')),
+        ):
+            with self.subTest(url=url):
+                pages, backwards = self.walk(url, context_name)
+                self.assertEqual([len(page) for page in pages], [20, 20, 5])
+                self.assertEqual(sum(pages, []), list(expected.values_list('pk', flat=True)))
+                self.assertEqual(backwards, pages)
+
+    def test_page_links_keep_the_filters(self):
+        category = ExpenseCategory.objects.get()
+        response = self.client.get(reverse('expense_list'), {'category': category.pk})
+        page = response.context['page_obj']
+
+        self.assertIn(f'category={category.pk}', page.next_url)
+        self.assertEqual(page.first_url, f'?category={category.pk}')
+
+    def test_counts_are_capped(self):
+        with mock.patch.object(CustomerListView, 'approximate_count_limit', 30):
+            page = self.client.get(reverse('customer_list')).context['page_obj']
+        self.assertEqual((page.count, page.count_is_exact), (30, False))
+
+    def test_tampered_cursors_are_not_found(self):
+        for cursor in ('not-a-cursor', encode_cursor('next', ['Customer 1']), encode_cursor('sideways', ['a', 1])):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.client.get(reverse('customer_list'), {'cursor': cursor}).status_code, 404)
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.drill = Product.objects.create(
+            name='Cordless Drill 18V', sku='DR-18', stock=1, rental_price=Decimal('5.00'), purchase_price=Decimal('90.00')
+        )
+        cls.kit = Product.objects.create(
+            name='Hammer Kit', sku='HK-1', stock=1, rental_price=Decimal('5.00'), purchase_price=Decimal('90.00'),
+            description='Comes with a drill bit set'
+        )
+        cls.customer = Customer.objects.create(
+            name='Globex', company='Globex Trading', email='orders@globex.example', phone='0501234567'
+        )
+
+    def names(self, queryset, text):
+        return list(queryset.search(text).order_by('search_rank', 'pk').values_list('name', flat=True))
+
+    def test_every_word_matches_as_a_prefix(self):
+        self.assertEqual(self.names(Product.objects, 'dri 18v'), ['Cordless Drill 18V'])
+        self.assertEqual(self.names(Product.objects, 'hk'), ['Hammer Kit'])
+        self.assertEqual(self.names(Product.objects, 'drill saw'), [])
+        self.assertEqual(self.names(Customer.objects, 'globex trad'), ['Globex'])
+        self.assertEqual(self.names(Customer.objects, 'orders'), ['Globex'])
+
+    def test_name_matches_rank_first(self):
+        self.assertEqual(self.names(Product.objects, 'drill'), ['Cordless Drill 18V', 'Hammer Kit'])
+
+    def test_query_syntax_is_taken_literally(self):
+        for text in ('"cordless', 'cordless:drill', '(cordless) drill*', '-cordless^'):
+            with self.subTest(text=text):
+                self.assertEqual(self.names(Product.objects, text), ['Cordless Drill 18V'])
+        # OR is a word to match, not an operator
+        self.assertEqual(self.names(Product.objects, 'cordless OR saw'), [])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.drill.name = 'Impact Driver'
+        self.drill.save()
+        self.assertEqual(self.names(Product.objects, 'impact'), ['Impact Driver'])
+        self.assertEqual(self.names(Product.objects, 'cordless'), [])
+
+        self.customer.delete()
+        self.assertEqual(self.names(Customer.objects, 'globex'), [])
+
+    @skipUnless(connection.vendor == 'sqlite', "Only SQLite keeps a separate FTS5 table to reindex")
+    def test_bulk_updates_are_reindexed(self):
+        Product.objects.filter(pk=self.kit.pk).update(name='Sledge Kit')
+        self.assertEqual(self.names(Product.objects, 'sledge'), [])
+
+        search.reindex(Product, [self.kit.pk])
+        self.assertEqual(self.names(Product.objects, 'sledge'), ['Sledge Kit'])
+
+        Product.objects.filter(pk=self.drill.pk).update(name='Rotary Hammer')
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.names(Product.objects, 'rotary'), ['Rotary Hammer'])
+
+
+class FuzzyLookupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('clerk', password='x')
+        cls.globex = Customer.objects.create(name='Globex', company='Globex Trading', phone='050-123 4471')
+        cls.initech = Customer.objects.create(name='Initech', phone='0559876543')
+        cls.drill = Product.objects.create(
+            name='Cordless Drill', sku='DR-18', stock=1, rental_price=Decimal('5.00'), purchase_price=Decimal('90.00')
+        )
+
+    def setUp(self):
+        fuzzy.reset()
+        self.addCleanup(fuzzy.reset)
+        self.client.force_login(self.user)
+
+    def names(self, kind, query):
+        response = self.client.get(reverse('lookup_api', args=[kind]), {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [result['name'] for result in response.json()['results']]
+
+    def test_tolerates_typos_and_partial_words(self):
+        self.assertEqual(self.names('customer', 'glbex'), ['Globex'])
+        self.assertEqual(self.names('customer', 'initec'), ['Initech'])
+        self.assertEqual(self.names('product', 'cordles dri'), ['Cordless Drill'])
+        self.assertEqual(self.names('customer', ''), [])
+
+    def test_numbers_match_by_prefix_or_suffix(self):
+        self.assertEqual(self.names('customer', '4471'), ['Globex'])
+        self.assertEqual(self.names('customer', '0501234471'), ['Globex'])
+        self.assertEqual(self.names('customer', '055'), ['Initech'])
+        self.assertEqual(self.names('customer', '4472'), [])
+
+    def test_loaded_index_follows_saves_and_deletes(self):
+        self.assertEqual(self.names('product', 'drill'), ['Cordless Drill'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.drill.name = 'Impact Driver'
+            self.drill.save()
+        self.assertEqual(self.names('product', 'impact'), ['Impact Driver'])
+        self.assertEqual(self.names('product', 'cordless'), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.initech.delete()
+        self.assertEqual(self.names('customer', 'initech'), [])
+
+    def test_rejects_unknown_kinds_and_bad_limits(self):
+        self.assertEqual(self.client.get(reverse('lookup_api', args=['invoice']), {'q': 'a'}).status_code, 404)
+        response = self.client.get(reverse('lookup_api', args=['customer']), {'q': 'globex', 'limit': 'all'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_requires_login(self):
+        self.client.logout()
+        response = self.client.get(reverse('lookup_api', args=['customer']), {'q': 'globex'})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response['Location'].startswith(resolve_url(settings.LOGIN_URL)))
+
+
+class DumpLoadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.today = timezone.localdate()
+        cls.user = User.objects.create_user('clerk', password='x')
+        customer = Customer.objects.create(name='Acme', phone='1')
+        product = Product.objects.create(
+            name='Drill', sku='DR-1', stock=5, rental_price=Decimal('10.00'), purchase_price=Decimal('90.00')
+        )
+        rental = RentalAgreement.objects.create(
+            customer=customer, start_date=cls.today, expected_return_date=cls.today + timedelta(days=2)
+        )
+        RentalItem.objects.create(rental=rental, product=product, quantity=2, rental_price=Decimal('10.00'))
+        Invoice.objects.create(
+            rental_agreement=rental, invoice_number='INV-1', due_date=cls.today, total_amount=Decimal('42.00')
+        )
+        Payment.objects.create(
+            rental_agreement=rental, amount=Decimal('20.00'), payment_date=cls.today, payment_method='cash',
+            receipt_number='R-1', processed_by=cls.user
+        )
+        Expense.objects.create(
+            category=ExpenseCategory.objects.create(name='maintenance'), description='Oil', amount=Decimal('5.00'),
+            product=product, created_by=cls.user
+        )
+
+    def load(self, text, **kwargs):
+        return fixtures.DumpLoader(StringIO(text), **kwargs).run()
+
+    def test_export_and_load_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = f'{directory}/dump.jsonl'
+            call_command('export_dump', path, stdout=StringIO())
+            Payment.objects.all().delete()
+            RentalAgreement.objects.all().delete()
+            Customer.objects.all().delete()
+            Expense.objects.all().delete()
+            Product.objects.all().delete()
+            ExpenseCategory.objects.all().delete()
+            call_command('load_dump', path, stdout=StringIO())
+
+        rental = RentalAgreement.objects.get()
+        self.assertEqual(rental.customer.name, 'Acme')
+        self.assertEqual((rental.subtotal, rental.paid_amount), (Decimal('60.00'), Decimal('20.00')))
+        self.assertEqual(rental.invoice.invoice_number, 'INV-1')
+        item = rental.items.get()
+        self.assertEqual((item.product.sku, item.quantity), ('DR-1', 2))
+        # The existing user is reused rather than duplicated
+        self.assertEqual(rental.payments.get().processed_by, self.user)
+        self.assertEqual(Expense.objects.get().product, item.product)
+        self.assertEqual(ReservationLedger.peak(item.product_id, self.today, self.today), 2)
+
+    def test_array_and_json_lines_parse_alike(self):
+        objects = [{'model': 'rental.customer', 'pk': i, 'fields': {'name': f'C{i}', 'phone': str(i)}} for i in range(5)]
+        lines = '\n'.join(json.dumps(obj) for obj in objects) + '\n'
+        array = json.dumps(objects, indent=2)
+        for text in (lines, array):
+            # A small chunk size makes objects straddle reads
+            parsed = list(fixtures.iter_objects(StringIO(text), chunk_size=16))
+            self.assertEqual([obj for _, obj in parsed], objects)
+        self.assertEqual([line for line, _ in fixtures.iter_objects(StringIO(lines))], [1, 2, 3, 4, 5])
+
+    def test_syntax_errors_report_their_line(self):
+        for text, message in (
+            ('{"model": "rental.customer"}\n{"model": }\n', 'Line 2'),
+            ('[\n  {"pk": 1},\n  {"pk": 2}\n  {"pk": 3}\n]', "Line 4: Expected ',' or ']'"),
+            ('[\n  {"pk": 1}\n', 'Missing the closing ]'),
+        ):
+            with self.subTest(text=text), self.assertRaisesMessage(fixtures.DumpSyntaxError, message):
+                list(fixtures.iter_objects(StringIO(text)))
+
+    def test_invalid_objects_are_reported_and_the_rest_loaded(self):
+        dump = [
+            {'model': 'rental.customer', 'pk': 7, 'fields': {'name': 'Globex', 'phone': '2'}},
+            {'model': 'rental.customer', 'pk': 8, 'fields': {'name': 'Initech', 'phone': '3', 'fax': '4'}},
+            {'model': 'rental.product', 'pk': 3, 'fields': {'name': 'Saw', 'sku': 'SW-1', 'rental_price': 'cheap'}},
+            {'model': 'rental.shelf', 'pk': 1, 'fields': {}},
+            {'model': 'sessions.session', 'pk': 'abc', 'fields': {}},
+            {'model': 'rental.rentalagreement', 'pk': 9, 'fields': {
+                'customer': 8, 'start_date': '2026-01-01', 'expected_return_date': '2026-01-02'
+            }},
+        ]
+        result = self.load('\n'.join(json.dumps(obj) for obj in dump))
+        self.assertEqual(result.created, {'rental.customer': 1})
+        self.assertEqual(result.skipped, 1)
+        self.assertEqual([(error['line'], error['model']) for error in result.errors], [
+            (2, 'rental.customer'), (3, 'rental.product'), (4, 'rental.shelf'), (6, 'rental.rentalagreement'),
+        ])
+        self.assertIn('fax', result.errors[0]['message'])
+        self.assertIn('was not loaded', result.errors[3]['message'])
+        self.assertTrue(Customer.objects.filter(name='Globex').exists())
+
+    def test_existing_rows_are_matched_on_natural_keys(self):
+        product = Product.objects.get()
+        # An old-schema dump: the item still refers to its agreement as "agreement" and has a total_price
+        dump = json.dumps([
+            {'model': 'rental.product', 'pk': 50, 'fields': {'name': 'Drill', 'sku': 'DR-1', 'rental_price': '10.00'}},
+            {'model': 'rental.customer', 'pk': 50, 'fields': {'name': 'Globex', 'phone': '2'}},
+            {'model': 'rental.rentalagreement', 'pk': 50, 'fields': {
+                'customer': 50, 'start_date': '2026-01-01', 'expected_return_date': '2026-01-02', 'rental_days': 1
+            }},
+            {'model': 'rental.rentalitem', 'pk': 50, 'fields': {
+                'agreement': 50, 'product': 50, 'quantity': 1, 'rental_price': '10.00', 'total_price': '10.00'
+            }},
+        ])
+        result = self.load(dump)
+        self.assertEqual(result.errors, [])
+        self.assertEqual(result.matched, {'rental.product': 1})
+        self.assertEqual(Product.objects.count(), 1)
+        self.assertEqual(RentalItem.objects.get(rental__customer__name='Globex').product, product)
+
+    def test_dry_run_counts_without_writing(self):
+        buffer = StringIO()
+        fixtures.export(buffer)
+        Payment.objects.all().delete()
+        Invoice.objects.all().delete()
+
+        result = self.load(buffer.getvalue(), dry_run=True)
+        self.assertEqual(result.errors, [])
+        self.assertEqual(result.created['rental.payment'], 1)
+        self.assertEqual(result.matched, {'auth.user': 1, 'rental.expensecategory': 1, 'rental.product': 1})
+        self.assertEqual((Customer.objects.count(), Payment.objects.count()), (1, 0))
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('clerk', password='x')
+        globex = Customer.objects.create(name='Globex', phone='1', company='=HYPERLINK("http://x")')
+        acme = Customer.objects.create(name='Acme', phone='2', discount_rate=Decimal('5.00'))
+        today = timezone.localdate()
+        for customer, status in ((globex, 'overdue'), (acme, 'cancelled')):
+            RentalAgreement.objects.create(
+                customer=customer, start_date=today, expected_return_date=today, status=status
+            )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def csv_rows(self, url, **params):
+        response = self.client.get(url, {'export': 'csv', **params})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('attachment; filename="', response['Content-Disposition'])
+        text = b''.join(response.streaming_content).decode('utf-8')
+        self.assertTrue(text.startswith('\ufeff'))
+        return list(csv.reader(StringIO(text[1:])))
+
+    def test_csv_lists_every_row_in_page_order(self):
+        rows = self.csv_rows(reverse('customer_list'))
+        self.assertEqual(rows[0][:3], ['Name', 'Company', 'Phone'])
+        self.assertEqual([row[0] for row in rows[1:]], ['Acme', 'Globex'])
+        self.assertEqual(rows[1][6], '5.00')
+
+    def test_formulas_are_escaped(self):
+        rows = self.csv_rows(reverse('customer_list'), search='globex')
+        self.assertEqual(rows[1][1], '\'=HYPERLINK("http://x")')
+
+    def test_filters_apply_and_choices_are_labelled(self):
+        rows = self.csv_rows(reverse('rental_list'), status='overdue')
+        self.assertEqual([(row[1], row[5]) for row in rows[1:]], [('Globex', 'Overdue')])
+
+    def test_xlsx_opens_as_a_workbook(self):
+        response = self.client.get(reverse('rental_list'), {'export': 'xlsx'})
+        self.assertEqual(response.status_code, 200)
+        workbook = load_workbook(BytesIO(b''.join(response.streaming_content)), read_only=True)
+        rows = list(workbook.active.iter_rows(values_only=True))
+        self.assertEqual(rows[0][:2], ('Agreement', 'Customer'))
+        self.assertEqual(sorted(row[5] for row in rows[1:]), ['Cancelled', 'Overdue'])
+
+    def test_unknown_format_is_not_found(self):
+        self.assertEqual(self.client.get(reverse('customer_list'), {'export': 'pdf'}).status_code, 404)
+
+    def test_exports_require_login(self):
+        self.client.logout()
+        for name in (
+            'customer_list', 'rental_list', 'product_list', 'expense_list', 'invoice_list',
+            'product_utilization_report', 'customer_activity_report', 'expense_report',
+        ):
+            with self.subTest(name=name):
+                response = self.client.get(reverse(name), {'export': 'csv'})
+                self.assertEqual(response.status_code, 302)
+                self.assertTrue(response['Location'].startswith(resolve_url(settings.LOGIN_URL)))
+
+
+class FragmentCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.today = timezone.localdate()
+        cls.staff = User.objects.create_user('staff', password='x', is_staff=True)
+        cls.customer = Customer.objects.create(name='Acme', phone='1')
+        cls.product = Product.objects.create(
+            name='Drill', sku='DR-1', stock=5, rental_price=Decimal('10.00'), purchase_price=Decimal('90.00')
+        )
+        cls.rental = RentalAgreement.objects.create(
+            customer=cls.customer, start_date=cls.today, expected_return_date=cls.today + timedelta(days=2)
+        )
+        cls.item = RentalItem.objects.create(
+            rental=cls.rental, product=cls.product, quantity=1, rental_price=Decimal('10.00')
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.staff)
+
+    def test_key_follows_updated_at_and_generations(self):
+        key = fragment_cache.fragment_key('customer-info', [self.customer], ['rental.Payment'])
+        self.assertEqual(fragment_cache.fragment_key('customer-info', [self.customer], ['rental.Payment']), key)
+
+        self.customer.save()
+        edited = fragment_cache.fragment_key('customer-info', [self.customer], ['rental.Payment'])
+        self.assertNotEqual(edited, key)
+
+        fragment_cache.bump(Payment)
+        self.assertNotEqual(fragment_cache.fragment_key('customer-info', [self.customer], ['rental.Payment']), edited)
+        self.assertNotEqual(fragment_cache.fragment_key('stats', [1]), fragment_cache.fragment_key('stats', [2]))
+
+    def test_render_runs_once_per_key(self):
+        render = mock.Mock(return_value='<p>Acme</p>')
+        for _ in range(2):
+            self.assertEqual(fragment_cache.get_or_render('customer-info', render, [self.customer]), '<p>Acme</p>')
+        render.assert_called_once_with()
+
+        fragment_cache.bump(Customer)
+        fragment_cache.get_or_render('customer-info', render, [self.customer], ['rental.Customer'])
+        self.assertEqual(render.call_count, 2)
+
+    def test_rental_detail_reuses_its_fragments(self):
+        url = reverse('rental_detail', args=[self.rental.pk])
+        with CaptureQueriesContext(connection) as first:
+            self.client.get(url)
+        with CaptureQueriesContext(connection) as second:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(len(second), len(first))
+
+    def rental_details_key(self):
+        context = self.client.get(reverse('rental_detail', args=[self.rental.pk])).context
+        rental = context['rental']
+        return fragment_cache.fragment_key('rental-details', [rental, rental.customer, context['item_products']])
+
+    def test_rental_details_follow_their_own_items_and_products(self):
+        key = self.rental_details_key()
+        other = Product.objects.create(
+            name='Saw', sku='SW-1', stock=5, rental_price=Decimal('5.00'), purchase_price=Decimal('50.00')
+        )
+        other.save()
+        self.assertEqual(self.rental_details_key(), key)
+
+        self.product.name = 'Hammer drill'
+        self.product.save()
+        renamed = self.rental_details_key()
+        self.assertNotEqual(renamed, key)
+        self.assertContains(self.client.get(reverse('rental_detail', args=[self.rental.pk])), 'Hammer drill')
+
+        # Totals don't change, so only the item's own save marks the agreement edited
+        self.item.return_notes = 'Scratched'
+        self.item.save()
+        self.assertNotEqual(self.rental_details_key(), renamed)
+
+    def test_customer_stats_are_counted_lazily(self):
+        Invoice.objects.create(
+            rental_agreement=self.rental, invoice_number='INV-1', due_date=self.today, total_amount=Decimal('31.50')
+        )
+        url = reverse('customer_detail', args=[self.customer.pk])
+        with CaptureQueriesContext(connection) as first:
+            response = self.client.get(url)
+        self.assertContains(response, '$31.50')
+        self.assertEqual(response.context['active_rentals'].count(), 1)
+        with CaptureQueriesContext(connection) as second:
+            self.client.get(url)
+        self.assertLess(len(second), len(first))
+
+    def test_rental_detail_shows_new_payments(self):
+        url = reverse('rental_detail', args=[self.rental.pk])
+        self.assertNotContains(self.client.get(url), 'R-77')
+        with self.captureOnCommitCallbacks(execute=True):
+            Payment.objects.create(
+                rental_agreement=self.rental, amount=Decimal('12.00'), payment_date=self.today,
+                payment_method='cash', receipt_number='R-77'
+            )
+        self.assertContains(self.client.get(url), 'R-77')
+
+    def test_dashboard_figures_follow_the_stats_snapshot(self):
+        self.assertContains(self.client.get(reverse('dashboard')), '$0.00')
+        Expense.objects.create(
+            date=self.today, amount=Decimal('15.00'), category=ExpenseCategory.objects.create(name='maintenance'),
+            description='Service', created_by=self.staff
+        )
+        self.assertContains(self.client.get(reverse('dashboard')), '$15.00')
+
+
+@skipUnless(connection.vendor == 'sqlite', "Query plans are checked against SQLite's EXPLAIN output")
+class QueryPlanTests(TestCase):
+    """The filters behind the dashboard, reports and list views are served by an index"""
+
+    def assertUsesIndex(self, queryset, *names):
+        plan = queryset.explain()
+        self.assertTrue(
+            any(f'INDEX {name} ' in plan for name in names),
+            f"Expected one of {names} in the plan:\n{plan}"
+        )
+
+    def setUp(self):
+        self.today = timezone.now().date()
+
+    def test_overdue_rentals(self):
+        self.assertUsesIndex(
+            RentalAgreement.objects.filter(status='active', expected_return_date__lt=self.today),
+            'rental_active_due_idx', 'rental_rent_status_df9042_idx'
+        )
+
+    def test_customer_rental_counts(self):
+        self.assertUsesIndex(
+            RentalAgreement.objects.filter(customer_id=1, status='active'), 'rental_customer_status_idx'
+        )
+
+    def test_outstanding_invoices(self):
+        self.assertUsesIndex(
+            Invoice.objects.filter(payment_status__in=['unpaid', 'partial'], issue_date__lt=self.today),
+            'invoice_status_issued_idx'
+        )
+
+    def test_monthly_invoice_revenue(self):
+        self.assertUsesIndex(
+            Invoice.objects.filter(issue_date__year=self.today.year, issue_date__month=self.today.month),
+            'invoice_issue_date_idx'
+        )
+
+    def test_expenses_in_date_range(self):
+        self.assertUsesIndex(
+            Expense.objects.filter(date__range=[self.today - timedelta(days=30), self.today]),
+            'expense_date_category_idx'
+        )
+
+    def test_product_rentals_by_status(self):
+        self.assertUsesIndex(
+            RentalItem.objects.filter(product_id=1, rental__status='active'), 'rentalitem_product_rental_idx'
+        )
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class RequestMetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', password='x', is_staff=True)
+        today = timezone.now().date()
+        category = ExpenseCategory.objects.create(name='maintenance')
+        for i in range(5):
+            customer = Customer.objects.create(name=f'Customer {i}', phone=str(i), email=f'c{i}@example.com')
+            product = Product.objects.create(name=f'Product {i}', sku=f'P-{i}', stock=5, rental_price=Decimal('5.00'))
+            cls.rental = RentalAgreement.objects.create(
+                customer=customer, start_date=today, expected_return_date=today + timedelta(days=3)
+            )
+            RentalItem.objects.create(rental=cls.rental, product=product, quantity=1, rental_price=Decimal('5.00'))
+            Expense.objects.create(
+                date=today, amount=Decimal('1.00'), category=category, description='Service',
+                product=product, created_by=cls.staff
+            )
+
+    def setUp(self):
+        middleware.store.clear()
+        self.client.force_login(self.staff)
+
+    def test_records_metrics_per_url_name(self):
+        response = self.client.get(reverse('product_list'))
+
+        figures = middleware.store.summary()['product_list']
+        self.assertEqual(figures['count'], 1)
+        self.assertGreater(figures['queries']['p50'], 0)
+        self.assertGreater(figures['template_ms']['p50'], 0)
+        self.assertEqual(figures['bytes']['p50'], len(response.content))
+
+    def test_budgeted_views_stay_within_budget(self):
+        customer = self.rental.customer
+        for url in (
+            reverse('dashboard'), reverse('product_list'), reverse('customer_list'),
+            reverse('customer_detail', args=[customer.pk]), reverse('rental_list'),
+            reverse('rental_detail', args=[self.rental.pk]), reverse('expense_list'),
+            reverse('invoice_list'), reverse('customer_activity_report'),
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(set(middleware.store.summary()), set(settings.VIEW_QUERY_BUDGETS))
+
+    @override_settings(VIEW_QUERY_BUDGETS={'customer_list': 1})
+    def test_exceeding_a_budget_fails_in_strict_mode(self):
+        with self.assertRaisesMessage(middleware.QueryBudgetExceeded, 'over its budget of 1'):
+            self.client.get(reverse('customer_list'))
+
+    @override_settings(VIEW_QUERY_BUDGETS={'customer_list': 1}, QUERY_BUDGET_STRICT=False)
+    def test_exceeding_a_budget_is_logged(self):
+        with self.assertLogs('rental.middleware', 'WARNING') as logs:
+            self.assertEqual(self.client.get(reverse('customer_list')).status_code, 200)
+        self.assertIn('query_budget_exceeded url_name=customer_list', logs.output[0])
+
+    def test_metrics_endpoint_is_staff_only(self):
+        self.client.get(reverse('product_list'))
+        response = self.client.get(reverse('request_metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('product_list', response.json()['views'])
+
+        self.client.force_login(User.objects.create_user('clerk', password='x'))
+        self.assertEqual(self.client.get(reverse('request_metrics')).status_code, 302)
+
+    async def test_async_requests_are_measured(self):
+        await self.async_client.aforce_login(self.staff)
+        response = await self.async_client.get(reverse('customer_list'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(middleware.store.summary()['customer_list']['queries']['p50'], 0)
+
+    def test_templates_are_timed_without_patching_django(self):
+        from django.template.backends.django import Template
+
+        self.client.get(reverse('customer_list'))
+        self.assertGreater(middleware.store.summary()['customer_list']['template_ms']['p50'], 0)
+        self.assertEqual(Template.render.__qualname__, 'Template.render')
+        self.assertIsInstance(get_template('rental/customer_list.html'), middleware.MeasuredTemplate)
+        # Outside a request there is nothing to add the time to
+        html = render_to_string('rental/includes/export_buttons.html', {'export_csv_url': '?export=csv'})
+        self.assertIn('?export=csv', html)
+
+    @override_settings(REQUEST_METRICS_ENABLED=False)
+    def test_disabled_middleware_is_dropped(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            middleware.RequestMetricsMiddleware(lambda request: HttpResponse())
@@ -6,27 +6,20 @@ from django.contrib import messages
 from django.db import transaction
 from django.db.models import Sum, Count, Q, F
 from django.utils import timezone
-from django.http import HttpResponse, JsonResponse
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from io import BytesIO
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from decimal import Decimal
 from django.db.models.functions import Coalesce
 from django.db.models import DecimalField
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from dateutil.relativedelta import relativedelta
 from django.views.decorators.http import require_GET
-from barcode.writer import ImageWriter
-from django.core.files import File
 from django.core.exceptions import ValidationError
-import barcode
-from barcode.writer import ImageWriter
 from .models import (
     Product, Customer, RentalAgreement, RentalItem, 
-    Payment, Invoice, Expense, ExpenseCategory, RevenueReport
+    Payment, Invoice, Expense, ExpenseCategory, RevenueReport, RESERVING_STATUSES
 )
 from .forms import (
     ProductForm, CustomerForm, RentalAgreementForm, 
@@ -34,6 +27,14 @@ from .forms import (
     ExpenseForm, ExpenseCategoryForm, ProductImportForm, ProductStockForm
 )
 from .forms import ReturnRentalForm 
+from .exports import ExportMixin
+from .importers import import_status
+from .pagination import KeysetPaginationMixin
+from .reports import revenue_report_context, revenue_series
+from . import barcodes, documents, fuzzy, invoice_export, middleware, pdf_cache
+from .stats import DashboardStats
+from .tasks import dispatch, generate_product_barcodes
+from .utilization import compute_utilization, default_window, utilization_by_product
 from django.utils.crypto import get_random_string
 from datetime import timedelta, datetime
 
@@ -42,140 +43,10 @@ class DashboardView(LoginRequiredMixin, TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        today = timezone.localdate()
-        current_year = today.year
-        current_month = today.month
-        last_month = today - relativedelta(months=1)
-        last_month_year = last_month.year
-        last_month_month = last_month.month
-
-        # Basic stats (unchanged)
-        context['total_products'] = Product.objects.count()
-        context['total_customers'] = Customer.objects.count()
-
-        # Product investment (unchanged)
-        owned_products = Product.objects.filter(
-            is_outsourced=False,
-            purchase_price__isnull=False,
-            stock__gt=0
-        )
-        context['product_investment'] = owned_products.aggregate(
-            total_investment=Sum('purchase_price')
-        )['total_investment'] or 0 # Example
-
-        # NEW PAYMENT-BASED REVENUE CALCULATION
-        def get_payment_revenue(year, month):
-            return Payment.objects.filter(
-                payment_date__year=year,
-                payment_date__month=month
-            ).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-
-        current_month_revenue = get_payment_revenue(current_year, current_month)
-        last_month_revenue = get_payment_revenue(last_month_year, last_month_month)
-        
-        # Revenue change calculation (unchanged logic)
-        context['monthly_revenue'] = current_month_revenue
-        context['revenue_change'] = self._calculate_percentage_change(last_month_revenue, current_month_revenue)
-
-        # Expenses (unchanged)
-        def get_expenses(year, month):
-            return Expense.objects.filter(
-                date__year=year,
-                date__month=month
-            ).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-
-        current_month_expenses = get_expenses(current_year, current_month)
-        last_month_expenses = get_expenses(last_month_year, last_month_month)
-        
-        context['monthly_expenses'] = current_month_expenses
-        context['expense_change'] = self._calculate_percentage_change(last_month_expenses, current_month_expenses)
-
-        # Net profit (unchanged logic)
-        net_profit = current_month_revenue - current_month_expenses
-        last_month_profit = (last_month_revenue - last_month_expenses) if last_month_revenue else Decimal('0.00')
-        context['net_profit'] = net_profit
-        context['profit_change'] = self._calculate_percentage_change(last_month_profit, net_profit)
-
-        # Rental stats (unchanged)
-        context.update(self._get_rental_stats(today, last_month))
-        
-        # Recent activity (unchanged)
-        context['recent_rentals'] = RentalAgreement.objects.select_related('customer').order_by('-created_at')[:5]
-        context['recent_expenses'] = Expense.objects.select_related('category').order_by('-date')[:5]
-
-        # Customer growth (unchanged)
-        context['customer_growth'] = self._calculate_customer_growth(today, last_month)
-
-        # Chart Data (now uses Payment model)
-        context.update(self._get_chart_data(today))
-        
+        # Figures, charts and recent activity come from one cached snapshot
+        context.update(DashboardStats.get())
         return context
 
-    # Helper Methods
-    def _calculate_percentage_change(self, old, new):
-        if not old or old == 0:
-            return 100 if new > 0 else 0
-        return round(((new - old) / old) * 100, 1)
-
-    def _get_rental_stats(self, today, last_month):
-        stats = {}
-        
-        # Active rentals
-        stats['active_rentals'] = RentalAgreement.objects.filter(status='active').count()
-        last_month_active = RentalAgreement.objects.filter(
-            status='active',
-            start_date__lte=last_month,
-            expected_return_date__gte=last_month
-        ).count()
-        stats['active_rentals_change'] = self._calculate_percentage_change(last_month_active, stats['active_rentals'])
-
-        # Overdue rentals
-        overdue = RentalAgreement.objects.filter(
-            status='active',
-            expected_return_date__lt=today
-        ).annotate(days_overdue=today - F('expected_return_date'))
-        stats['overdue_rentals'] = overdue.count()
-        stats['overdue_rentals_list'] = overdue.order_by('expected_return_date')[:5]
-        
-        last_month_overdue = RentalAgreement.objects.filter(
-            status='active',
-            expected_return_date__lt=last_month
-        ).count()
-        stats['overdue_rentals_change'] = self._calculate_percentage_change(last_month_overdue, stats['overdue_rentals'])
-        
-        return stats
-
-    def _calculate_customer_growth(self, today, last_month):
-        current = Customer.objects.count()
-        last_month_count = Customer.objects.filter(join_date__lte=last_month).count()
-        return self._calculate_percentage_change(last_month_count, current)
-
-    def _get_chart_data(self, today):
-        # Revenue chart (now payment-based)
-        revenue_data, revenue_labels = [], []
-        for i in range(5, -1, -1):  # Last 6 months
-            month = today - relativedelta(months=i)
-            revenue = Payment.objects.filter(
-                payment_date__year=month.year,
-                payment_date__month=month.month
-            ).aggregate(total=Sum('amount'))['total'] or 0
-            revenue_data.append(float(revenue))
-            revenue_labels.append(month.strftime('%b %Y'))
-        
-        # Status chart (unchanged)
-        status_data = RentalAgreement.objects.aggregate(
-            active=Count('id', filter=Q(status='active')),
-            returned=Count('id', filter=Q(status='returned')),
-            overdue=Count('id', filter=Q(status='overdue')),
-            cancelled=Count('id', filter=Q(status='cancelled'))
-        )
-        
-        return {
-            'revenue_data': revenue_data,
-            'revenue_labels': revenue_labels,
-            'status_data': [status_data[k] for k in ['active', 'returned', 'overdue', 'cancelled']]
-        }
-
 # Expense Views
 class ExpenseCategoryListView(LoginRequiredMixin, ListView):
     model = ExpenseCategory
@@ -199,14 +70,22 @@ class ExpenseCategoryDeleteView(LoginRequiredMixin, DeleteView):
     template_name = 'expenses/expense_category_confirm_delete.html'
     success_url = reverse_lazy('expense_category_list')
 
-class ExpenseListView(LoginRequiredMixin, ListView):
+class ExpenseListView(LoginRequiredMixin, ExportMixin, KeysetPaginationMixin, ListView):
     model = Expense
     template_name = 'expenses/expense_list.html'
     context_object_name = 'expenses'
     paginate_by = 20
+    keyset_ordering = ('-date', '-pk')
+    export_columns = (
+        ('Date', 'date'),
+        ('Category', 'category__name'),
+        ('Description', 'description'),
+        ('Product', 'product__name'),
+        ('Amount', 'amount'),
+    )
 
     def get_queryset(self):
-        queryset = super().get_queryset()
+        queryset = super().get_queryset().select_related('category', 'product')
         
         start_date = self.request.GET.get('start_date')
         end_date = self.request.GET.get('end_date')
@@ -307,21 +186,37 @@ class PaymentCreateView(LoginRequiredMixin, CreateView):
         return super().form_valid(form)
 
 # Product Views
-class ProductListView(LoginRequiredMixin, ListView):
+class ProductListView(LoginRequiredMixin, ExportMixin, KeysetPaginationMixin, ListView):
     model = Product
     ordering = ['-created_at'] 
     template_name = 'rental/product_list.html'
     context_object_name = 'products'
     paginate_by = 20
+    keyset_ordering = ('-created_at', '-pk')
+    export_columns = (
+        ('SKU', 'sku'),
+        ('Name', 'name'),
+        ('Stock', 'stock'),
+        ('Available', 'available_units'),
+        ('Rental price', 'rental_price'),
+        ('Purchase price', 'purchase_price'),
+        ('Condition', 'current_condition'),
+        ('Rentable', 'is_rentable'),
+        ('Outsourced', 'is_outsourced'),
+        ('Purchase year', 'purchase_year'),
+    )
+
+    def get_keyset_ordering(self):
+        # Best matches first while searching
+        if self.request.GET.get('q', '').strip():
+            return ('search_rank', 'pk')
+        return self.keyset_ordering
 
     def get_queryset(self):
-        queryset = super().get_queryset()
-        search = self.request.GET.get('q')
+        queryset = super().get_queryset().with_availability()
+        search = self.request.GET.get('q', '').strip()
         if search:
-            queryset = queryset.filter(
-                Q(name__icontains=search) | 
-                Q(sku__icontains=search) |
-                Q(description__icontains=search))
+            queryset = queryset.search(search)
         return queryset
 
 class ProductCreateView(LoginRequiredMixin, CreateView):
@@ -370,18 +265,26 @@ class ProductDetailView(LoginRequiredMixin, DetailView):
 class ProductImportView(LoginRequiredMixin, FormView):
     template_name = 'rental/product_import.html'
     form_class = ProductImportForm
-    success_url = reverse_lazy('product_list')
 
     def form_valid(self, form):
-        created_count, errors = form.process_import()
-        if errors:
-            for error_msg in errors:
-                messages.error(self.request, error_msg)
-            messages.warning(self.request, f"Import completed with {created_count} products created but some errors occurred.")
-            return self.form_invalid(form)
-        else:
-            messages.success(self.request, f"{created_count} products imported successfully!")
-            return super().form_valid(form)
+        # The rows are imported by a Celery task; the status page follows its progress
+        return redirect('product_import_status', job_id=form.start_import())
+
+class ProductImportStatusView(LoginRequiredMixin, TemplateView):
+    template_name = 'rental/product_import_status.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        status = import_status(kwargs['job_id'])
+        if status is None:
+            raise Http404("No such import, or it finished too long ago")
+        rows_total = status.get('rows_total')
+        context.update({
+            'status': status,
+            'running': status['state'] in ('queued', 'running'),
+            'percent': round(status['rows_done'] * 100 / rows_total) if rows_total else 0,
+        })
+        return context
 
 class ProductStockView(LoginRequiredMixin, UpdateView):
     model = Product
@@ -395,23 +298,36 @@ class ProductStockView(LoginRequiredMixin, UpdateView):
         return response
 
 # Customer Views
-class CustomerListView(ListView):
+class CustomerListView(LoginRequiredMixin, ExportMixin, KeysetPaginationMixin, ListView):
     model = Customer
     template_name = 'rental/customer_list.html'
     context_object_name = 'customers'
     paginate_by = 20
+    keyset_ordering = ('name', 'pk')
+    approximate_count_limit = 1000
+    export_columns = (
+        ('Name', 'name'),
+        ('Company', 'company'),
+        ('Phone', 'phone'),
+        ('Email', 'email'),
+        ('Address', 'address'),
+        ('Tax ID', 'tax_id'),
+        ('Discount rate', 'discount_rate'),
+        ('Joined', 'join_date'),
+    )
+
+    def get_keyset_ordering(self):
+        # Best matches first while searching
+        if self.request.GET.get('search', '').strip():
+            return ('search_rank', 'pk')
+        return self.keyset_ordering
 
     def get_queryset(self):
         queryset = super().get_queryset()
         search_query = self.request.GET.get('search', '').strip()
         
         if search_query:
-            queryset = queryset.filter(
-                Q(name__icontains=search_query) |
-                Q(email__icontains=search_query) |
-                Q(phone__icontains=search_query) |
-                Q(company__icontains=search_query)
-            )
+            queryset = queryset.search(search_query)
         return queryset.order_by('name')
 
     def get_context_data(self, **kwargs):
@@ -438,13 +354,17 @@ class CustomerDetailView(LoginRequiredMixin, DetailView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         rentals = RentalAgreement.objects.filter(customer=self.object)
-        context['total_spent'] = rentals.aggregate(total=Sum('invoice__total_amount'))['total'] or 0
-        context['completed_rentals'] = rentals.filter(status='returned').count()
-        context['active_rentals'] = rentals.filter(status='active').count()
+        # Querysets are lazy: the template counts them, so a cached statistics fragment skips these queries
+        context['total_rentals'] = rentals
+        context['total_spent'] = rentals.order_by().values('customer').annotate(
+            total=Sum('invoice__total_amount')
+        ).values_list('total', flat=True)
+        context['completed_rentals'] = rentals.filter(status='returned')
+        context['active_rentals'] = rentals.filter(status='active')
         context['overdue_rentals'] = rentals.filter(
-            status='active',
+            status__in=RESERVING_STATUSES,
             expected_return_date__lt=timezone.now().date()
-        ).count()
+        )
         context['recent_activity'] = rentals.order_by('-start_date')[:5]
         return context
 
@@ -473,19 +393,35 @@ class CustomerRentalHistoryView(LoginRequiredMixin, ListView):
         context['completed_rentals'] = rentals.filter(status='returned').count()
         context['active_rentals'] = rentals.filter(status='active').count()
         context['overdue_rentals'] = rentals.filter(
-            status='active',
+            status__in=RESERVING_STATUSES,
             expected_return_date__lt=timezone.now().date()
         ).count()
         context['recent_activity'] = rentals.order_by('-start_date')[:5]
         return context
 
 # Rental Agreement Views
-class RentalListView(LoginRequiredMixin, ListView):
+class RentalListView(LoginRequiredMixin, ExportMixin, KeysetPaginationMixin, ListView):
     model = RentalAgreement
     template_name = 'rental/rental_list.html'
     context_object_name = 'rentals'
     paginate_by = 20
     ordering = ['-created_at']
+    keyset_ordering = ('-created_at', '-pk')
+    approximate_count_limit = 1000
+    export_columns = (
+        ('Agreement', 'pk'),
+        ('Customer', 'customer__name'),
+        ('Start date', 'start_date'),
+        ('Expected return', 'expected_return_date'),
+        ('Returned', 'actual_return_date'),
+        ('Status', 'status'),
+        ('Subtotal', 'subtotal'),
+        ('Discount', 'discount'),
+        ('VAT', 'vat'),
+        ('Total', 'total'),
+        ('Paid', 'paid_amount'),
+        ('Balance due', 'balance_due'),
+    )
 
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -497,7 +433,7 @@ class RentalListView(LoginRequiredMixin, ListView):
         if customer_search:
             queryset = queryset.filter(customer__name__icontains=customer_search)
         
-        return queryset
+        return queryset.select_related('customer')
 
 class CreateRentalAgreementView(CreateView):
     model = RentalAgreement
@@ -562,8 +498,8 @@ class CreateRentalAgreementView(CreateView):
                         item.rental = self.object  # <-- Here is the fix (use correct FK field)
                         item.save()
 
-                # Update totals and save rental agreement again if needed
-                self.object.update_totals()
+                # Item saves have applied their totals in the database
+                self.object.refresh_from_db(fields=RentalAgreement.TOTALS_FIELDS)
 
                 # Create invoice
                 Invoice.objects.create(
@@ -626,9 +562,6 @@ class UpdateRentalAgreementView(LoginRequiredMixin, UpdateView):
                     payment.save()
                     messages.success(self.request, f'Payment of ${payment.amount:.2f} processed successfully!')
 
-                self.object.update_totals()
-                self.object.save()
-
                 messages.success(self.request, 'Rental agreement updated successfully!')
                 return redirect('rental_detail', pk=self.object.pk)
                 
@@ -641,10 +574,19 @@ class RentalDetailView(LoginRequiredMixin, DetailView):
     template_name = 'rental/rental_detail.html'
     context_object_name = 'rental'
 
+    def get_queryset(self):
+        # The customer and invoice versions key the page's cached fragments
+        return super().get_queryset().select_related('customer', 'invoice')
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        # Lazy: only queried when the payments fragment isn't cached
         context['payments'] = self.object.payments.all().order_by('-payment_date')
         context['invoice'] = getattr(self.object, 'invoice', None)
+        # Keys the details fragment: editing one of these products re-renders it, other products don't
+        context['item_products'] = Product.objects.filter(rental_items__rental=self.object).only(
+            'pk', 'updated_at'
+        ).distinct().order_by('pk')
         return context
     
 from django.views import View
@@ -724,7 +666,7 @@ class ReturnRentalView(LoginRequiredMixin, View):
 
     def get(self, request, pk):
         rental = self.get_rental(pk)
-        if rental.status != 'active':
+        if rental.status not in RESERVING_STATUSES:
             messages.warning(request, f"Rental #{rental.id} is already {rental.get_status_display().lower()}.")
             return redirect('rental_detail', pk=rental.pk)
 
@@ -786,20 +728,20 @@ class ReturnRentalView(LoginRequiredMixin, View):
                 'issue_date': return_date,
                 'due_date': return_date,
                 'total_amount': actual_total,
-                'paid_amount': amount_collected,
-                'payment_status': 'paid' if amount_collected >= actual_total else 'partial'
+                'paid_amount': rental.paid_amount,
+                'payment_status': 'paid' if rental.paid_amount >= actual_total else 'partial'
             }
         )
         if not created:
+            # paid_amount is kept current by Payment.save()
             Invoice.objects.filter(pk=invoice.pk).update(
                 issue_date=return_date,
                 due_date=return_date,
                 total_amount=actual_total,
-                paid_amount=F('paid_amount') + amount_collected,
+                updated_at=timezone.now(),
             )
             invoice.refresh_from_db()
             invoice.update_payment_status()
-            invoice.save()
 
     def update_product_stocks(self, items):
         for item in items:
@@ -809,7 +751,7 @@ class ReturnRentalView(LoginRequiredMixin, View):
 
     def post(self, request, pk):
         rental = self.get_rental(pk)
-        if rental.status != 'active':
+        if rental.status not in RESERVING_STATUSES:
             messages.warning(request, f"Rental #{rental.id} is already {rental.get_status_display().lower()}.")
             return redirect('rental_detail', pk=rental.pk)
 
@@ -844,25 +786,9 @@ def process_rental_return(request, rental_id):
                 with transaction.atomic():
                     # Update rental details
                     return_date = form.cleaned_data['return_date']
+                    # Saving a new actual_return_date re-prices the agreement for the days it was out
                     rental.actual_return_date = return_date
                     
-                    # Calculate actual rental days
-                    actual_rental_days = (return_date - rental.start_date).days + 1
-                    
-                    # Calculate new totals based on actual days
-                    daily_rate = rental.subtotal / rental.rental_days if rental.rental_days > 0 else 0
-                    base_amount = daily_rate * actual_rental_days
-                    discount_amount = base_amount * (rental.discount / 100)
-                    subtotal = base_amount - discount_amount
-                    vat_amount = subtotal * 0.05 if rental.apply_vat else 0
-                    total = subtotal + vat_amount
-                    
-                    # Update rental financials
-                    rental.subtotal = base_amount
-                    rental.vat = vat_amount
-                    rental.total = total
-                    rental.balance_due = max(0, total - rental.advance_payment)
-                    
                     # Update status based on return date
                     if return_date > rental.expected_return_date:
                         rental.status = 'overdue'
@@ -881,15 +807,14 @@ def process_rental_return(request, rental_id):
                     # Process payment if any amount was collected
                     amount_collected = form.cleaned_data['amount_to_collect']
                     if amount_collected > 0:
-                        payment = Payment.objects.create(
-                            rental=rental,
+                        # Payment.save() applies the amount to the agreement and invoice totals
+                        Payment.objects.create(
+                            rental_agreement=rental,
                             amount=amount_collected,
                             payment_method=form.cleaned_data['payment_method'],
                             payment_date=timezone.now().date(),
                             notes=f"Payment collected during return on {return_date}"
                         )
-                        rental.balance_due = max(0, rental.total - rental.advance_payment - amount_collected)
-                        rental.save()
                     
                     messages.success(request, f"Rental #{rental.id} has been successfully returned.")
                     return redirect('rental_detail', rental_id=rental.id)
@@ -976,14 +901,10 @@ class ReturnRentalItemView(LoginRequiredMixin, UpdateView):
 
     def form_valid(self, form):
         rental_item = form.save(commit=False)
-        rental_item.is_returned = True
         rental_item.save()
-        
-        rental_item.agreement.update_totals()
-        rental_item.agreement.save()
 
         messages.success(self.request, f'{rental_item.product.name} returned successfully!')
-        return redirect('rental_detail', pk=rental_item.agreement.pk)
+        return redirect('rental_detail', pk=rental_item.rental_id)
 
 class ProcessPaymentView(LoginRequiredMixin, CreateView):
     model = Payment
@@ -1014,18 +935,11 @@ class ProcessPaymentView(LoginRequiredMixin, CreateView):
         payment.processed_by = self.request.user
         
         with transaction.atomic():
+            # Payment.save() applies the amount to the agreement and invoice totals
             payment.save()
-            
-            # Update rental agreement - allow overpayment
-            self.rental.advance_payment = F('advance_payment') + payment.amount
-            self.rental.balance_due = F('total') - F('advance_payment')
-            self.rental.save()
-            
-            # Update invoice if exists
-            if hasattr(self.rental, 'invoice'):
-                invoice = self.rental.invoice
-                invoice.paid_amount = F('paid_amount') + payment.amount
-                invoice.save()
+            RentalAgreement.objects.filter(pk=self.rental.pk).update(
+                advance_payment=F('advance_payment') + payment.amount, updated_at=timezone.now()
+            )
 
         messages.success(
             self.request,
@@ -1046,193 +960,84 @@ class InvoiceDetailView(LoginRequiredMixin, DetailView):
 
 def generate_invoice_pdf(request, pk):
     rental = get_object_or_404(RentalAgreement, pk=pk)
-    invoice, created = Invoice.objects.get_or_create(rental_agreement=rental)
-    
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="invoice_{invoice.invoice_number}.pdf"'
-    
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    styles = getSampleStyleSheet()
-    
-    elements = []
-    
-    elements.append(Paragraph(f"Invoice for Rental Agreement #{rental.id}", styles['h1']))
-    elements.append(Spacer(1, 12))
-    elements.append(Paragraph(f"Invoice Number: {invoice.invoice_number}", styles['Normal']))
-    elements.append(Paragraph(f"Customer: {rental.customer.name}", styles['Normal']))
-    elements.append(Paragraph(f"Issue Date: {invoice.created_at.strftime('%Y-%m-%d')}", styles['Normal']))
-    elements.append(Paragraph(f"Due Date: {invoice.due_date.strftime('%Y-%m-%d')}", styles['Normal']))
-    elements.append(Spacer(1, 24))
-
-    data = [['Product', 'Quantity', 'Daily Price', 'Item Total']]
-    for item in rental.items.all():
-        data.append([
-            item.product.name,
-            str(item.quantity),
-            f"${item.rental_price:.2f}",
-            f"${item.total_price:.2f}"
-        ])
-    
-    table_style = TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('BOX', (0, 0), (-1, -1), 1, colors.black),
-    ])
-    
-    item_table = Table(data)
-    item_table.setStyle(table_style)
-    elements.append(item_table)
-    elements.append(Spacer(1, 12))
-
-    elements.append(Paragraph(f"Subtotal: ${rental.subtotal:.2f}", styles['Normal']))
-    elements.append(Paragraph(f"Discount ({rental.discount}%): -${(rental.subtotal * rental.discount / 100):.2f}", styles['Normal']))
-    if rental.apply_vat:
-        elements.append(Paragraph(f"VAT (5%): ${rental.vat:.2f}", styles['Normal']))
-    elements.append(Paragraph(f"<b>Total: ${rental.total:.2f}</b>", styles['Normal']))
-    elements.append(Paragraph(f"Advance Payment: ${rental.advance_payment:.2f}", styles['Normal']))
-    elements.append(Paragraph(f"<b>Balance Due: ${rental.balance_due:.2f}</b>", styles['Normal']))
-    elements.append(Spacer(1, 24))
-
-    doc.build(elements)
-    pdf = buffer.getvalue()
-    buffer.close()
-    response.write(pdf)
-    return response
+    invoice, created = Invoice.objects.get_or_create(
+        rental_agreement=rental,
+        defaults={
+            'invoice_number': f"INV-{rental.id:05d}",
+            'due_date': rental.expected_return_date,
+            'total_amount': rental.total,
+            'paid_amount': rental.paid_amount,
+        }
+    )
+    if created:
+        invoice.update_payment_status()
+    return pdf_cache.serve(request, 'invoice', rental.pk, f"invoice_{invoice.invoice_number}.pdf")
 
 def generate_agreement_pdf(request, pk):
-    rental = get_object_or_404(RentalAgreement, pk=pk)
-    
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="rental_agreement_{pk}.pdf"'
-    
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    styles = getSampleStyleSheet()
-    
-    elements = []
-    
-    elements.append(Paragraph("Rental Agreement", styles['Heading1']))
-    elements.append(Spacer(1, 12))
-    
-    details = [
-        ["Agreement #:", str(rental.id)],
-        ["Customer:", rental.customer.name],
-        ["Start Date:", rental.start_date.strftime('%Y-%m-%d')],
-        ["Expected Return:", rental.expected_return_date.strftime('%Y-%m-%d') if rental.expected_return_date else "N/A"],
-        ["Status:", rental.get_status_display()],
-    ]
-    
-    details_table = Table(details, colWidths=[100, 300])
-    details_table.setStyle(TableStyle([
-        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 5),
-    ]))
-    elements.append(details_table)
-    elements.append(Spacer(1, 20))
-    
-    items_data = [["Product", "Qty", "Daily Price", "Days", "Total"]]
-    for item in rental.items.all():
-        items_data.append([
-            item.product.name,
-            str(item.quantity),
-            f"${item.rental_price:.2f}",
-            str(rental.rental_days),
-            f"${item.total_price:.2f}"
-        ])
-    
-    items_table = Table(items_data)
-    items_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-    ]))
-    elements.append(items_table)
-    elements.append(Spacer(1, 20))
-    
-    summary = [
-        ["Subtotal:", f"${rental.subtotal:.2f}"],
-        [f"Discount ({rental.discount}%):", f"-${(rental.subtotal * rental.discount / 100):.2f}"],
-    ]
-    
-    if rental.apply_vat:
-        summary.append([f"VAT (5%):", f"${rental.vat:.2f}"])
-    
-    summary.extend([
-        ["Total:", f"${rental.total:.2f}"],
-        ["Advance Payment:", f"${rental.advance_payment:.2f}"],
-        ["Balance Due:", f"${rental.balance_due:.2f}"],
-    ])
-    
-    summary_table = Table(summary, colWidths=[200, 200])
-    summary_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
-        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 12),
-    ]))
-    elements.append(summary_table)
-    
-    doc.build(elements)
-    pdf = buffer.getvalue()
-    buffer.close()
-    response.write(pdf)
+    return pdf_cache.serve(request, 'agreement', pk, f"rental_agreement_{pk}.pdf")
+
+@login_required
+def payment_receipt_pdf(request, pk):
+    payment = get_object_or_404(Payment.objects.select_related('rental_agreement__customer'), pk=pk)
+    response = HttpResponse(documents.receipt_pdf(payment), content_type='application/pdf')
+    response['Content-Disposition'] = f'inline; filename="receipt_{payment.receipt_number or payment.pk}.pdf"'
+    return response
+
+@login_required
+def customer_statement_pdf(request, pk):
+    customer = get_object_or_404(Customer, pk=pk)
+    today = timezone.now().date()
+    response = HttpResponse(documents.statement_pdf(customer, today), content_type='application/pdf')
+    response['Content-Disposition'] = f'attachment; filename="statement_{customer.pk}_{today:%Y%m%d}.pdf"'
     return response
 
 def generate_barcodes(request):
     if request.method == 'GET':
-        products_without_barcodes = Product.objects.filter(barcode__isnull=True).exclude(sku__exact='')
-        
-        if not products_without_barcodes.exists():
-            messages.info(request, "All products already have barcodes or no SKU available!")
+        count = Product.objects.exclude(sku='').count()
+        if not count:
+            messages.info(request, "No products with a SKU to generate barcodes for!")
             return redirect('product_list')
-            
-        barcode_type = 'code128'
-        
-        generated_count = 0
-        failed_count = 0
 
-        with transaction.atomic():
-            for product in products_without_barcodes:
-                try:
-                    if not product.sku or len(product.sku) < 2:
-                        messages.warning(request, f"Skipped barcode for {product.name} (SKU: '{product.sku}') - SKU is invalid for barcode generation.")
-                        failed_count += 1
-                        continue
-
-                    code = barcode.get_barcode_class(barcode_type)(product.sku, writer=ImageWriter())
-                    buffer = BytesIO()
-                    code.write(buffer)
-                    
-                    filename = f"barcodes/{product.sku}_{barcode_type}.png"
-                    product.barcode.save(filename, File(buffer), save=True)
-                    generated_count += 1
-                    
-                except Exception as e:
-                    messages.error(request, f"Failed to generate barcode for {product.name} (SKU: {product.sku}): {str(e)}")
-                    failed_count += 1
-        
-        if generated_count > 0:
-            messages.success(request, f"Successfully generated barcodes for {generated_count} products.")
-        if failed_count > 0:
-            messages.info(request, f"Failed to generate barcodes for {failed_count} products.")
-        
+        # Images are rendered lazily by product_barcode anyway; this only pre-warms the cache
+        if dispatch(generate_product_barcodes) is None:
+            messages.warning(request, "Could not queue barcode generation. Run 'manage.py warm_barcodes' instead.")
+        else:
+            messages.success(request, f"Barcode generation queued for {count} products.")
         return redirect('product_list')
-        
+
     return HttpResponse("Method not allowed", status=405)
 
+
+@require_GET
+@login_required
+def product_barcode(request, sku, fmt):
+    """Barcode image for a product's SKU, rendered on first request and served from the disk cache after"""
+    symbology = request.GET.get('symbology', barcodes.DEFAULT_SYMBOLOGY)
+    if fmt not in barcodes.FORMATS or symbology not in barcodes.SYMBOLOGIES:
+        raise Http404("Unsupported barcode format")
+    # Only catalogue SKUs, so arbitrary URLs can't fill the disk cache
+    if not Product.objects.filter(sku=sku).exists():
+        raise Http404("No product with this SKU")
+    try:
+        path = barcodes.get_or_render(sku, symbology, fmt)
+    except barcodes.InvalidBarcode as e:
+        raise Http404(str(e))
+    response = FileResponse(open(path, 'rb'), content_type=barcodes.FORMATS[fmt][0])
+    # Images only depend on the SKU and symbology in the URL; private, as the view needs a login
+    response['Cache-Control'] = 'private, max-age=86400'
+    return response
+
 class BarcodeScanView(LoginRequiredMixin, TemplateView):
     template_name = 'rental/barcode_scan.html'
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        sku = self.request.GET.get('sku', '').strip()
+        if sku:
+            context['sku'] = sku
+            context['product'] = Product.objects.with_availability().filter(sku=sku).first()
+        return context
+
 from django.db.models import (
     Count, Sum, F, DecimalField, Case, When, Value
 )
@@ -1240,67 +1045,90 @@ from django.db.models.functions import Coalesce, Cast
 from django.db.models import OuterRef, Subquery, IntegerField, DecimalField, F, Sum, Count, Case, When, Value
 
 
-class ProductUtilizationReportView(ListView):
+class ProductUtilizationReportView(LoginRequiredMixin, ExportMixin, ListView):
     template_name = 'rental/reports/product_utilization.html'
     context_object_name = 'products'
     model = Product
+    paginate_by = 25
+    export_filename = 'product_performance'
+    # Utilisation is computed per page, so the download has the all-time figures
+    export_columns = (
+        ('SKU', 'sku'),
+        ('Name', 'name'),
+        ('Rentals', 'rental_count'),
+        ('Available', 'available_units'),
+        ('Rental revenue', 'rental_revenue'),
+        ('Expenses', 'expenses_total'),
+        ('Net profit', 'net_profit'),
+    )
+
+    # ?sort= keys mapped to the annotations they order by
+    SORT_FIELDS = {
+        'name': 'name',
+        'sku': 'sku',
+        'rentals': 'rental_count',
+        'available': 'available_units',
+        'revenue': 'rental_revenue',
+        'expenses': 'expenses_total',
+        'profit': 'net_profit',
+    }
+    default_sort = '-profit'
 
-    def get_queryset(self):
-        queryset = super().get_queryset().annotate(
-            rental_count=Count('rental_items'),
-
-            # Sum revenue without rental_days multiplier here
-            annotated_revenue=Coalesce(
-                Sum(
-                    F('rental_items__quantity') * 
-                    F('rental_items__rental_price')
-                ),
-                Decimal('0.00'),
-                output_field=DecimalField(max_digits=12, decimal_places=2)
-            ),
+    def get_sort(self):
+        sort = self.request.GET.get('sort', self.default_sort)
+        if sort.lstrip('-') not in self.SORT_FIELDS:
+            return self.default_sort
+        return sort
 
-            annotated_expenses=Coalesce(
-                Sum('expenses__amount'),
-                Decimal('0.00'),
-                output_field=DecimalField(max_digits=12, decimal_places=2)
-            ),
+    def get_ordering(self):
+        sort = self.get_sort()
+        prefix = '-' if sort.startswith('-') else ''
+        return [prefix + self.SORT_FIELDS[sort.lstrip('-')], 'pk']
 
-            utilization_percentage=Case(
-                When(stock=0, then=Value(0, output_field=DecimalField(max_digits=5, decimal_places=2))),
-                default=Cast(Count('rental_items'), output_field=DecimalField()) * 100 / Cast(F('stock'), output_field=DecimalField()),
-                output_field=DecimalField(max_digits=5, decimal_places=2)
-            )
-        )
-        return queryset
+    def get_queryset(self):
+        queryset = Product.objects.with_availability().with_performance()
+        return queryset.order_by(*self.get_ordering())
+
+    def get_window(self):
+        start, end = default_window()
+        try:
+            if self.request.GET.get('start_date'):
+                start = date.fromisoformat(self.request.GET['start_date'])
+            if self.request.GET.get('end_date'):
+                end = date.fromisoformat(self.request.GET['end_date'])
+        except ValueError:
+            messages.error(self.request, "Invalid date range, showing the last 12 months.")
+            start, end = default_window()
+        if start > end:
+            start, end = end, start
+        return start, end
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        start, end = self.get_window()
 
-        # Calculate rental days per RentalAgreement (or fallback to 1 if no days)
-        # We calculate actual revenue multiplying rental_price * quantity * rental_days in Python here.
-        products = []
+        # Time-weighted utilisation for the products on this page only
+        page_products = Product.objects.filter(pk__in=[product.pk for product in context['products']])
+        utilization = utilization_by_product(start, end, page_products)
         for product in context['products']:
-            # Aggregate revenue manually multiplying rental_days
-            revenue = Decimal('0.00')
-            for item in product.rental_items.all():
-                rental_days = (item.rental.expected_return_date - item.rental.start_date).days
-                rental_days = rental_days if rental_days > 0 else 1
-                revenue += item.rental_price * item.quantity * Decimal(rental_days)
-
-            expenses = getattr(product, 'annotated_expenses', Decimal('0.00'))
-            rental_count = getattr(product, 'rental_count', 0)
-
-            product.template_revenue = revenue
-            product.template_expenses = expenses
-            product.template_net_profit = revenue - expenses
-            product.template_utilization = getattr(product, 'utilization_percentage', Decimal('0.00'))
+            product.utilization = utilization[product.pk]['utilization']
 
-            products.append(product)
+        by_condition = compute_utilization(start, end, group_by='condition')
+        conditions = dict(Product.CONDITION_CHOICES)
+        for row in by_condition['rows']:
+            row['label'] = conditions.get(row['key'], row['key'])
 
-        context['products'] = products
+        context.update({
+            'sort': self.get_sort(),
+            'start_date': start,
+            'end_date': end,
+            'utilization_by_condition': by_condition,
+            'month_labels': json.dumps([month.strftime('%b %Y') for month in by_condition['months']]),
+            'monthly_utilization': json.dumps([round(value, 1) for value in by_condition['overall_monthly']]),
+        })
         return context
     
-from django.db.models import Max
+from django.db.models import Max, Min
 import json
 from django.db.models import Sum, F, ExpressionWrapper, DecimalField
 from django.contrib.auth.mixins import LoginRequiredMixin
@@ -1311,25 +1139,36 @@ class MonthlyRevenueDetailView(View):
     def get(self, request):
         year = request.GET.get('year')
         month = request.GET.get('month')
-
-        payments = Payment.objects.all()
+        try:
+            year_number = int(year) if year else None
+            month_number = int(month) if month else None
+            if year_number is not None:
+                date(year_number, month_number or 1, 1)
+            elif month_number is not None and not 1 <= month_number <= 12:
+                raise ValueError
+        except ValueError:
+            return HttpResponse("Year and month must be numbers, month 1-12", status=400)
 
         if year:
-            payments = payments.filter(payment_date__year=year)
-        if month:
-            payments = payments.filter(payment_date__month=month)
-
-        # Monthly totals (used for table and chart)
-        monthly_totals = (
-            payments
-            .annotate(month=TruncMonth('payment_date'))
-            .values('month')
-            .annotate(total=Sum('amount'))
-            .order_by('month')
-        )
-
-        total_collected = payments.aggregate(total=Sum('amount'))['total'] or 0
-        num_months = monthly_totals.count() or 1
+            start_date, end_date = date(year_number, 1, 1), date(year_number, 12, 31)
+            if month:
+                start_date = date(year_number, month_number, 1)
+                end_date = start_date + relativedelta(months=1) - timedelta(days=1)
+        else:
+            bounds = Payment.objects.aggregate(first=Min('payment_date'), last=Max('payment_date'))
+            today = timezone.now().date()
+            start_date, end_date = bounds['first'] or today, bounds['last'] or today
+
+        # Monthly totals (used for table and chart), one grouped query
+        monthly_totals = [
+            {'month': row['start'], 'total': row['total_revenue']}
+            for row in revenue_series(start_date, end_date, 'monthly')
+            if not month or row['start'].month == month_number
+        ]
+
+        total_collected = sum((row['total'] for row in monthly_totals), Decimal('0.00'))
+        # Averaged over the months with payments, as before the series was zero-filled
+        num_months = sum(1 for row in monthly_totals if row['total']) or 1
         average_collected = total_collected / num_months
 
         years = Payment.objects.dates('payment_date', 'year', order='DESC')
@@ -1344,12 +1183,20 @@ class MonthlyRevenueDetailView(View):
             'months': range(1, 13),
         }
         return render(request, 'rental/reports/monthly_revenue_detail.html', context)
-class CustomerActivityReportView(TemplateView):
+class CustomerActivityReportView(LoginRequiredMixin, ExportMixin, TemplateView):
     template_name = 'rental/reports/customer_activity.html'
+    export_filename = 'customer_activity'
+    export_columns = (
+        ('Customer', 'name'),
+        ('Company', 'company'),
+        ('Phone', 'phone'),
+        ('Rentals', 'calculated_rental_count'),
+        ('Active rentals', 'calculated_active_rentals'),
+        ('Total spent', 'calculated_total_spent'),
+        ('Last rental', 'last_rental_date'),
+    )
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        
+    def get_queryset(self):
         # Get search query from request
         search_query = self.request.GET.get('search', '').strip()
         
@@ -1358,14 +1205,10 @@ class CustomerActivityReportView(TemplateView):
         
         # Apply search filter if provided
         if search_query:
-            customers = customers.filter(
-                Q(name__icontains=search_query) |
-                Q(phone__icontains=search_query) |
-                Q(company__icontains=search_query)
-            )
+            customers = customers.search(search_query)
         
         # Annotate with activity data
-        customers = customers.annotate(
+        return customers.annotate(
             calculated_rental_count=Count('rentals'),
             calculated_total_spent=Coalesce(
                 Sum('rentals__total', output_field=DecimalField(max_digits=12, decimal_places=2)),
@@ -1377,7 +1220,12 @@ class CustomerActivityReportView(TemplateView):
                 distinct=True
             ),
             last_rental_date=Max('rentals__start_date')
-        ).order_by('-calculated_total_spent')
+        ).order_by('-calculated_total_spent', 'pk')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        search_query = self.request.GET.get('search', '').strip()
+        customers = self.get_queryset()
         
         # Prepare data for template
         customers_with_data = []
@@ -1407,18 +1255,22 @@ class CustomerActivityReportView(TemplateView):
         })
         return context
 
-class ExpenseReportView(LoginRequiredMixin, TemplateView):
+class ExpenseReportView(LoginRequiredMixin, ExportMixin, TemplateView):
     template_name = 'rental/reports/expense_report.html'
+    export_columns = ExpenseListView.export_columns
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        
+    def get_queryset(self):
         start_date = self.request.GET.get('start_date')
         end_date = self.request.GET.get('end_date')
         
         expenses = Expense.objects.all()
         if start_date and end_date:
             expenses = expenses.filter(date__range=[start_date, end_date])
+        return expenses.order_by('-date', '-pk')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        expenses = self.get_queryset()
         
         by_category = expenses.values('category__name').annotate(
             total=Sum('amount')
@@ -1451,15 +1303,43 @@ def customer_detail_api(request, pk):
     except Customer.DoesNotExist:
         return JsonResponse({'error': 'Customer not found'}, status=404)
 
+@require_GET
+@login_required
+def lookup_api(request, kind):
+    """Closest customers or products to ?q=, tolerating typos, for autocomplete"""
+    if kind not in fuzzy.LOOKUP_FIELDS:
+        return JsonResponse({'error': 'Unknown lookup'}, status=404)
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), 50)
+    except ValueError:
+        return JsonResponse({'error': 'limit must be a number'}, status=400)
+    query = request.GET.get('q', '').strip()
+    return JsonResponse({'results': fuzzy.lookup(kind, query, limit) if query else []})
+
+@require_GET
+@staff_member_required
+def request_metrics(request):
+    """Rolling p50/p95 query counts, SQL, template and total time per URL name in this worker"""
+    return JsonResponse({'window': settings.REQUEST_METRICS_WINDOW, 'views': middleware.store.summary()})
+
 @require_GET
 def product_detail_api(request, pk):
     try:
-        product = Product.objects.get(pk=pk)
+        today = timezone.localdate()
+        try:
+            start = date.fromisoformat(request.GET.get('start') or today.isoformat())
+            end = date.fromisoformat(request.GET.get('end') or start.isoformat())
+        except ValueError:
+            return JsonResponse({'error': 'Dates must be YYYY-MM-DD'}, status=400)
+        if end < start:
+            return JsonResponse({'error': 'End date is before start date'}, status=400)
+
+        product = Product.objects.with_availability(start, end).get(pk=pk)
         data = {
             'name': product.name,
             'sku': product.sku,
             'stock': product.stock,
-            'available_stock': product.available_stock,
+            'available_stock': product.available_units,
             'rental_price': float(product.rental_price),
             'is_outsourced': product.is_outsourced,
             'purchase_year': product.purchase_year,
@@ -1468,40 +1348,34 @@ def product_detail_api(request, pk):
     except Product.DoesNotExist:
         return JsonResponse({'error': 'Product not found'}, status=404)
 
-from django.conf import settings
-import os
-from django.template.loader import get_template
-from xhtml2pdf import pisa
-from django.http import HttpResponse, Http404
-
-def render_to_pdf(template_src, context_dict={}):
-    template = get_template(template_src)
-    html = template.render(context_dict)
-    result = BytesIO()
-    pdf = pisa.pisaDocument(BytesIO(html.encode("UTF-8")), result)
-    if not pdf.err:
-        return result.getvalue()
-    return None
-
-def invoice_pdf_view(request, invoice_id):
+@require_GET
+@login_required
+def invoice_export_zip(request):
+    """Every letterhead invoice matching ?start_date=&end_date=&status= as one streamed ZIP"""
     try:
-        invoice = Invoice.objects.select_related('rental_agreement__customer').prefetch_related('rental_agreement__items__product').get(pk=invoice_id)
-    except Invoice.DoesNotExist:
-        raise Http404("Invoice not found")
-
-    company_logo_path = os.path.join(settings.BASE_DIR, 'static', 'images', 'company_logo.png')
-    context = {
-        'invoice': invoice,
-        'company_logo_path': company_logo_path,
-    }
+        start_date = date.fromisoformat(request.GET['start_date']) if request.GET.get('start_date') else None
+        end_date = date.fromisoformat(request.GET['end_date']) if request.GET.get('end_date') else None
+    except ValueError:
+        return HttpResponse("Dates must be YYYY-MM-DD", status=400)
+    status = request.GET.get('status')
+    if status and status not in dict(Invoice.PAYMENT_STATUS_CHOICES):
+        return HttpResponse("Unknown payment status", status=400)
+
+    invoices = invoice_export.invoice_queryset(start_date, end_date, status)
+    response = StreamingHttpResponse(
+        invoice_export.stream_zip(invoices, workers=settings.INVOICE_EXPORT_WORKERS),
+        content_type='application/zip'
+    )
+    label = '_'.join(str(part) for part in (start_date, end_date, status) if part) or 'all'
+    response['Content-Disposition'] = f'attachment; filename="invoices_{label}.zip"'
+    return response
 
-    pdf_data = render_to_pdf('invoice_letterpad.html', context)
-    if pdf_data:
-        response = HttpResponse(pdf_data, content_type='application/pdf')
-        response['Content-Disposition'] = f'inline; filename="invoice_{invoice.invoice_number}.pdf"'
-        return response
-    else:
-        return HttpResponse("Failed to generate PDF", status=500)
+def invoice_pdf_view(request, invoice_id):
+    invoice = get_object_or_404(Invoice, pk=invoice_id)
+    return pdf_cache.serve(
+        request, 'letterpad', invoice.rental_agreement_id,
+        f"invoice_{invoice.invoice_number}.pdf", disposition='inline'
+    )
     
 class RevenueReportView(LoginRequiredMixin, TemplateView):
     template_name = 'rental/revenue_report.html'
@@ -1524,59 +1398,7 @@ class RevenueReportView(LoginRequiredMixin, TemplateView):
         if isinstance(end_date, str):
             end_date = timezone.datetime.strptime(end_date, '%Y-%m-%d').date()
         
-        report_data = []
-        if period == 'daily':
-            date_range = [start_date + timedelta(days=x) for x in range((end_date - start_date).days + 1)]
-            for date in date_range:
-                payments = Payment.objects.filter(payment_date=date)
-                rental_revenue = payments.filter(
-                    rental_agreement__isnull=False
-                ).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-                
-                report_data.append({
-                    'period': date.strftime('%Y-%m-%d'),
-                    'rental_revenue': rental_revenue,
-                    'total_revenue': rental_revenue,
-                })
-        
-        elif period == 'monthly':
-            current_date = start_date.replace(day=1)
-            while current_date <= end_date:
-                next_month = current_date + relativedelta(months=1)
-                month_end = min(next_month - timedelta(days=1), end_date)
-                
-                report = RevenueReport.objects.filter(
-                    month=current_date.month,
-                    year=current_date.year
-                ).first()
-                
-                if report:
-                    report_data.append({
-                        'period': current_date.strftime('%Y-%m'),
-                        'rental_revenue': report.rental_income,
-                        'total_revenue': report.total_income,
-                    })
-                current_date = next_month
-        
-        # Calculate totals
-        totals = {
-            'rental': sum(item['rental_revenue'] for item in report_data),
-            'total': sum(item['total_revenue'] for item in report_data),
-        }
-        
-        # Prepare chart data
-        labels = [item['period'] for item in report_data]
-        rental_data = [float(item['rental_revenue']) for item in report_data]
-        
-        context.update({
-            'period': period,
-            'start_date': start_date,
-            'end_date': end_date,
-            'report_data': report_data,
-            'totals': totals,
-            'labels': labels,
-            'rental_data': rental_data,
-        })
+        context.update(revenue_report_context(start_date, end_date, period))
         return context
     
 from django.views.generic.edit import DeleteView
@@ -1,10 +1,19 @@
-﻿import json
+﻿import os
 import sys
 
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "axeglobal.settings")
+django.setup()
+
+from rental.fixtures import DumpSyntaxError, iter_objects, open_dump
+
+path = sys.argv[1] if len(sys.argv) > 1 else "products_final.json"
 try:
-    with open("products_final.json", encoding="utf-8-sig") as f:
-        json.load(f)
-    print("✓ VALID JSON")
-except Exception as e:
+    # Streams the file, so large dumps are checked in constant memory
+    with open_dump(path) as f:
+        count = sum(1 for _ in iter_objects(f))
+    print(f"✓ VALID JSON ({count} objects)")
+except (OSError, UnicodeDecodeError, DumpSyntaxError) as e:
     print(f"❌ INVALID JSON: {e}")
     sys.exit(1)